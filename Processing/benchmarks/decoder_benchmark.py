@@ -0,0 +1,70 @@
+"""
+Compares the compiled telemetry decoders with the per-field decoding loop they replaced.
+Their equivalence with the bit string reference is checked by tests/test_ccsds.py.
+Run from the Processing folder: python -m benchmarks.decoder_benchmark (or python benchmarks/decoder_benchmark.py)
+"""
+import os
+import sys
+import timeit
+
+if not __package__:
+  # Run as a script, config.py and its relative paths are in the Processing folder
+  PROCESSING_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  sys.path.insert(0, PROCESSING_FOLDER)
+  os.chdir(PROCESSING_FOLDER)
+
+from config import TELEMETRY_MESSAGE_STRUCTURE
+from modules.ccsds import *
+from modules.decoders import compile_telemetry_decoders
+
+ITERATIONS = 100000
+
+def per_field_bitstring(packet_data, structure):
+  # Decoding loop used before the compiled decoders, on the bit string returned by the old parser
+  new_telemetry = {}
+  start = 0
+  for data_type, data_value in structure:
+    end = start + 32
+    if data_type == "float":
+      new_telemetry[data_value] = bitstring_to_float(packet_data[start:end])
+    elif data_type == "int":
+      new_telemetry[data_value] = bitstring_to_int(packet_data[start:end])
+    start = end
+  return new_telemetry
+
+def per_field_bytes(packet_data, structure):
+  # The same loop on the memoryview returned by parse_ccsds_packet
+  new_telemetry = {}
+  start = 0
+  for data_type, data_value in structure:
+    end = start + 4
+    if data_type == "float":
+      new_telemetry[data_value] = binary_to_float(packet_data[start:end])
+    elif data_type == "int":
+      new_telemetry[data_value] = binary_to_int(packet_data[start:end])
+    start = end
+  return new_telemetry
+
+def main():
+  decoders = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)
+  for name, structure in TELEMETRY_MESSAGE_STRUCTURE.items():
+    message = ",".join("56.9496" if data_type == "float" else "7" for data_type, field in structure)
+    packet = convert_message_to_ccsds(100, 1, message)
+    bitstring_data = parse_ccsds_packet_bitstring(packet)[3]
+    bytes_data = parse_ccsds_packet(bytes(packet))[3]
+    decoder = decoders[name]
+
+    results = {
+      "per field (bit string)": timeit.timeit(lambda: per_field_bitstring(bitstring_data, structure), number=ITERATIONS),
+      "per field (bytes)": timeit.timeit(lambda: per_field_bytes(bytes_data, structure), number=ITERATIONS),
+      "compiled decoder": timeit.timeit(lambda: decoder.decode(bytes_data), number=ITERATIONS),
+    }
+
+    print(f"{name} ({len(structure)} fields, {ITERATIONS} packets)")
+    baseline = results["per field (bit string)"]
+    for method, seconds in results.items():
+      print(f"  {method:<24} {seconds / ITERATIONS * 1e6:8.3f} us/packet  {baseline / seconds:6.1f}x")
+    print()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,384 @@
+"""
+Microbenchmarks of the packet codec and the processor hot path, using synthetic packets for every APID.
+Reports packets per second, per-call latency percentiles and memory allocated per call (tracemalloc),
+and saves the results as JSON so runs can be compared.
+The routing benchmarks measure the latency from the received messages queue to the YAMCS sender queue with the stages in their own threads.
+The UDP benchmarks receive bursts of datagrams over localhost, their calls are bursts instead of packets.
+Run from the Processing folder: python -m benchmarks.suite [--iterations N] [--output FILE] [--compare FILE] (or python benchmarks/suite.py)
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import queue
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+if not __package__:
+  # Run as a script, config.py and its relative paths are in the Processing folder
+  PROCESSING_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  sys.path.insert(0, PROCESSING_FOLDER)
+  os.chdir(PROCESSING_FOLDER)
+
+from tabulate import tabulate
+
+from config import *
+from modules.batched_socket import BatchedReceiver
+from modules.calculations import calculate_flight_computer_extra_telemetry
+from modules.ccsds import *
+from modules.decoders import compile_telemetry_decoders
+from modules.heartbeat import is_heartbeat
+from modules.lanes import PACKET_LANES
+from modules.latency import LatencyHistogram, LatencyTracer
+from modules.processor import PacketProcessor
+from modules.rotator import Rotator
+from modules.xtce import XtceSchema
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+
+# Message structures of the APIDs with a layout in config.py
+APID_TYPE_STRUCTURES = {
+  "pfc_essential": "pfc",
+  "bfc_essential": "bfc",
+  "rotator_position": "rotator",
+}
+# Packet ids of each vehicle start at these values, the telecommand APID of a packet id is found from them
+PACKETID_VEHICLES = {
+  1000: "pfc",
+  2000: "bfc",
+  3000: "rotator",
+}
+
+class BenchmarkConnection:
+  """
+  Holds the queues and latency tracer of the connection manager used by the packet processor, without opening any sockets.
+  Telecommands are collected in a queue instead of the transceiver outboxes.
+  """
+  def __init__(self) -> None:
+    self.latency = LatencyTracer(PACKET_LANES)
+    self.received_messages = queue.Queue()
+    self.sendable_to_yamcs_messages = queue.Queue()
+    self.scheduled_telecommands = queue.Queue()
+
+  def schedule_telecommand(self, packet) -> None:
+    self.scheduled_telecommands.put(packet)
+
+# SYNTHETIC PACKETS
+def create_telemetry_packets(packet_builder: PacketBuilder, decoders: dict, xtce=None) -> dict:
+  """
+  Creates one telemetry packet for every APID in APID_TO_TYPE, with its layout from config.py or the XTCE mission database.
+  APIDs without a known layout get 8 float values.
+  """
+  packets = {}
+  for apid, packet_type in APID_TO_TYPE.items():
+    structure = APID_TYPE_STRUCTURES.get(packet_type)
+    container = xtce.get_container(apid) if xtce is not None else None
+    if structure is not None:
+      values = decoders[structure].record._make(float(index + 1) if field_type == "float" else index + 1 for index, (field_type, field) in enumerate(TELEMETRY_MESSAGE_STRUCTURE[structure]))
+    elif container is not None:
+      values = container.empty()
+    else:
+      values = tuple(float(index + 1) for index in range(8))
+    packets[f"{apid} {packet_type}"] = packet_builder.build_telemetry(apid, values)
+  return packets
+
+def create_telecommand_packets() -> dict:
+  """
+  Creates a telecommand for every packet id in PACKETID_TO_TYPE, encoded like YAMCS sends them (big endian packet id).
+  Every command gets 3 float arguments, which is the longest argument list of the rotator commands.
+  """
+  packets = {}
+  for packet_id, packet_type in PACKETID_TO_TYPE.items():
+    vehicle = PACKETID_VEHICLES[packet_id // 1000 * 1000]
+    data = pack(">Hfff", packet_id, 56.95, 24.1, 10.0)
+    header = PRIMARY_HEADER.pack(0x1000 | TELECOMMAND_APID[vehicle], 0xC000, len(data) - 1)
+    packets[f"{packet_id} {packet_type}"] = header + data
+  return packets
+
+# MEASUREMENT
+def percentile(sorted_values: list, fraction: float) -> float:
+  return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def measure(call, iterations: int, prepare=None) -> dict:
+  """
+  Measures a function without arguments.
+  Throughput is measured in a tight loop, latency with a timer around every call, and allocations with tracemalloc in a third, shorter loop.
+  prepare is called with the number of calls before every loop.
+  """
+  # Warm up caches and lazily compiled structs
+  if prepare is not None:
+    prepare(min(iterations, 1000))
+  for _ in range(min(iterations, 1000)):
+    call()
+
+  # Throughput
+  if prepare is not None:
+    prepare(iterations)
+  start = time.perf_counter()
+  for _ in range(iterations):
+    call()
+  total_seconds = time.perf_counter() - start
+
+  # Latency
+  if prepare is not None:
+    prepare(iterations)
+  latencies = [0] * iterations
+  clock = time.perf_counter_ns
+  for index in range(iterations):
+    call_start = clock()
+    call()
+    latencies[index] = clock() - call_start
+  latencies.sort()
+
+  # Allocations, the peak shows memory allocated during the call, the retained memory shows what is left after it
+  allocation_iterations = max(1, iterations // 10)
+  if prepare is not None:
+    prepare(allocation_iterations)
+  tracemalloc.start()
+  peak_bytes = 0
+  retained_start = tracemalloc.get_traced_memory()[0]
+  for _ in range(allocation_iterations):
+    current_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    call()
+    peak_bytes += tracemalloc.get_traced_memory()[1] - current_bytes
+  retained_bytes = tracemalloc.get_traced_memory()[0] - retained_start
+  tracemalloc.stop()
+
+  return {
+    "iterations": iterations,
+    "packets_per_second": round(iterations / total_seconds, 1),
+    "latency_us": {
+      "mean": round(sum(latencies) / iterations / 1000, 3),
+      "p50": round(percentile(latencies, 0.5) / 1000, 3),
+      "p90": round(percentile(latencies, 0.9) / 1000, 3),
+      "p99": round(percentile(latencies, 0.99) / 1000, 3),
+      "p99.9": round(percentile(latencies, 0.999) / 1000, 3),
+      "max": round(latencies[-1] / 1000, 3),
+    },
+    "peak_bytes_per_call": round(peak_bytes / allocation_iterations, 1),
+    "retained_bytes_per_call": round(retained_bytes / allocation_iterations, 1),
+  }
+
+# BENCHMARKS
+def benchmark_codec(packets: dict, iterations: int) -> dict:
+  results = {}
+
+  # All packets in turn, like a real mix of traffic
+  packet_cycle = itertools.cycle(packets.values())
+  results["parse_ccsds_packet"] = measure(lambda: parse_ccsds_packet(next(packet_cycle)), iterations)
+
+  messages = itertools.cycle([",".join(str(float(index + 1)) for index in range(8)), "56.9496,24.1052,1000.5,990.25,7,0,-80.5,9.5", "12.5,45.25,10.0"])
+  results["convert_message_to_ccsds"] = measure(lambda: convert_message_to_ccsds(100, 1, next(messages)), iterations)
+
+  apids = itertools.cycle(APID_TO_TYPE)
+  results["create_primary_header"] = measure(lambda: create_primary_header(next(apids), 1, 32), iterations)
+
+  # Transceiver datagrams are mostly telemetry with a heartbeat every second
+  datagrams = itertools.cycle(list(packets.values()) + [b"Heartbeat,-40"])
+  results["is_heartbeat"] = measure(lambda: is_heartbeat(next(datagrams)), iterations)
+
+  # Every packet records up to five latencies
+  histogram = LatencyHistogram()
+  latencies = itertools.cycle([0.00005, 0.0003, 0.002, 0.015, 0.25])
+  results["LatencyHistogram.record"] = measure(lambda: histogram.record(next(latencies)), iterations)
+  return results
+
+def benchmark_calculations(decoders: dict, iterations: int) -> dict:
+  old_data = decoders["pfc"].record._make((56.9496, 24.1052, 1000.0, 990.0, 7, 0, -80.0, 9.5))
+  new_data = decoders["pfc"].record._make((56.9501, 24.1060, 1005.0, 994.0, 7, 0, -80.0, 9.5))
+  rotator_data = {"latitude": 56.9, "longitude": 24.1, "altitude": 10.0}
+  structure = CALCULATION_MESSAGE_STRUCTURE["pfc"]
+  return {"calculate_flight_computer_extra_telemetry": measure(lambda: calculate_flight_computer_extra_telemetry(old_data, new_data, rotator_data, 1.0, structure), iterations)}
+
+def benchmark_processor(packets: dict, iterations: int) -> dict:
+  connection = BenchmarkConnection()
+  processor = PacketProcessor(connection, Rotator())
+
+  def drain() -> None:
+    for output_queue in (connection.scheduled_telecommands, connection.sendable_to_yamcs_messages, connection.received_messages):
+      with output_queue.mutex:
+        output_queue.queue.clear()
+        output_queue.unfinished_tasks = 0
+
+  def fill(packet_list: list):
+    def prepare(count: int) -> None:
+      drain()
+      for packet in itertools.islice(itertools.cycle(packet_list), count):
+        connection.received_messages.put((False, "yamcs", packet, time.monotonic()))
+    return prepare
+
+  results = {}
+  # The processor prints every decoded packet, which is part of the hot path, but not needed on the console
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    results["process_packet"] = measure(processor.process_packet, iterations, fill(list(packets.values())))
+    for name, packet in packets.items():
+      results[f"process_packet [{name}]"] = measure(processor.process_packet, max(1, iterations // 10), fill([packet]))
+  drain()
+  return results
+
+def benchmark_routing(packets: dict, iterations: int) -> dict:
+  """
+  Sends one packet at a time from the received messages queue to the YAMCS sender queue, with the processor in its own thread.
+  "direct" is the route table, the processor puts the packet in the YAMCS sender queue.
+  "router hop" adds the stage the processor used to deliver to before: the processed packets queue and a router thread
+  that moves its packets to the YAMCS sender queue.
+  """
+  packet = packets[next(name for name in packets if name.endswith("pfc_essential"))]
+  results = {}
+  for name, router_hop in (("routing [router hop]", True), ("routing [direct]", False)):
+    connection = BenchmarkConnection()
+    processor = PacketProcessor(connection, Rotator())
+    stop_event = threading.Event()
+    stages = [processor.process_packet]
+    
+    if router_hop:
+      processed_packets = queue.Queue()
+      processor.routes["yamcs"] = processed_packets.put
+      def send_processed_data() -> None:
+        try:
+          routed_packet = processed_packets.get(timeout=1)
+        except queue.Empty:
+          return
+        connection.sendable_to_yamcs_messages.put(routed_packet)
+        processed_packets.task_done()
+      stages.append(send_processed_data)
+    
+    def run_stage(stage) -> None:
+      while not stop_event.is_set():
+        stage()
+    threads = [threading.Thread(target=run_stage, args=(stage,), daemon=True) for stage in stages]
+    
+    def send_packet() -> None:
+      connection.received_messages.put((False, "yamcs", packet, time.monotonic()))
+      # The calculations packet of the essential telemetry is routed before the packet itself
+      while connection.sendable_to_yamcs_messages.get()[2] is not packet:
+        pass
+    
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+      for thread in threads:
+        thread.start()
+      results[name] = measure(send_packet, iterations)
+      stop_event.set()
+      for thread in threads:
+        thread.join()
+  return results
+
+def benchmark_udp(packets: dict, iterations: int) -> dict:
+  """
+  Sends a burst of UDP_BATCH_SIZE telemetry packets over localhost and receives them, one recvfrom per datagram on a socket
+  with a timeout (how the receivers work without batching) or with the batched receiver.
+  """
+  burst = list(itertools.islice(itertools.cycle(packets.values()), UDP_BATCH_SIZE))
+  results = {}
+  for name, batched in ((f"udp burst of {UDP_BATCH_SIZE} [recvfrom]", False), (f"udp burst of {UDP_BATCH_SIZE} [batched]", True)):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    receiver_socket.bind(("127.0.0.1", 0))
+    address = receiver_socket.getsockname()
+    
+    if batched:
+      receiver = BatchedReceiver(receiver_socket, UDP_BATCH_SIZE)
+      def receive_burst() -> None:
+        received = 0
+        while received < len(burst):
+          received += len(receiver.receive(1))
+    else:
+      receiver_socket.settimeout(1)
+      def receive_burst() -> None:
+        for _ in burst:
+          receiver_socket.recvfrom(4096)
+    
+    def send_and_receive_burst() -> None:
+      for packet in burst:
+        sender.sendto(packet, address)
+      receive_burst()
+    
+    results[name] = measure(send_and_receive_burst, iterations)
+    sender.close()
+    receiver_socket.close()
+  return results
+
+# RESULTS
+def compare_results(results: dict, baseline: dict, threshold: float) -> list:
+  """
+  Returns the benchmarks that are slower than in the baseline by more than the threshold (0.1 is 10%).
+  """
+  table = []
+  regressions = []
+  for name, result in results.items():
+    baseline_result = baseline.get(name)
+    if baseline_result is None:
+      continue
+    ratio = result["packets_per_second"] / baseline_result["packets_per_second"]
+    regression = ratio < 1 - threshold
+    if regression:
+      regressions.append(name)
+    table.append([name, baseline_result["packets_per_second"], result["packets_per_second"], f"{ratio:.2f}x", "REGRESSION" if regression else ""])
+  print(tabulate(table, headers=["Benchmark", "Baseline packets/s", "Packets/s", "Speed", ""], tablefmt="grid", disable_numparse=True))
+  return regressions
+
+def print_results(results: dict) -> None:
+  table = []
+  for name, result in results.items():
+    latency = result["latency_us"]
+    table.append([name, f"{result['packets_per_second']:.0f}", latency["p50"], latency["p99"], latency["p99.9"], latency["max"], result["peak_bytes_per_call"], result["retained_bytes_per_call"]])
+  print(tabulate(table, headers=["Benchmark", "Packets/s", "p50 us", "p99 us", "p99.9 us", "max us", "Peak B/call", "Retained B/call"], tablefmt="grid", disable_numparse=True))
+
+def main():
+  parser = argparse.ArgumentParser(description="Codec and processor microbenchmarks")
+  parser.add_argument("--iterations", type=int, default=20000, help="calls per benchmark")
+  parser.add_argument("--output", help="JSON file for the results, by default a timestamped file in benchmarks/results")
+  parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+  parser.add_argument("--threshold", type=float, default=0.1, help="slowdown that counts as a regression (0.1 is 10%%)")
+  arguments = parser.parse_args()
+
+  packet_builder = PacketBuilder()
+  decoders = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)
+  try:
+    xtce = XtceSchema(XTCE_FILE, XTCE_CACHE_FILE)
+  except Exception as e:
+    print(f"Error loading the XTCE mission database, its APIDs are not benchmarked: {e}")
+    xtce = None
+  packets = create_telemetry_packets(packet_builder, decoders, xtce)
+  packets.update(create_telecommand_packets())
+  print(f"{len(packets)} synthetic packets, {arguments.iterations} calls per benchmark")
+
+  results = {}
+  results.update(benchmark_codec(packets, arguments.iterations))
+  results.update(benchmark_calculations(decoders, arguments.iterations))
+  results.update(benchmark_processor(packets, arguments.iterations))
+  results.update(benchmark_routing(packets, max(1, arguments.iterations // 10)))
+  results.update(benchmark_udp(packets, max(1, arguments.iterations // 100)))
+  print_results(results)
+
+  output = arguments.output
+  if output is None:
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = os.path.join(RESULTS_FOLDER, time.strftime("%Y-%m-%d_%H-%M-%S") + ".json")
+  with open(output, "w") as file:
+    json.dump({
+      "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+      "python": sys.version,
+      "platform": platform.platform(),
+      "iterations": arguments.iterations,
+      "results": results,
+    }, file, indent=2)
+  print(f"Results saved to {output}")
+
+  if arguments.compare:
+    with open(arguments.compare, "r") as file:
+      baseline = json.load(file)["results"]
+    regressions = compare_results(results, baseline, arguments.threshold)
+    if regressions:
+      print(f"{len(regressions)} benchmarks are slower than the baseline: {', '.join(regressions)}")
+      sys.exit(1)
+
+if __name__ == "__main__":
+  main()
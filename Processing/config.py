@@ -21,6 +21,34 @@ DESCENT_RATE = 5
 # Communication cycle time in seconds
 CYCLE_TIME = 15
 
+# Runtime that runs the ground station tasks: "threads" (a thread for every task) or "asyncio" (one event loop)
+RUNTIME = "threads"
+
+# Intervals in seconds of the periodic tasks, the rotator and map data tasks are woken up by telemetry changes instead
+UPDATE_INTERVALS = {
+  "map": 0.1,
+  "sondehub": 1,
+  "info_tables": 1,
+}
+
+# Capacity in packets and policy of the pipeline queues when they are full (see modules/bounded_queue.py)
+# "block" - the producer waits, "drop_oldest" - the oldest packet is dropped, "never_drop" - the capacity is only reported
+# The received messages have a lane for telecommands, essential telemetry and bulk telemetry (see modules/lanes.py), each with this capacity
+QUEUE_SETTINGS = {
+  "received_messages": (1000, "block"),
+  "sendable_to_yamcs_messages": (1000, "drop_oldest"),
+  "telecommand_outboxes": (100, "never_drop"),
+}
+# Policies of the received messages lanes that differ from the received messages policy
+# Telecommands are never dropped, like in the telecommand outboxes
+LANE_POLICIES = {
+  "command": "never_drop",
+}
+# Log files written for every run (see modules/logging.py), one or both of
+# "csv" - telemetry.csv and telecommand.csv with the time and the packet in hex
+# "binary" - flight.bin with the raw packets and flight.idx with their time and APID index, read by FlightLogReader and log replay
+LOG_FILE_FORMATS = ("csv",)
+
 # CONNECTIONS
 YAMCS_TM_ADDRESS = ('localhost', 10015)
 YAMCS_TC_ADDRESS = ('localhost', 10025)
@@ -28,12 +56,27 @@ TRANSCEIVER_TM_ADDRESS = (str(LOCAL_IP_ADDRESS), 10035)
 TRANSCEIVER_TC_ADDRESS = ('192.168.8.254', 10045)
 SECONDARY_TRANSCEIVER_TM_ADDRESS = (str(LOCAL_IP_ADDRESS), 10055)
 SECONDARY_TRANSCEIVER_TC_ADDRESS = ('192.168.8.253', 10065)
+# Read the transceiver and YAMCS sockets in batches and take the telemetry for YAMCS from its queue in batches (see modules/batched_socket.py)
+# The batch size is the largest number of datagrams read or taken per wakeup. Python has no recvmmsg/sendmmsg, so every datagram
+# is still one recv and one sendto call and is copied out of the receive buffer. The udp burst benchmark in benchmarks/suite.py
+# measured a 64 datagram burst at a p50 of 280-410 us with recvfrom and 215-320 us batched (about 20%, and noisy), so it is off by default.
+UDP_BATCHING = False
+UDP_BATCH_SIZE = 64
+# Telemetry heard by both transceivers is passed on once. Duplicates have the same APID, sequence count and epoch time
+# as a packet received in the last DUPLICATE_WINDOW seconds, at most DUPLICATE_CAPACITY packets are remembered.
+DUPLICATE_WINDOW = 30
+DUPLICATE_CAPACITY = 4096
+# Hold essential telemetry for REORDER_HOLD_TIME seconds and update the calculations in epoch time order (see modules/reorder.py)
+# Late packets are still sent to YAMCS but are left out of the calculations
+REORDER_TELEMETRY = False
+REORDER_HOLD_TIME = 0.5
 
 # Port on which the map server is running
 MAP_SERVER_PORT = 9500
 
 # APID can be from 0 to 2047
 # Telemetry package apids
+# The PFC and BFC packets other than the essential ones have the APIDs of their containers in the XTCE mission database
 APID_TO_TYPE = {
   # Rotator
   50: "rotator_position",
@@ -43,17 +86,18 @@ APID_TO_TYPE = {
   80: "rotator_calculations",
   # PFC
   100: "pfc_essential",
-  101: "pfc_full",
-  102: "pfc_info_error",
-  103: "pfc_format",
-  104: "pfc_ejection",
+  101: "pfc_telecommand_acknowledgment",
+  102: "pfc_system_status",
+  103: "pfc_configuration",
+  104: "pfc_location",
+  105: "pfc_heated_container_status",
   # BFC
   200: "bfc_essential",
-  201: "bfc_full",
-  202: "pfc_info_error",
-  203: "bfc_format",
-  204: "bfc_rwc_mode",
-  205: "bfc_ejection",  
+  1: "bfc_telecommand_acknowledgment",
+  2: "bfc_system_status",
+  3: "bfc_configuration",
+  4: "bfc_location",
+  5: "bfc_rwc",
 }
 
 # All telecommands have the same APID, but have different packet ids
@@ -87,6 +131,16 @@ PACKETID_TO_TYPE = {
   # Non yamcs
   3100: "rotator_angles_request",
 }
+# Telecommands that only the ground station builds, their packet id is sent in little endian byte order as the rotator has always received it.
+# YAMCS encodes the packet id of all other telecommands in big endian byte order (see the XTCE mission database).
+LITTLE_ENDIAN_TELECOMMANDS = ("rotator_angles_request",)
+
+# Yamcs mission database, the decoders compiled from it are cached in the cache file
+XTCE_FILE = "../Yamcs/src/main/yamcs/mdb/xtce.xml"
+XTCE_CACHE_FILE = "cache/xtce.json"
+# Decode the telemetry of APID_TO_TYPE that has no message structure below with its container in the mission database,
+# and serve the latest values on the map server at /telemetry/xtce. The mission database is only loaded when this is on.
+DECODE_XTCE_TELEMETRY = True
 
 # Message structures
 TELEMETRY_MESSAGE_STRUCTURE = {
@@ -114,6 +168,36 @@ TELEMETRY_MESSAGE_STRUCTURE = {
               ("float", "altitude"),]
 }
 
+# Arguments of every telecommand in PACKETID_TO_TYPE, after the packet id
+TELECOMMAND_MESSAGE_STRUCTURE = {
+  # PFC
+  "pfc_complete_data_request": [],
+  "pfc_info_error_request": [],
+  "pfc_format_storage_request": [],
+  "pfc_ejection_request": [],
+  "pfc_servo_reset_request": [],
+  # BFC
+  "bfc_complete_data_request": [],
+  "bfc_info_error_request": [],
+  "bfc_format_storage_request": [],
+  "bfc_rwc_set_mode_request": [("uint8", "mode")],
+  "bfc_ejection_request": [],
+  # Rotator
+  "rotator_set_target_request": [("uint8", "target")],
+  "rotator_auto_tracking_request": [],
+  "rotator_auto_rotator_position_request": [],
+  "rotator_manual_rotator_position_request": [("float", "latitude"),
+                                              ("float", "longitude"),
+                                              ("float", "altitude")],
+  "rotator_manual_angles_request": [("float", "azimuth"),
+                                    ("float", "elevation")],
+  "rotator_manual_target_coordinates_request": [("float", "latitude"),
+                                                ("float", "longitude"),
+                                                ("float", "altitude")],
+  "rotator_angles_request": [("float", "azimuth"),
+                             ("float", "elevation")],
+}
+
 CALCULATION_MESSAGE_STRUCTURE = {
   "pfc": ["gps_vertical_speed",
           "baro_vertical_speed",
@@ -1,11 +1,15 @@
+import argparse
+import asyncio
 import os
 from time import sleep
 
 from config import *
+from modules.async_runtime import AsyncRuntime
 from modules.connection_manager import ConnectionManager
 from modules.logging import Logger
 from modules.map import Map
 from modules.processor import PacketProcessor
+from modules.replay import REPLAY_TARGETS, LogReplayer, read_logged_telemetry
 from modules.rotator import Rotator
 from modules.router import Router
 from modules.sondehub import SondeHubUploader
@@ -13,12 +17,20 @@ from modules.thread_manager import ThreadManager
 from modules.info_tables import InfoTables
 
 def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--runtime", choices=["threads", "asyncio"], default=RUNTIME, help="run the tasks in threads or on one asyncio event loop")
+  parser.add_argument("--replay", metavar="LOG", help="replay the telemetry of a log folder or log file through the threads runtime and report the throughput and latency")
+  parser.add_argument("--replay-speed", type=float, default=1, help="replay speed, 1 is real time and 0 is as fast as possible")
+  parser.add_argument("--replay-target", choices=REPLAY_TARGETS, default="queue", help="put the replayed packets in the received messages or send them to a transceiver port")
+  parser.add_argument("--replay-transceiver", choices=["primary", "secondary"], default="secondary", help="transceiver port of the udp replay target")
+  arguments = parser.parse_args()
+  
   print("RTU High Power Rocketry Team - Ground Station Data Processing Software")
   print()
   
   # Create objects
   try:
-    logger = Logger()
+    logger = Logger(formats=LOG_FILE_FORMATS)
     connection_manager = ConnectionManager(logger)
   except OSError as e:
     print(f"The following error occurred while creating the connection manager: {e}")
@@ -33,11 +45,58 @@ def main():
   map = Map(processor, map_server_port=MAP_SERVER_PORT)
   router = Router(processor, connection_manager, rotator, map, sondehub_uploader)
   info_tables = InfoTables(connection_manager, processor, rotator)
-  thread_manager = ThreadManager(connection_manager, processor, router, sondehub_uploader, map, rotator, info_tables)
   
   print("Setup successful!")
   print()
   
+  if arguments.replay is not None:
+    replayer = LogReplayer(connection_manager, arguments.replay_target, arguments.replay_speed, arguments.replay_transceiver)
+    run_replay(ThreadManager(connection_manager, processor, router, sondehub_uploader, map, rotator, info_tables), replayer, arguments.replay)
+  elif arguments.runtime == "asyncio":
+    run_async(AsyncRuntime(connection_manager, processor, router, sondehub_uploader, map, rotator, info_tables))
+  else:
+    run_threads(ThreadManager(connection_manager, processor, router, sondehub_uploader, map, rotator, info_tables))
+
+def run_async(runtime: AsyncRuntime):
+  print("Starting asyncio runtime...")
+  print()
+  print("TO STOP THE PROGRAM, PRESS CTRL+C OR CLOSE THE CONSOLE!")
+  print()
+  try:
+    asyncio.run(runtime.run())
+  except KeyboardInterrupt:
+    print("Keyboard interrupt detected. Event loop stopped.")
+  # Write the buffered logs
+  runtime.connection_manager.logger.close()
+  print("Exiting...")
+  os.system('pause')
+  os._exit(0)
+
+def run_replay(thread_manager: ThreadManager, replayer: LogReplayer, log_path: str):
+  packets = read_logged_telemetry(log_path)
+  print(f"Replaying {len(packets)} packets from {log_path}...")
+  
+  # Only the pipeline from the received messages to YAMCS runs, nothing is sent to the transceivers, SondeHub or the rotator
+  if replayer.target == "udp":
+    thread_manager.start_receive_from_primary_transceiver_thread()
+    thread_manager.start_receive_from_secondary_transceiver_thread()
+  thread_manager.start_send_to_yamcs_thread()
+  thread_manager.start_packet_processing_thread()
+  
+  try:
+    replayer.replay(packets, thread_manager.stop_event)
+  except KeyboardInterrupt:
+    print("Keyboard interrupt detected. Replay stopped.")
+  replayer.print_report()
+  
+  thread_manager.stop_event.set()
+  for thread in thread_manager.active_threads:
+    thread.join()
+  # Write the buffered logs
+  thread_manager.connection_manager.logger.close()
+  os._exit(0)
+
+def run_threads(thread_manager: ThreadManager):
   # Start threads
   print("Starting threads...", end="")
   # Receive threads
@@ -48,7 +107,6 @@ def main():
   thread_manager.start_send_to_transceiver_thread()
   thread_manager.start_send_heartbeat_to_transceiver_thread()
   thread_manager.start_send_to_yamcs_thread()
-  thread_manager.start_send_processed_data_thread()
   thread_manager.start_send_data_to_map_thread()
   # Processing thread
   thread_manager.start_packet_processing_thread()
@@ -86,6 +144,8 @@ def main():
             # Give the thread a chance to stop.
             thread.join(timeout=0.01)
         print(f"Thread {thread.name} stopped.")
+      # Write the buffered logs
+      thread_manager.connection_manager.logger.close()
       print("All threads stopped. Exiting...")
       os.system('pause')
       os._exit(0)
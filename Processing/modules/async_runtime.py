@@ -0,0 +1,356 @@
+import asyncio
+import time
+from collections import deque
+from threading import Thread
+
+from config import *
+from modules.bounded_queue import check_queue_policy
+from modules.connection_manager import ConnectionManager, HEARTBEAT_MESSAGES, TRANSCEIVER_TIMEOUT, TRANSCEIVERS, TRANSCEIVER_TC_ADDRESSES
+from modules.events import TASK_TOPICS
+from modules.info_tables import InfoTables
+from modules.lanes import PACKET_LANES, get_packet_lane
+from modules.map import Map
+from modules.processor import PacketProcessor
+from modules.rotator import Rotator
+from modules.router import Router
+from modules.sondehub import SondeHubUploader
+
+class StageQueue(asyncio.Queue):
+  """
+  Queue between the stages of the async runtime, with the capacity, policy and statistics of the thread queues.
+  The processor and router put packets with put(), like in the thread queues. This is only done from the event loop, so put never waits:
+  stages that put into a "block" queue wait for space before they take their next packet, which can take the queue over its capacity
+  by the packets of one step. Datagram receivers cannot wait (waiting_producers is False), so a full "block" queue drops their newest
+  packet, like a full socket buffer does in the threaded runtime.
+  """
+  def __init__(self, name: str, capacity: int = 0, policy: str = "block", waiting_producers: bool = True) -> None:
+    check_queue_policy(policy)
+    super().__init__()
+    self.name = name
+    self.capacity = capacity
+    self.policy = policy
+    self.waiting_producers = waiting_producers
+    self.space_available = asyncio.Event()
+    self.space_available.set()
+
+    # Statistics
+    self.high_water_mark = 0
+    self.dropped = 0
+
+  def at_capacity(self) -> bool:
+    return self.policy != "never_drop" and 0 < self.capacity <= self.qsize()
+
+  def put(self, item, block: bool = True, timeout=None) -> None:
+    if self.at_capacity():
+      if self.policy == "drop_oldest":
+        self.get_nowait()
+        self.task_done()
+        self.dropped += 1
+      elif not self.waiting_producers:
+        self.dropped += 1
+        return
+    self.put_nowait(item)
+    self.high_water_mark = max(self.high_water_mark, self.qsize())
+    if self.at_capacity():
+      self.space_available.clear()
+
+  def _get(self):
+    item = super()._get()
+    if not self.at_capacity():
+      self.space_available.set()
+    return item
+
+  async def wait_for_space(self) -> None:
+    await self.space_available.wait()
+
+class LaneStageQueue(StageQueue):
+  """
+  StageQueue with the priority lanes of the thread LaneQueue, get returns the oldest item of the first lane with items.
+  Every lane has the capacity of the queue and the policy of the queue or its policy in lane_policies.
+  """
+  def __init__(self, name: str, lanes: tuple, classify, capacity: int = 0, policy: str = "block", waiting_producers: bool = True, lane_policies: dict = None) -> None:
+    self.lanes = {lane: deque() for lane in lanes}
+    self.classify = classify
+    self.lane_policies = {lane: (lane_policies or {}).get(lane, policy) for lane in lanes}
+    for lane_policy in self.lane_policies.values():
+      check_queue_policy(lane_policy)
+    super().__init__(name, capacity, policy, waiting_producers)
+
+    # Statistics of each lane
+    self.lane_high_water_marks = dict.fromkeys(lanes, 0)
+    self.lane_dropped = dict.fromkeys(lanes, 0)
+
+  def lane_at_capacity(self, lane: str) -> bool:
+    return self.lane_policies[lane] != "never_drop" and 0 < self.capacity <= len(self.lanes[lane])
+
+  def at_capacity(self) -> bool:
+    return any(self.lane_at_capacity(lane) for lane in self.lanes)
+
+  def put(self, item, block: bool = True, timeout=None) -> None:
+    lane = self.classify(item)
+    if self.lane_at_capacity(lane):
+      if self.lane_policies[lane] == "drop_oldest":
+        self.lanes[lane].popleft()
+        self.task_done()
+        self.__count_dropped(lane)
+      elif not self.waiting_producers:
+        self.__count_dropped(lane)
+        return
+    self.put_nowait(item)
+    self.lane_high_water_marks[lane] = max(self.lane_high_water_marks[lane], len(self.lanes[lane]))
+    self.high_water_mark = max(self.high_water_mark, self.qsize())
+    if self.at_capacity():
+      self.space_available.clear()
+
+  def __count_dropped(self, lane: str) -> None:
+    self.dropped += 1
+    self.lane_dropped[lane] += 1
+
+  def qsize(self) -> int:
+    return sum(len(items) for items in self.lanes.values())
+
+  def empty(self) -> bool:
+    return not any(self.lanes.values())
+
+  def _put(self, item) -> None:
+    self.lanes[self.classify(item)].append(item)
+
+  def _get(self):
+    for items in self.lanes.values():
+      if items:
+        item = items.popleft()
+        break
+    if not self.at_capacity():
+      self.space_available.set()
+    return item
+
+def create_stage_queue(name: str, waiting_producers: bool = True) -> StageQueue:
+  capacity, policy = QUEUE_SETTINGS.get(name, (0, "block"))
+  return StageQueue(name, capacity, policy, waiting_producers)
+
+class DatagramReceiver(asyncio.DatagramProtocol):
+  """
+  Passes every received datagram to a callback.
+  """
+  def __init__(self, name: str, callback) -> None:
+    self.name = name
+    self.callback = callback
+
+  def datagram_received(self, data, addr) -> None:
+    try:
+      self.callback(data)
+    except Exception as e:
+      print(f"An error occurred while receiving from {self.name}: {e}")
+
+  def error_received(self, exc) -> None:
+    print(f"An error occurred on the {self.name} socket: {exc}")
+
+class AsyncRuntime:
+  """
+  Runs the ground station on one asyncio event loop instead of a thread for every task.
+  Sockets are asyncio datagram endpoints, stages are connected with asyncio queues, the rotator and map data tasks
+  are woken up by the event bus, and the other periodic tasks run on timers.
+  Tasks that block (map rendering, SondeHub uploads, info tables) run in the default executor, the Flask map server keeps its own thread.
+  """
+  def __init__(self, connection_manager: ConnectionManager, packet_processor: PacketProcessor, router: Router, sondehub_uploader: SondeHubUploader, map: Map, rotator: Rotator, info_tables: InfoTables) -> None:
+    self.connection_manager = connection_manager
+    self.packet_processor = packet_processor
+    self.router = router
+    self.sondehub = sondehub_uploader
+    self.map = map
+    self.rotator = rotator
+    self.info_tables = info_tables
+
+    self.transports = {}
+    self.last_received_times = dict.fromkeys(TRANSCEIVERS, 0.0)
+
+    # Created in run, as they belong to the event loop
+    # asyncio events that wake up the sender of each telecommand outbox
+    self.outbox_events = {}
+    # asyncio events of the tasks woken up by each event bus topic
+    self.topic_events = {}
+
+  async def run(self) -> None:
+    loop = asyncio.get_running_loop()
+
+    # Replace the thread queues with asyncio queues
+    capacity, policy = QUEUE_SETTINGS["received_messages"]
+    self.connection_manager.received_messages = LaneStageQueue("received_messages", PACKET_LANES, get_packet_lane, capacity, policy, waiting_producers=False, lane_policies=LANE_POLICIES)
+    self.connection_manager.sendable_to_yamcs_messages = create_stage_queue("sendable_to_yamcs_messages")
+    self.packet_processor.create_routes()
+    for transceiver in TRANSCEIVERS:
+      self.outbox_events[transceiver] = asyncio.Event()
+
+    # The sockets created by the connection manager are reused as datagram endpoints
+    sockets = {
+      "yamcs_tc": (self.connection_manager.yamcs_tc_socket, self.__receive_from_yamcs),
+      "yamcs_tm": (self.connection_manager.yamcs_tm_socket, None),
+      "primary_tm": (self.connection_manager.transceiver_tm_socket, lambda data: self.__receive_from_transceiver("primary", data)),
+      "primary_tc": (self.connection_manager.transceiver_tc_socket, None),
+      "secondary_tm": (self.connection_manager.secondary_transceiver_tm_socket, lambda data: self.__receive_from_transceiver("secondary", data)),
+      "secondary_tc": (self.connection_manager.secondary_transceiver_tc_socket, None),
+    }
+    for name, (sock, callback) in sockets.items():
+      # Receive timeouts of the threaded runtime are replaced by the transceiver timeout timer
+      sock.settimeout(None)
+      protocol_factory = (lambda name=name, callback=callback: DatagramReceiver(name, callback)) if callback is not None else asyncio.DatagramProtocol
+      self.transports[name], _ = await loop.create_datagram_endpoint(protocol_factory, sock=sock)
+
+    # Event bus topics are published from the event loop and from executor threads
+    self.packet_processor.events.add_listener(lambda topic: loop.call_soon_threadsafe(self.__set_topic_events, topic))
+    self.connection_manager.scheduler.add_listener(lambda link: loop.call_soon_threadsafe(self.outbox_events[link].set))
+    
+    map_server_thread = Thread(target=self.map.run_server, name="Map Server")
+    map_server_thread.daemon = True
+    map_server_thread.start()
+
+    tasks = [
+      self.__process_packets(),
+      self.__send_to_yamcs(),
+      self.__send_heartbeats(),
+      self.__check_transceiver_timeouts(),
+      self.__run_on_events(self.router.send_data_to_map, TASK_TOPICS["map_data"]),
+      self.__run_on_events(self.router.update_rotator_data, TASK_TOPICS["rotator_data"]),
+      self.__run_on_events(self.rotator.control_rotator, TASK_TOPICS["rotator_control"]),
+      self.__run_on_events(self.router.send_rotator_command_to_transceiver, TASK_TOPICS["rotator_command"]),
+      self.__run_periodically(self.map.update_map, UPDATE_INTERVALS["map"], blocking=True),
+      self.__run_periodically(self.router.send_data_to_sondehub, UPDATE_INTERVALS["sondehub"], blocking=True),
+      # Start the info tables only after the other tasks have started
+      self.__run_periodically(self.info_tables.print_info_tables, UPDATE_INTERVALS["info_tables"], blocking=True, delay=1),
+    ]
+    tasks += [self.__send_to_transceiver(transceiver) for transceiver in TRANSCEIVERS]
+
+    try:
+      await asyncio.gather(*tasks)
+    finally:
+      for transport in self.transports.values():
+        transport.close()
+      self.sondehub.close_uploader()
+
+  # RECEIVERS
+  def __receive_from_yamcs(self, data: bytes) -> None:
+    self.connection_manager.received_messages.put((False, "transceiver", data, time.monotonic()))
+
+  def __receive_from_transceiver(self, transceiver: str, data: bytes) -> None:
+    self.last_received_times[transceiver] = time.monotonic()
+    self.connection_manager.handle_transceiver_message(transceiver, data)
+
+  async def __check_transceiver_timeouts(self) -> None:
+    while True:
+      now = time.monotonic()
+      for transceiver in TRANSCEIVERS:
+        if now - self.last_received_times[transceiver] > TRANSCEIVER_TIMEOUT:
+          self.connection_manager.set_transceiver_disconnected(transceiver)
+      await asyncio.sleep(1)
+
+  # STAGES
+  async def __process_packets(self) -> None:
+    received_messages = self.connection_manager.received_messages
+    sendable_to_yamcs_messages = self.connection_manager.sendable_to_yamcs_messages
+    while True:
+      # Backpressure from the YAMCS sender, the processor delivers straight to its queue
+      await sendable_to_yamcs_messages.wait_for_space()
+      # Wait at most until the next held telemetry packet is released
+      wait_time = self.packet_processor.get_reorder_wait_time()
+      try:
+        packet = await asyncio.wait_for(received_messages.get(), wait_time)
+      except asyncio.TimeoutError:
+        self.packet_processor.release_reordered_telemetry()
+        continue
+      self.packet_processor.handle_packet(packet)
+      received_messages.task_done()
+      self.packet_processor.release_reordered_telemetry()
+
+  async def __send_to_yamcs(self) -> None:
+    sendable_to_yamcs_messages = self.connection_manager.sendable_to_yamcs_messages
+    transport = self.transports["yamcs_tm"]
+    batch_size = self.connection_manager.yamcs_batch_size
+    while True:
+      # Packets already waiting in the queue are sent in the same batch and logged with one write
+      packets = [await sendable_to_yamcs_messages.get()]
+      while len(packets) < batch_size and not sendable_to_yamcs_messages.empty():
+        packets.append(sendable_to_yamcs_messages.get_nowait())
+      
+      # Only the packets that were sent are recorded and logged
+      sent_packets = []
+      for packet in packets:
+        try:
+          transport.sendto(packet[2], YAMCS_TM_ADDRESS)
+          sent_packets.append(packet)
+        except Exception as e:
+          print(f"An error occurred while sending to YAMCS: {e}")
+        sendable_to_yamcs_messages.task_done()
+      if sent_packets:
+        self.connection_manager.latency.record_sent(sent_packets)
+        self.connection_manager.logger.log_telemetry_batch([packet[2] for packet in sent_packets])
+
+  async def __send_to_transceiver(self, transceiver: str) -> None:
+    # Waits on a timer until the first command of the outbox is due, parked outboxes wait until the scheduler wakes them up
+    scheduler = self.connection_manager.scheduler
+    outbox_event = self.outbox_events[transceiver]
+    transport = self.transports[f"{transceiver}_tc"]
+    while True:
+      wait_time = scheduler.get_wait_time(transceiver, time.time())
+      if wait_time is None or wait_time > 0:
+        try:
+          await asyncio.wait_for(outbox_event.wait(), wait_time)
+        except asyncio.TimeoutError:
+          pass
+      outbox_event.clear()
+
+      commands = scheduler.take_due_commands(transceiver, time.time())
+      for command in commands:
+        try:
+          self.connection_manager.logger.log_telecommand_data(command.data, transceiver)
+          transport.sendto(command.data, TRANSCEIVER_TC_ADDRESSES[transceiver])
+        except Exception as e:
+          print(f"An error occurred while sending to transceiver: {e}")
+      scheduler.outboxes[transceiver].sent_commands += len(commands)
+
+  async def __send_heartbeats(self) -> None:
+    while True:
+      try:
+        self.transports["primary_tc"].sendto(HEARTBEAT_MESSAGES["primary"], TRANSCEIVER_TC_ADDRESS)
+        await asyncio.sleep(0.05)
+        self.transports["secondary_tc"].sendto(HEARTBEAT_MESSAGES["secondary"], SECONDARY_TRANSCEIVER_TC_ADDRESS)
+      except Exception as e:
+        print(f"An error occurred while sending heartbeat: {e}")
+      await asyncio.sleep(1)
+
+  # EVENTS AND TIMERS
+  def __set_topic_events(self, topic: str) -> None:
+    for event in self.topic_events.get(topic, []):
+      event.set()
+  
+  async def __run_on_events(self, function, topics: list) -> None:
+    """
+    Runs a function every time one of the topics is published, and once at the start.
+    """
+    event = asyncio.Event()
+    event.set()
+    for topic in topics:
+      self.topic_events.setdefault(topic, []).append(event)
+    while True:
+      await event.wait()
+      event.clear()
+      try:
+        function()
+      except Exception as e:
+        print(f"An error occurred in {function.__name__}: {e}")
+  
+  # TIMERS
+  async def __run_periodically(self, function, interval: float, blocking: bool = False, delay: float = 0) -> None:
+    """
+    Runs a function every interval seconds. Blocking functions run in the default executor, so they do not hold up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(delay)
+    while True:
+      try:
+        if blocking:
+          await loop.run_in_executor(None, function)
+        else:
+          function()
+      except Exception as e:
+        print(f"An error occurred in {function.__name__}: {e}")
+      await asyncio.sleep(interval)
@@ -0,0 +1,56 @@
+import select
+import socket
+
+# Largest datagram received, larger datagrams are truncated
+MAX_DATAGRAM_SIZE = 4096
+
+class BatchedReceiver:
+  """
+  Receives the datagrams of a UDP socket in batches.
+  The socket is made non-blocking: a batch waits for the first datagram with select and then reads every datagram that is
+  already in the socket buffer, up to batch_size, into preallocated buffers. Compared with recvfrom on a socket with a timeout,
+  this saves the poll before every read and the allocation of a receive buffer for every datagram, which adds up during
+  bursty downlink and log replay.
+  recvmmsg would read the whole batch in one system call, but it is not available in Python and only exists on Linux,
+  so every datagram is still one recv_into call and is copied out of its buffer. Only used when UDP_BATCHING is on.
+  """
+  def __init__(self, sock: socket.socket, batch_size: int, max_datagram_size: int = MAX_DATAGRAM_SIZE) -> None:
+    self.socket = sock
+    self.socket.setblocking(False)
+    self.batch_size = batch_size
+
+    self.buffer = bytearray(batch_size * max_datagram_size)
+    buffer_view = memoryview(self.buffer)
+    self.datagram_buffers = [buffer_view[index * max_datagram_size:(index + 1) * max_datagram_size] for index in range(batch_size)]
+
+    # Statistics
+    self.batches = 0
+    self.datagrams = 0
+
+  def receive(self, timeout: float) -> list:
+    """
+    Waits up to timeout seconds for datagrams and returns all received datagrams as bytes.
+    Raises socket.timeout if nothing is received, like recvfrom on a socket with a timeout.
+    """
+    readable, _, _ = select.select([self.socket], [], [], timeout)
+    if not readable:
+      raise socket.timeout("timed out")
+    return self.read_available()
+
+  def read_available(self) -> list:
+    """
+    Reads the datagrams in the socket buffer without waiting.
+    """
+    datagrams = []
+    for datagram_buffer in self.datagram_buffers:
+      try:
+        length = self.socket.recv_into(datagram_buffer)
+      except BlockingIOError:
+        break
+      # The buffers are reused by the next batch, so every datagram is copied out
+      datagrams.append(bytes(datagram_buffer[:length]))
+
+    if datagrams:
+      self.batches += 1
+      self.datagrams += len(datagrams)
+    return datagrams
@@ -0,0 +1,120 @@
+import queue
+import time
+from collections import deque
+
+# What a full queue does with a new item
+# "block" - the producer waits up to the block timeout, then the new item is dropped
+# "drop_oldest" - the oldest item is dropped, for telemetry where the newest packets matter most
+# "never_drop" - the capacity is not enforced, for telecommands, the high water mark shows how far it was exceeded
+QUEUE_POLICIES = ("block", "drop_oldest", "never_drop")
+
+def check_queue_policy(policy: str) -> None:
+  if policy not in QUEUE_POLICIES:
+    raise Exception(f"Unknown queue policy: {policy}")
+
+class BoundedQueue(queue.Queue):
+  """
+  Queue between the pipeline stages with a capacity, a policy for when it is full, and depth statistics.
+  A capacity of 0 makes the queue unbounded.
+  """
+  def __init__(self, name: str, capacity: int = 0, policy: str = "block", block_timeout: float = 1) -> None:
+    check_queue_policy(policy)
+    super().__init__(0 if policy == "never_drop" else capacity)
+    self.name = name
+    self.capacity = capacity
+    self.policy = policy
+    # A producer that waits longer than this is stuck (e.g. the stage after the queue stopped), so it drops the item and moves on
+    self.block_timeout = block_timeout
+
+    # Statistics
+    self.high_water_mark = 0
+    self.dropped = 0
+
+  def put(self, item, block: bool = True, timeout: float = None) -> None:
+    if self.policy == "drop_oldest":
+      with self.not_full:
+        if 0 < self.maxsize <= self._qsize():
+          # The dropped item is never taken from the queue, so it is also removed from the unfinished tasks
+          self._get()
+          self.unfinished_tasks -= 1
+          self.dropped += 1
+        self._put(item)
+        self.unfinished_tasks += 1
+        self.not_empty.notify()
+      return
+
+    try:
+      super().put(item, block, self.block_timeout if timeout is None else timeout)
+    except queue.Full:
+      self.dropped += 1
+
+  def _put(self, item) -> None:
+    super()._put(item)
+    if len(self.queue) > self.high_water_mark:
+      self.high_water_mark = len(self.queue)
+
+class LaneQueue(BoundedQueue):
+  """
+  Bounded queue with priority lanes, get returns the oldest item of the first lane with items.
+  classify returns the lane of an item. Every lane has the capacity of the queue and the policy of the queue or its policy in lane_policies,
+  so a full low priority lane never makes the producers of a higher priority lane wait or drop.
+  """
+  def __init__(self, name: str, lanes: tuple, classify, capacity: int = 0, policy: str = "block", block_timeout: float = 1, lane_policies: dict = None) -> None:
+    self.lanes = {lane: deque() for lane in lanes}
+    self.classify = classify
+    self.lane_policies = {lane: (lane_policies or {}).get(lane, policy) for lane in lanes}
+    for lane_policy in self.lane_policies.values():
+      check_queue_policy(lane_policy)
+    # The lanes enforce the capacity, the underlying queue is unbounded
+    super().__init__(name, 0, policy, block_timeout)
+    self.capacity = capacity
+
+    # Statistics of each lane
+    self.lane_high_water_marks = dict.fromkeys(lanes, 0)
+    self.lane_dropped = dict.fromkeys(lanes, 0)
+
+  def put(self, item, block: bool = True, timeout: float = None) -> None:
+    lane = self.classify(item)
+    items = self.lanes[lane]
+    policy = self.lane_policies[lane]
+    with self.not_full:
+      if policy != "never_drop" and 0 < self.capacity <= len(items):
+        if policy == "drop_oldest":
+          items.popleft()
+          self.unfinished_tasks -= 1
+          self.__count_dropped(lane)
+        else:
+          # Wait until the consumer takes an item of this lane
+          deadline = time.monotonic() + (self.block_timeout if timeout is None else timeout)
+          while self.capacity <= len(items):
+            remaining = deadline - time.monotonic()
+            if not block or remaining <= 0:
+              self.__count_dropped(lane)
+              return
+            self.not_full.wait(remaining)
+      items.append(item)
+      self.unfinished_tasks += 1
+      self.lane_high_water_marks[lane] = max(self.lane_high_water_marks[lane], len(items))
+      self.high_water_mark = max(self.high_water_mark, self._qsize())
+      self.not_empty.notify()
+
+  def __count_dropped(self, lane: str) -> None:
+    self.dropped += 1
+    self.lane_dropped[lane] += 1
+
+  def _qsize(self) -> int:
+    return sum(len(items) for items in self.lanes.values())
+
+  def _get(self):
+    # Producers of every lane wait on not_full, so all are woken up to check their own lane
+    self.not_full.notify_all()
+    for items in self.lanes.values():
+      if items:
+        return items.popleft()
+
+def create_queue(name: str, settings: dict) -> BoundedQueue:
+  """
+  Creates a queue with the (capacity, policy) of its name in settings, queues without settings are unbounded.
+  """
+  capacity, policy = settings.get(name, (0, "block"))
+  return BoundedQueue(name, capacity, policy)
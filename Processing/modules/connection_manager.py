@@ -1,10 +1,32 @@
 from binascii import hexlify
-import socket
 import queue
+import socket
 import time
 
 from config import *
+from modules.batched_socket import BatchedReceiver
+from modules.bounded_queue import LaneQueue, create_queue
+from modules.duplicates import DuplicateFilter
+from modules.heartbeat import HeartbeatStatistics, is_heartbeat, parse_heartbeat_rssi
+from modules.lanes import PACKET_LANES, get_packet_lane
+from modules.latency import LatencyTracer
 from modules.logging import Logger
+from modules.scheduler import TelecommandScheduler
+
+# ~ Used as sacrificial character
+HEARTBEAT_MESSAGES = {
+  "primary": "UDP Heartbeat Primary~".encode(),
+  "secondary": "UDP Heartbeat Secondary~".encode(),
+}
+
+# Transceivers are disconnected if nothing is received from them for this many seconds
+TRANSCEIVER_TIMEOUT = 3
+
+TRANSCEIVERS = ("primary", "secondary")
+TRANSCEIVER_TC_ADDRESSES = {
+  "primary": TRANSCEIVER_TC_ADDRESS,
+  "secondary": SECONDARY_TRANSCEIVER_TC_ADDRESS,
+}
 
 class ConnectionManager:
   def __init__(self, logger: Logger) -> None:    
@@ -12,11 +34,9 @@ class ConnectionManager:
     self.logger = logger
     
     # Queues
-    self.sendable_to_transceiver_messages = queue.Queue()
-    self.sendable_to_yamcs_messages = queue.Queue()
-    self.received_messages = queue.Queue()
-    
-    self.sending_to_transceiver = False
+    self.sendable_to_yamcs_messages = create_queue("sendable_to_yamcs_messages", QUEUE_SETTINGS)
+    # Telecommands are processed before essential telemetry, and essential telemetry before bulk telemetry
+    self.received_messages = LaneQueue("received_messages", PACKET_LANES, get_packet_lane, *QUEUE_SETTINGS["received_messages"], lane_policies=LANE_POLICIES)
     
     # UDP sockets (TM - Telemetry, TC - Telecommand)
     # YAMCS sockets
@@ -28,123 +48,166 @@ class ConnectionManager:
     # Transceiver sockets
     self.transceiver_tm_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     self.transceiver_tc_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    self.transceiver_tm_socket.settimeout(3)
+    self.transceiver_tm_socket.settimeout(TRANSCEIVER_TIMEOUT)
     self.transceiver_tm_socket.bind(TRANSCEIVER_TM_ADDRESS)
     self.transceiver_socket_connected = False
     self.transceiver_wifi_rssi = 0
     
     self.secondary_transceiver_tm_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     self.secondary_transceiver_tc_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    self.secondary_transceiver_tm_socket.settimeout(3)
+    self.secondary_transceiver_tm_socket.settimeout(TRANSCEIVER_TIMEOUT)
     self.secondary_transceiver_tm_socket.bind(SECONDARY_TRANSCEIVER_TM_ADDRESS)
     self.secondary_transceiver_socket_connected = False # By default, should be False, set to True for testing
     self.secondary_transceiver_wifi_rssi = 0
+    
+    # Heartbeat interval statistics of each transceiver
+    self.heartbeat_statistics = {transceiver: HeartbeatStatistics() for transceiver in TRANSCEIVERS}
+    
+    # Latencies of the packet stages, from receiving a packet until it is sent to YAMCS
+    self.latency = LatencyTracer(PACKET_LANES)
+    
+    # Packets heard by both transceivers are only queued once
+    self.duplicate_filter = DuplicateFilter(DUPLICATE_WINDOW, DUPLICATE_CAPACITY)
+    
+    # Telecommands wait in the outbox of their transceiver until they are due
+    # Packets are sent 1 second after the start of the communication cycle
+    self.scheduler = TelecommandScheduler(CYCLE_TIME, send_offset=1, capacity=QUEUE_SETTINGS["telecommand_outboxes"][0])
+    self.transceiver_tc_sockets = {"primary": self.transceiver_tc_socket, "secondary": self.secondary_transceiver_tc_socket}
+    for transceiver in TRANSCEIVERS:
+      self.scheduler.add_outbox(transceiver, lambda data, transceiver=transceiver: self.__send_telecommand(transceiver, data), self.is_transceiver_connected(transceiver))
+    
+    # Batched receivers of the threaded runtime, the asyncio runtime reads the sockets itself
+    self.yamcs_batch_size = UDP_BATCH_SIZE if UDP_BATCHING else 1
+    self.receivers = {}
+    if UDP_BATCHING:
+      self.receivers = {
+        "yamcs": BatchedReceiver(self.yamcs_tc_socket, UDP_BATCH_SIZE),
+        "primary": BatchedReceiver(self.transceiver_tm_socket, UDP_BATCH_SIZE),
+        "secondary": BatchedReceiver(self.secondary_transceiver_tm_socket, UDP_BATCH_SIZE),
+      }
   
   def send_heartbeat_to_transceiver(self) -> None:
-    # ~ Used as sacrificial character
-    self.transceiver_tc_socket.sendto("UDP Heartbeat Primary~".encode(), TRANSCEIVER_TC_ADDRESS)
+    self.transceiver_tc_socket.sendto(HEARTBEAT_MESSAGES["primary"], TRANSCEIVER_TC_ADDRESS)
     time.sleep(0.05)
-    self.secondary_transceiver_tc_socket.sendto("UDP Heartbeat Secondary~".encode(), SECONDARY_TRANSCEIVER_TC_ADDRESS)
+    self.secondary_transceiver_tc_socket.sendto(HEARTBEAT_MESSAGES["secondary"], SECONDARY_TRANSCEIVER_TC_ADDRESS)
     time.sleep(1)
 
-  def send_to_transceiver(self) -> None:    
-    try:
-      packet = self.sendable_to_transceiver_messages.get(timeout=1)
-    except queue.Empty:
-      return
-    
-    # If there is no WiFi connection, put the packet back in the queue
-    if packet[1] == "primary" and self.transceiver_socket_connected == False:
-      self.sendable_to_transceiver_messages.put(packet)
-      return
-    elif packet[1] == "secondary" and self.secondary_transceiver_socket_connected == False:
-      self.sendable_to_transceiver_messages.put(packet)
-      return
-    
-    self.logger.log_telecommand_data(packet[2])
-    
-    self.sending_to_transceiver = True
-    try:
-      # Check if we should wait until the next cycle time to send the packet
-      if packet[0] == True:
-        # Wait until the next cycle time to send the packet
-        # Cycle starts when epoch time is divisible by CYCLE_TIME
-        while not (int(time.mktime(time.localtime())) % CYCLE_TIME == 0):
-          time.sleep(0.1)
-        # Send the packet 1 seconds after the cycle time start
-        time.sleep(1)
-      
-      if packet[1] == "primary":
-        self.transceiver_tc_socket.sendto(packet[2], TRANSCEIVER_TC_ADDRESS)
-      elif packet[1] == "secondary":
-        self.secondary_transceiver_tc_socket.sendto(packet[2], SECONDARY_TRANSCEIVER_TC_ADDRESS)
-        
-      self.sending_to_transceiver = False
-      self.sendable_to_transceiver_messages.task_done()
-    except Exception as e:
-      self.sendable_to_transceiver_messages.task_done()
-      print(f"An error occurred while sending to transceiver: {e}")
+  def schedule_telecommand(self, packet) -> None:
+    """
+    Puts a (wait_for_cycle, transceiver, data) packet in the outbox of its transceiver.
+    """
+    self.scheduler.schedule(packet[1], packet[2], packet[0])
+  
+  def send_to_transceiver(self, transceiver: str) -> None:
+    # Waits until the commands of the transceiver are due, or at most 1 second so the thread can be stopped
+    self.scheduler.run_outbox(transceiver)
+  
+  def __send_telecommand(self, transceiver: str, data: bytes) -> None:
+    self.logger.log_telecommand_data(data, transceiver)
+    self.transceiver_tc_sockets[transceiver].sendto(data, TRANSCEIVER_TC_ADDRESSES[transceiver])
+  
+  def __receive_datagrams(self, name: str, sock: socket.socket, timeout: float) -> list:
+    """
+    Receives a batch of datagrams if batching is on, else a single datagram.
+    """
+    receiver = self.receivers.get(name)
+    if receiver is not None:
+      return receiver.receive(timeout)
+    message, addr = sock.recvfrom(4096)
+    return [message]
   
   def receive_from_primary_transceiver(self) -> None:
     try:
-      # Receive a message from the transceiver
-      message, addr = self.transceiver_tm_socket.recvfrom(4096)
-      
-      # Try to decode the message to see if it is a heartbeat
-      try:
-        message = message.decode()
-        if "Heartbeat" in message:
-          self.transceiver_socket_connected = True
-          self.transceiver_wifi_rssi = int(message.split(",")[1])
-        else:
-          raise Exception()
-      # If the message is not a heartbeat, put it in the queue
-      except:
-        print(f"Received from primary transceiver: {message}")
-        self.received_messages.put((False, "yamcs", message))
+      # Receive messages from the transceiver
+      for message in self.__receive_datagrams("primary", self.transceiver_tm_socket, TRANSCEIVER_TIMEOUT):
+        self.handle_transceiver_message("primary", message)
     except socket.timeout:
-      self.transceiver_socket_connected = False
+      self.set_transceiver_disconnected("primary")
     except Exception as e:
       print(f"An error occurred while receiving from primary transceiver: {e}")    
       
   def receive_from_secondary_transceiver(self) -> None:
     try:
-      # Receive a message from the transceiver
-      message, addr = self.secondary_transceiver_tm_socket.recvfrom(4096)
-      
-      # Try to decode the message to see if it is a heartbeat
-      try:
-        message = message.decode()
-        if "Heartbeat" in message:
-          self.secondary_transceiver_socket_connected = True
-          self.secondary_transceiver_wifi_rssi = int(message.split(",")[1])
-        else:
-          raise Exception()
-      # If the message is not a heartbeat, put it in the queue
-      except:
-        self.received_messages.put((False, "yamcs", message))
+      # Receive messages from the transceiver
+      for message in self.__receive_datagrams("secondary", self.secondary_transceiver_tm_socket, TRANSCEIVER_TIMEOUT):
+        self.handle_transceiver_message("secondary", message)
     except socket.timeout:
-      self.secondary_transceiver_socket_connected = False
+      self.set_transceiver_disconnected("secondary")
     except Exception as e:
       print(f"An error occurred while receiving from secondary transceiver: {e}")   
     
+  def handle_transceiver_message(self, transceiver: str, message: bytes) -> None:
+    """
+    Updates the connection state from heartbeats and puts all other messages in the received messages queue,
+    unless the other transceiver already received them. Used by both runtimes.
+    """
+    # If the message is not a heartbeat, put it in the queue
+    received_time = time.monotonic()
+    if not is_heartbeat(message):
+      if not self.duplicate_filter.is_new(transceiver, message, received_time):
+        return
+      if transceiver == "primary":
+        print(f"Received from primary transceiver: {message}")
+      self.received_messages.put((False, "yamcs", message, received_time))
+      return
+    
+    self.heartbeat_statistics[transceiver].update(received_time)
+    rssi = parse_heartbeat_rssi(message)
+    if transceiver == "primary":
+      self.transceiver_socket_connected = True
+      if rssi is not None:
+        self.transceiver_wifi_rssi = rssi
+    else:
+      self.secondary_transceiver_socket_connected = True
+      if rssi is not None:
+        self.secondary_transceiver_wifi_rssi = rssi
+    self.scheduler.set_connected(transceiver, True)
+  
+  def set_transceiver_disconnected(self, transceiver: str) -> None:
+    if transceiver == "primary":
+      self.transceiver_socket_connected = False
+    else:
+      self.secondary_transceiver_socket_connected = False
+    self.scheduler.set_connected(transceiver, False)
+  
+  def is_transceiver_connected(self, transceiver: str) -> bool:
+    if transceiver == "primary":
+      return self.transceiver_socket_connected
+    return self.secondary_transceiver_socket_connected
+  
   def send_to_yamcs(self) -> None:
     try:
       packet = self.sendable_to_yamcs_messages.get(timeout=1)
     except:
       return
-    try:
-      self.yamcs_tm_socket.sendto(packet[2], YAMCS_TM_ADDRESS)
-      self.logger.log_telemetry_data(packet[2])
-      self.sendable_to_yamcs_messages.task_done()
-    except Exception as e:
+    
+    # Packets already waiting in the queue are sent in the same batch and logged with one write
+    packets = [packet]
+    while len(packets) < self.yamcs_batch_size:
+      try:
+        packets.append(self.sendable_to_yamcs_messages.get_nowait())
+      except queue.Empty:
+        break
+    
+    # Only the packets that were sent are recorded and logged
+    sent_packets = []
+    for packet in packets:
+      try:
+        self.yamcs_tm_socket.sendto(packet[2], YAMCS_TM_ADDRESS)
+        sent_packets.append(packet)
+      except Exception as e:
+        print(f"An error occurred while sending to YAMCS: {e}")
       self.sendable_to_yamcs_messages.task_done()
-      print(f"An error occurred while sending to YAMCS: {e}")
+    if sent_packets:
+      self.latency.record_sent(sent_packets)
+      self.logger.log_telemetry_batch([packet[2] for packet in sent_packets])
       
   def receive_from_yamcs(self) -> None:
     try:
-      packet, addr = self.yamcs_tc_socket.recvfrom(1024)
-      self.received_messages.put((False, "transceiver", packet))
+      packets = self.__receive_datagrams("yamcs", self.yamcs_tc_socket, 1)
+      received_time = time.monotonic()
+      for packet in packets:
+        self.received_messages.put((False, "transceiver", packet, received_time))
     except socket.timeout:
       pass
     except Exception as e:
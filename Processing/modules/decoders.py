@@ -0,0 +1,145 @@
+from collections import namedtuple
+from struct import Struct
+
+from modules.ccsds import PACKET_ID
+
+# Struct format characters of the data types used in the message structures (all values are big endian)
+FIELD_FORMATS = {
+  "float": "f",
+  "int": "I",
+  "uint8": "B",
+  "uint16": "H",
+}
+
+# Packet id at the start of the telecommand user data
+# YAMCS encodes it in big endian byte order, like the rest of the packet (see the XTCE mission database)
+YAMCS_PACKET_ID = Struct(">H")
+# The telecommands that only the ground station builds are sent with the packet id in little endian byte order,
+# which is how the rotator has always received it (see LITTLE_ENDIAN_TELECOMMANDS in config.py)
+LITTLE_ENDIAN_PACKET_ID = PACKET_ID
+
+def read_packet_id(packet_data) -> int:
+  """
+  Returns the packet id of a telecommand from YAMCS, the first 2 bytes of its user data, or None if the user data is shorter.
+  """
+  if len(packet_data) < YAMCS_PACKET_ID.size:
+    return None
+  return YAMCS_PACKET_ID.unpack_from(packet_data)[0]
+
+class TelemetryRecord:
+  """
+  Base of the generated telemetry records.
+  Records are named tuples, but can also be read like the telemetry dictionaries used before.
+  """
+  __slots__ = ()
+
+  def __getitem__(self, key):
+    if isinstance(key, str):
+      return getattr(self, key)
+    return tuple.__getitem__(self, key)
+
+  def keys(self):
+    return self._fields
+
+  def values(self):
+    return tuple(self)
+
+  def items(self):
+    return zip(self._fields, self)
+
+class TelemetryDecoder:
+  """
+  Decoder for a single message structure from config.py.
+  The whole structure is compiled into one struct format, so a packet is decoded with one unpack_from call.
+  """
+  record_suffix = "telemetry"
+
+  def __init__(self, name: str, structure: list) -> None:
+    self.name = name
+    self.fields = tuple(field for data_type, field in structure)
+
+    try:
+      struct_format = ">" + "".join(FIELD_FORMATS[data_type] for data_type, field in structure)
+    except KeyError as e:
+      raise Exception(f"Invalid data type {e} in {name} message structure")
+    self.struct = Struct(struct_format)
+    self.size = self.struct.size
+
+    # Slotted record type with one field for each value in the structure
+    # The struct is kept on the record type, so records can be encoded again by the packet builder
+    record_name = f"{name}_{self.record_suffix}"
+    self.record = type(record_name, (TelemetryRecord, namedtuple(record_name, self.fields)), {"__slots__": (), "_struct": self.struct})
+
+  def decode(self, packet_data, offset: int = 0) -> TelemetryRecord:
+    """
+    Decodes the user data field of a packet into a telemetry record.
+    """
+    return self.record._make(self.struct.unpack_from(packet_data, offset))
+
+  def encode(self, record) -> bytes:
+    """
+    Encodes telemetry values (a record or any sequence in structure order) into packet data.
+    """
+    return self.struct.pack(*record)
+
+  def empty(self) -> TelemetryRecord:
+    """
+    Returns a record with all values set to 0.0.
+    """
+    return self.record._make(0.0 for field in self.fields)
+
+def compile_telemetry_decoders(structures: dict) -> dict:
+  """
+  Compiles a decoder for every message structure.
+  Should be called once at startup, the decoders are reused for every packet.
+  """
+  return {name: TelemetryDecoder(name, structure) for name, structure in structures.items()}
+
+class TelecommandDecoder(TelemetryDecoder):
+  """
+  Decoder for the arguments of a telecommand, which follow the 2 byte packet id.
+  Also knows the APID, the packet id and the byte order of the packet id of the telecommand, so a command can be built in one call.
+  """
+  record_suffix = "arguments"
+
+  def __init__(self, packet_id: int, name: str, structure: list, apid: int, packet_id_struct: Struct = YAMCS_PACKET_ID) -> None:
+    super().__init__(name, structure)
+    self.packet_id = packet_id
+    self.apid = apid
+    self.packet_id_struct = packet_id_struct
+
+  def validate(self, packet_data, offset: int = 0) -> bool:
+    """
+    Checks if the packet data holds all arguments of the telecommand.
+    """
+    return len(packet_data) - offset >= self.size
+
+  def build(self, packet_builder, *values) -> bytes:
+    """
+    Builds the telecommand packet with a packet builder, values are the arguments in structure order.
+    """
+    return packet_builder.build_telecommand(self.apid, self.packet_id, self.record._make(values), self.packet_id_struct)
+
+  def decode_command(self, packet_data) -> tuple:
+    """
+    Decodes the user data of a telecommand built by build, returns (packet id, arguments).
+    """
+    return self.packet_id_struct.unpack_from(packet_data)[0], self.decode(packet_data, self.packet_id_struct.size)
+
+def compile_telecommand_decoders(packet_types: dict, structures: dict, apids: dict, little_endian_types=()) -> dict:
+  """
+  Compiles a decoder for every telecommand, keyed by packet id.
+  packet_types maps packet ids to telecommand types, structures maps telecommand types to their argument structures,
+  and apids maps the vehicle prefix of a telecommand type (e.g. "pfc" in "pfc_ejection_request") to its APID.
+  The packet id is big endian like in the telecommands from YAMCS, except for the telecommand types in little_endian_types.
+  """
+  decoders = {}
+  for packet_id, packet_type in packet_types.items():
+    if packet_type not in structures:
+      raise Exception(f"No message structure for telecommand {packet_type}")
+    vehicle = packet_type.split("_")[0]
+    if vehicle not in apids:
+      raise Exception(f"No APID for telecommand {packet_type}")
+    packet_id_struct = LITTLE_ENDIAN_PACKET_ID if packet_type in little_endian_types else YAMCS_PACKET_ID
+    decoders[packet_id] = TelecommandDecoder(packet_id, packet_type, structures[packet_type], apids[vehicle], packet_id_struct)
+  return decoders
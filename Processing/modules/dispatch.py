@@ -0,0 +1,57 @@
+from config import *
+
+# APID is an 11-bit field
+APID_COUNT = 2048
+
+def get_apids(packet_type: str) -> list:
+  """
+  Returns all APIDs of a packet type in APID_TO_TYPE.
+  """
+  return [apid for apid, value in APID_TO_TYPE.items() if value == packet_type]
+
+def get_packet_id(packet_type: str) -> int:
+  """
+  Returns the telecommand packet id of a packet type in PACKETID_TO_TYPE.
+  """
+  packet_ids = [packet_id for packet_id, value in PACKETID_TO_TYPE.items() if value == packet_type]
+  if not packet_ids:
+    raise Exception(f"Unknown telecommand type: {packet_type}")
+  return packet_ids[0]
+
+class DispatchTable:
+  """
+  Handler tables for APIDs and telecommand packet ids.
+  Handlers are registered by packet type from config.py once at startup, so finding the handler of a packet
+  is a single list index or dictionary lookup, no matter how many packet types there are.
+  APIDs left with the default handler None have no local consumer.
+  """
+  def __init__(self, default_apid_handler=None) -> None:
+    self.apid_handlers = [default_apid_handler] * APID_COUNT
+    self.packet_id_handlers = {}
+
+  def register_apid_handler(self, apid: int, handler) -> None:
+    if not 0 <= apid < APID_COUNT:
+      raise Exception(f"Invalid APID: {apid}")
+    self.apid_handlers[apid] = handler
+
+  def register_packet_type_handler(self, packet_type: str, handler) -> None:
+    """
+    Registers a handler for every APID of a packet type in APID_TO_TYPE.
+    """
+    apids = get_apids(packet_type)
+    if not apids:
+      raise Exception(f"Unknown packet type: {packet_type}")
+    for apid in apids:
+      self.register_apid_handler(apid, handler)
+
+  def register_packet_id_handler(self, packet_type: str, handler) -> None:
+    """
+    Registers a handler for a telecommand type in PACKETID_TO_TYPE.
+    """
+    self.packet_id_handlers[get_packet_id(packet_type)] = handler
+
+  def get_apid_handler(self, apid: int):
+    return self.apid_handlers[apid]
+
+  def get_packet_id_handler(self, packet_id: int):
+    return self.packet_id_handlers.get(packet_id)
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from threading import Lock
+
+from modules.ccsds import PRIMARY_HEADER, SECONDARY_HEADER
+
+# The primary and secondary headers hold the APID, sequence count and epoch seconds and subseconds of a packet
+DUPLICATE_KEY_SIZE = PRIMARY_HEADER.size + SECONDARY_HEADER.size
+
+class DuplicateFilter:
+  """
+  Passes on telemetry heard by several transceivers only once.
+  A packet is a duplicate if a packet with the same primary and secondary headers was seen in the last window seconds.
+  Seen packets are kept in insertion order, so expired packets are removed from the front, and at most capacity packets are kept.
+  Counts how many packets each link contributed first (unique) and how many it repeated (duplicates).
+  """
+  def __init__(self, window: float, capacity: int) -> None:
+    self.window = window
+    self.capacity = capacity
+    self.seen_packets = OrderedDict()
+    # Both transceiver receivers use the filter
+    self.lock = Lock()
+
+    # Statistics
+    self.unique_packets = {}
+    self.duplicate_packets = {}
+
+  def is_new(self, link: str, packet: bytes, now: float) -> bool:
+    """
+    Returns False if the packet is a duplicate of a packet seen in the window, else remembers it and returns True.
+    Packets too short to have a secondary header are always new.
+    """
+    if len(packet) < DUPLICATE_KEY_SIZE:
+      return True
+    key = bytes(packet[:DUPLICATE_KEY_SIZE])
+
+    with self.lock:
+      seen_packets = self.seen_packets
+      # Remove the packets that left the window
+      expiry_time = now - self.window
+      while seen_packets and next(iter(seen_packets.values())) < expiry_time:
+        seen_packets.popitem(last=False)
+
+      if key in seen_packets:
+        self.duplicate_packets[link] = self.duplicate_packets.get(link, 0) + 1
+        return False
+
+      seen_packets[key] = now
+      if len(seen_packets) > self.capacity:
+        seen_packets.popitem(last=False)
+      self.unique_packets[link] = self.unique_packets.get(link, 0) + 1
+      return True
@@ -0,0 +1,61 @@
+from threading import Condition
+
+# Topics that wake up each event driven task
+TASK_TOPICS = {
+  "map_data": ["pfc_telemetry", "bfc_telemetry", "rotator_position"],
+  "rotator_data": ["pfc_telemetry", "bfc_telemetry", "rotator_telemetry", "rotator_settings"],
+  "rotator_control": ["rotator_angles_required"],
+  "rotator_command": ["rotator_command"],
+}
+
+# Seconds an event driven thread waits before checking if it should stop
+EVENT_WAIT_TIMEOUT = 1
+
+class EventBus:
+  """
+  Change notifications between the ground station tasks.
+  Publishers name the topic that changed (e.g. "pfc_telemetry"), and consumers wait on their topics instead of polling shared state.
+  Every topic has a version counter, so a consumer that is busy when a change is published still sees it on its next wait.
+  """
+  def __init__(self) -> None:
+    self.condition = Condition()
+    self.versions = {}
+    # Callbacks called on every publish, used by the async runtime to wake up its tasks
+    self.listeners = []
+
+  def publish(self, topic: str) -> None:
+    with self.condition:
+      self.versions[topic] = self.versions.get(topic, 0) + 1
+      self.condition.notify_all()
+    for listener in self.listeners:
+      listener(topic)
+
+  def subscribe(self, topics: list) -> "Subscription":
+    return Subscription(self, topics)
+
+  def add_listener(self, listener) -> None:
+    self.listeners.append(listener)
+
+class Subscription:
+  """
+  A consumer's view of some topics of an event bus. The first wait returns right away, so consumers start from the current state.
+  """
+  def __init__(self, event_bus: EventBus, topics: list) -> None:
+    self.event_bus = event_bus
+    self.topics = tuple(topics)
+    self.seen_versions = dict.fromkeys(self.topics, -1)
+
+  def __changed_topics(self) -> list:
+    versions = self.event_bus.versions
+    return [topic for topic in self.topics if versions.get(topic, 0) != self.seen_versions[topic]]
+
+  def wait(self, timeout: float = None) -> list:
+    """
+    Waits until one of the topics changes, returns the changed topics (an empty list on timeout).
+    """
+    with self.event_bus.condition:
+      self.event_bus.condition.wait_for(self.__changed_topics, timeout)
+      changed_topics = self.__changed_topics()
+      for topic in changed_topics:
+        self.seen_versions[topic] = self.event_bus.versions.get(topic, 0)
+    return changed_topics
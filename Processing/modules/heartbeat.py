@@ -0,0 +1,61 @@
+import math
+import re
+
+# CCSDS packets start with version number 0 in the top 3 bits, so their first byte is below 0x20.
+# Heartbeats are text, so their first byte is a printable character.
+CCSDS_FIRST_BYTE_LIMIT = 0x20
+HEARTBEAT_MARKER = b"Heartbeat"
+# Heartbeats end with the Wi-Fi RSSI after a comma, e.g. b"Heartbeat,-40"
+RSSI_PATTERN = re.compile(rb",\s*(-?\d+)")
+
+def is_heartbeat(message: bytes) -> bool:
+  """
+  Classifies a datagram from a transceiver by its first byte, without decoding it.
+  """
+  return len(message) > 0 and message[0] >= CCSDS_FIRST_BYTE_LIMIT and HEARTBEAT_MARKER in message
+
+def parse_heartbeat_rssi(message: bytes):
+  """
+  Returns the RSSI of a heartbeat, or None if it has none.
+  """
+  match = RSSI_PATTERN.search(message)
+  if match is None:
+    return None
+  return int(match.group(1))
+
+class HeartbeatStatistics:
+  """
+  Interval statistics of the heartbeats of one transceiver.
+  The mean and standard deviation are updated with Welford's method, so no intervals are stored.
+  """
+  def __init__(self) -> None:
+    self.count = 0
+    self.last_time = None
+    self.last_interval = 0.0
+    self.min_interval = 0.0
+    self.max_interval = 0.0
+    self.mean_interval = 0.0
+    self.interval_m2 = 0.0
+
+  def update(self, now: float) -> None:
+    self.count += 1
+    if self.last_time is not None:
+      interval = now - self.last_time
+      intervals = self.count - 1
+      if intervals == 1:
+        self.min_interval = interval
+        self.max_interval = interval
+      else:
+        self.min_interval = min(self.min_interval, interval)
+        self.max_interval = max(self.max_interval, interval)
+      delta = interval - self.mean_interval
+      self.mean_interval += delta / intervals
+      self.interval_m2 += delta * (interval - self.mean_interval)
+      self.last_interval = interval
+    self.last_time = now
+
+  def get_interval_deviation(self) -> float:
+    intervals = self.count - 1
+    if intervals < 2:
+      return 0.0
+    return math.sqrt(self.interval_m2 / (intervals - 1))
@@ -2,6 +2,7 @@ from tabulate import tabulate
 import time
 import os
 
+from modules.ccsds import peek_ccsds_header
 from modules.connection_manager import ConnectionManager
 from modules.processor import PacketProcessor
 from modules.rotator import Rotator
@@ -29,19 +30,93 @@ class InfoTables:
     print() 
   
     # Connection Manager
-    headers = ["Rotator Connected", "Wi-Fi RSSI (dBm)", "Second Transceiver Connected", "Wi-Fi RSSI (dBm)", "Next Communication Cycle Start (s)", "Command To Send"]
+    headers = ["Rotator Connected", "Wi-Fi RSSI (dBm)", "Second Transceiver Connected", "Wi-Fi RSSI (dBm)", "Next Communication Cycle Start (s)", "Primary Outbox", "Secondary Outbox"]
     
     rotator_connected = self.connection_manager.transceiver_socket_connected
     rotator_wifi_rssi = self.connection_manager.transceiver_wifi_rssi
     secondary_transceiver_connected = self.connection_manager.secondary_transceiver_socket_connected
     secondary_transceiver_wifi_rssi = self.connection_manager.secondary_transceiver_wifi_rssi
     cycle_start = round(CYCLE_TIME - (time.time() % CYCLE_TIME), 1)
-    command_to_send = self.connection_manager.sending_to_transceiver
+    scheduler = self.connection_manager.scheduler
     
-    table = [[rotator_connected, rotator_wifi_rssi, secondary_transceiver_connected, secondary_transceiver_wifi_rssi, cycle_start, command_to_send]]
+    table = [[rotator_connected, rotator_wifi_rssi, secondary_transceiver_connected, secondary_transceiver_wifi_rssi, cycle_start, scheduler.get_queued_commands("primary"), scheduler.get_queued_commands("secondary")]]
     print("Connections")
     print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
     print()
+    
+    # Heartbeats
+    headers = ["Transceiver", "Heartbeats", "Last Interval (s)", "Mean Interval (s)", "Min Interval (s)", "Max Interval (s)", "Interval Std Dev (s)", "Unique Packets", "Duplicate Packets"]
+    
+    table = []
+    duplicate_filter = self.connection_manager.duplicate_filter
+    for transceiver, statistics in self.connection_manager.heartbeat_statistics.items():
+      table.append([transceiver.capitalize(), statistics.count, round(statistics.last_interval, 3), round(statistics.mean_interval, 3),
+                    round(statistics.min_interval, 3), round(statistics.max_interval, 3), round(statistics.get_interval_deviation(), 3),
+                    duplicate_filter.unique_packets.get(transceiver, 0), duplicate_filter.duplicate_packets.get(transceiver, 0)])
+    print("Transceivers")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+    print()
+    
+    # Scheduled telecommands
+    command_etas = scheduler.get_command_etas()
+    if command_etas:
+      headers = ["Transceiver", "APID", "Size (B)", "Waiting (s)", "ETA (s)"]
+      table = [[link.capitalize(), peek_ccsds_header(data)[0], len(data), round(waited, 1), "Parked" if eta is None else round(eta, 1)] for link, data, waited, eta in command_etas]
+      print("Scheduled Telecommands")
+      print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+      print()
+    
+    # Telecommands not checked against the telecommand registry
+    if self.packet_processor.unknown_telecommands or self.packet_processor.short_telecommands:
+      headers = ["Unknown Telecommands", "Too Short Telecommands"]
+      table = [[self.packet_processor.unknown_telecommands, self.packet_processor.short_telecommands]]
+      print("Unchecked Telecommands (forwarded unchanged)")
+      print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+      print()
+    
+    # Queues
+    headers = ["Queue", "Depth", "Capacity", "Policy", "High Water Mark", "Dropped"]
+    
+    table = []
+    received_messages = self.connection_manager.received_messages
+    for lane, items in received_messages.lanes.items():
+      table.append([f"{received_messages.name} [{lane}]", len(items), received_messages.capacity, received_messages.lane_policies[lane],
+                    received_messages.lane_high_water_marks[lane], received_messages.lane_dropped[lane]])
+    sendable_to_yamcs_messages = self.connection_manager.sendable_to_yamcs_messages
+    table.append([sendable_to_yamcs_messages.name, sendable_to_yamcs_messages.qsize(), sendable_to_yamcs_messages.capacity, sendable_to_yamcs_messages.policy,
+                  sendable_to_yamcs_messages.high_water_mark, sendable_to_yamcs_messages.dropped])
+    for outbox in scheduler.outboxes.values():
+      table.append([f"{outbox.name}_outbox", len(outbox.commands), scheduler.capacity, "never_drop", outbox.high_water_mark, 0])
+    logger = self.connection_manager.logger
+    table.append(["log_entries", len(logger.entries), 0, "never_drop", logger.high_water_mark, 0])
+    print("Queues")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+    print()
+    
+    # Latency
+    latency_summary = self.connection_manager.latency.get_summary()
+    headers = [f"{stage.capitalize()} p50 / p99 (ms)" for stage in latency_summary] + ["Packets Sent"]
+    table = [[f"{summary['p50']:.2f} / {summary['p99']:.2f}" for summary in latency_summary.values()] + [latency_summary["total"]["count"]]]
+    print("Latency")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+    print()
+    
+    # Lane latency
+    headers = ["Lane", "Packets", "Queue p50 / p99 (ms)", "Handled p50 / p99 (ms)"]
+    table = [[lane.capitalize(), summary["handled"]["count"], f"{summary['queue']['p50']:.2f} / {summary['queue']['p99']:.2f}", f"{summary['handled']['p50']:.2f} / {summary['handled']['p99']:.2f}"]
+             for lane, summary in self.connection_manager.latency.get_lane_summary().items()]
+    print("Lane Latency")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+    print()
+    
+    # Telemetry reordering
+    if self.packet_processor.reorder_buffers:
+      headers = ["Vehicle", "Held Packets", "Holding", "High Water Mark", "Reordered Packets", "Late Packets"]
+      table = [[vehicle.upper(), buffer.held_packets, len(buffer.packets), buffer.high_water_mark, buffer.reordered_packets, buffer.late_packets]
+               for vehicle, buffer in self.packet_processor.reorder_buffers.items()]
+      print("Telemetry Reordering")
+      print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+      print()
         
     # Packet Processor
     headers = ["Vehicle", "Time", "Latitude", "Longitude", "GPS Alt (m)", "Baro Alt (m)", "Satellites", "Info/Error", "RSSI (dBm)", "SNR", "Since last packet (s)"]
@@ -0,0 +1,23 @@
+from config import *
+from modules.ccsds import peek_ccsds_header
+from modules.dispatch import get_apids
+
+# Lanes of the received messages, in priority order
+# "command" - telecommands from YAMCS, including rotator control
+# "essential" - telemetry used by the calculations and the rotator
+# "bulk" - all other telemetry, which is only forwarded to YAMCS
+PACKET_LANES = ("command", "essential", "bulk")
+
+ESSENTIAL_PACKET_TYPES = ("pfc_essential", "bfc_essential", "rotator_position")
+ESSENTIAL_APIDS = frozenset(apid for packet_type in ESSENTIAL_PACKET_TYPES for apid in get_apids(packet_type))
+
+def get_packet_lane(packet) -> str:
+  """
+  Returns the lane of a (wait_for_cycle, destination, data, received time) packet from the received messages.
+  Packets from YAMCS are sent to the transceivers, packets from the transceivers are sent to YAMCS.
+  """
+  if packet[1] == "transceiver":
+    return "command"
+  if len(packet[2]) >= 2 and peek_ccsds_header(packet[2])[0] in ESSENTIAL_APIDS:
+    return "essential"
+  return "bulk"
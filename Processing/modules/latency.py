@@ -0,0 +1,121 @@
+import time
+
+# Stages of a packet from the transceiver or YAMCS socket to the YAMCS telemetry socket
+# "queue" - received until taken from the received messages queue by the processor
+# "decode" - taken from the queue until its headers are parsed
+# "process" - headers parsed until routed, includes decoding the payload and the calculations
+# "send" - routed until sent to YAMCS, includes the YAMCS sender queue
+# "total" - received until sent to YAMCS
+LATENCY_STAGES = ("queue", "decode", "process", "send", "total")
+# Stages of each lane of the received messages
+# "queue" - received until taken from its lane by the processor
+# "handled" - received until the processor finished with it, telecommands are in their outbox by then
+LANE_STAGES = ("queue", "handled")
+
+# Latencies are recorded in microseconds, values above MAX_LATENCY seconds are recorded as MAX_LATENCY
+MAX_LATENCY = 60
+# Every power of two range is split into 2 ** (SUB_BUCKET_BITS - 1) buckets, so a bucket is at most 1/64 of its value wide
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF_COUNT = SUB_BUCKET_COUNT // 2
+
+def get_bucket_index(value: int) -> int:
+  """
+  Returns the bucket of a value in microseconds, values below SUB_BUCKET_COUNT have a bucket each.
+  """
+  if value < SUB_BUCKET_COUNT:
+    return value
+  shift = value.bit_length() - SUB_BUCKET_BITS
+  return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF_COUNT + (value >> shift) - SUB_BUCKET_HALF_COUNT
+
+def get_bucket_value(index: int) -> int:
+  """
+  Returns the lowest value in microseconds of a bucket.
+  """
+  if index < SUB_BUCKET_COUNT:
+    return index
+  shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF_COUNT + 1
+  return ((index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF_COUNT + SUB_BUCKET_HALF_COUNT) << shift
+
+class LatencyHistogram:
+  """
+  Histogram of latencies with log-linear buckets, like an HDR histogram.
+  The buckets are allocated once, so the memory does not grow with the number of packets, and percentiles are within 1.6%.
+  """
+  def __init__(self, max_latency: float = MAX_LATENCY) -> None:
+    self.max_value = int(max_latency * 1e6)
+    self.counts = [0] * (get_bucket_index(self.max_value) + 1)
+    self.count = 0
+    self.total = 0
+    self.min_value = 0
+    self.max_recorded_value = 0
+
+  def record(self, seconds: float) -> None:
+    value = min(max(int(seconds * 1e6), 0), self.max_value)
+    self.counts[get_bucket_index(value)] += 1
+    if self.count == 0 or value < self.min_value:
+      self.min_value = value
+    if value > self.max_recorded_value:
+      self.max_recorded_value = value
+    self.count += 1
+    self.total += value
+
+  def get_percentile(self, percentile: float) -> float:
+    """
+    Returns the latency in seconds that percentile percent of the recorded latencies are at or below.
+    Latencies are rounded up to the end of their bucket.
+    """
+    if self.count == 0:
+      return 0.0
+    target = max(1, int(self.count * percentile / 100 + 0.5))
+    seen = 0
+    for index, count in enumerate(self.counts):
+      seen += count
+      if seen >= target:
+        return min(get_bucket_value(index + 1) - 1, self.max_recorded_value) / 1e6
+    return self.max_recorded_value / 1e6
+
+  def get_summary(self) -> dict:
+    """
+    Returns the count and the mean, min, percentile and max latencies in milliseconds.
+    """
+    summary = {"count": self.count, "mean": self.total / self.count / 1e3 if self.count else 0.0, "min": self.min_value / 1e3}
+    for percentile in (50, 90, 99, 99.9):
+      summary[f"p{percentile}"] = self.get_percentile(percentile) * 1e3
+    summary["max"] = self.max_recorded_value / 1e3
+    return summary
+
+class LatencyTracer:
+  """
+  Latency histograms of the packet stages, and of the stages of each lane.
+  Each stage is recorded by one thread (the processor or the YAMCS sender), so the histograms are not locked.
+  """
+  def __init__(self, lanes: tuple = ()) -> None:
+    self.histograms = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+    self.lane_histograms = {lane: {stage: LatencyHistogram() for stage in LANE_STAGES} for lane in lanes}
+
+  def record(self, stage: str, seconds: float) -> None:
+    self.histograms[stage].record(seconds)
+
+  def record_lane(self, lane: str, stage: str, seconds: float) -> None:
+    self.lane_histograms[lane][stage].record(seconds)
+
+  def record_sent(self, packets: list, now: float = None) -> None:
+    """
+    Records the send and total latencies of (wait_for_cycle, destination, data, received time, routed time) packets sent to YAMCS.
+    Packets not created while processing a received packet have no received time.
+    """
+    if now is None:
+      now = time.monotonic()
+    send_histogram = self.histograms["send"]
+    total_histogram = self.histograms["total"]
+    for packet in packets:
+      send_histogram.record(now - packet[4])
+      if packet[3] is not None:
+        total_histogram.record(now - packet[3])
+
+  def get_summary(self) -> dict:
+    return {stage: histogram.get_summary() for stage, histogram in self.histograms.items()}
+
+  def get_lane_summary(self) -> dict:
+    return {lane: {stage: histogram.get_summary() for stage, histogram in histograms.items()} for lane, histograms in self.lane_histograms.items()}
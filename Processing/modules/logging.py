@@ -1,45 +1,392 @@
-import csv
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
 from datetime import datetime
+from struct import Struct
+from threading import Event, Thread
+import mmap
 import os
-import binascii
+import time
+
+from modules.ccsds import peek_ccsds_header
+
+# Buffered log data is written when a file has LOG_FLUSH_SIZE bytes buffered or its oldest data is LOG_FLUSH_INTERVAL seconds old
+LOG_FLUSH_SIZE = 64 * 1024
+LOG_FLUSH_INTERVAL = 1
+# When written data is synced to disk with fsync
+# "flush" - after every write, "interval" - at most every LOG_FSYNC_INTERVAL seconds, "never" - left to the operating system
+LOG_FSYNC_POLICIES = ("flush", "interval", "never")
+LOG_FSYNC_INTERVAL = 5
+# "csv" - telemetry.csv and telecommand.csv with the time and the packet in hex
+# "binary" - flight.bin with the raw packets and flight.idx with their sparse time and APID index
+LOG_FORMATS = ("csv", "binary")
+
+# Same row format as csv.writer
+LOG_LINE_TERMINATOR = "\r\n"
+CSV_HEADER = f"Time,Packet data{LOG_LINE_TERMINATOR}".encode("ascii")
+
+# Telemetry is sent down to YAMCS, telecommands are sent up to the vehicles
+DIRECTION_DOWNLINK = 0
+DIRECTION_UPLINK = 1
+# Links a packet can be sent on, the link id in the flight log is the position in this tuple
+LOG_LINKS = ("yamcs", "primary", "secondary", "serial")
+LINK_IDS = {link: link_id for link_id, link in enumerate(LOG_LINKS)}
+
+# Binary flight log, all fields little endian
+# The file starts with FLIGHT_LOG_MAGIC, every record is a RECORD_HEADER followed by length bytes of the raw packet
+FLIGHT_LOG_MAGIC = b"RTUFLOG1"
+# Monotonic time (ns), wall time (ns), direction, link id, length
+RECORD_HEADER = Struct("<qqBBH")
+# The index file starts with FLIGHT_INDEX_MAGIC, every entry is the wall time (ns), offset and APID of a record.
+# A time entry (APID TIME_INDEX_APID) starts every INDEX_INTERVAL seconds, followed by an entry for the first record of every APID
+# in the interval, so the intervals without a packet of an APID can be skipped.
+FLIGHT_INDEX_MAGIC = b"RTUFIDX1"
+INDEX_ENTRY = Struct("<qQH")
+TIME_INDEX_APID = 0xFFFF
+INDEX_INTERVAL = 1
+
+FlightLogRecord = namedtuple("FlightLogRecord", ["offset", "monotonic_ns", "wall_ns", "direction", "link", "data"])
+
+class LogFile:
+  """
+  A log file that stays open, with the data waiting to be written.
+  Data is only written in one write per flush, so after a crash the file ends with the last complete flush,
+  at most a partial last line or record.
+  """
+  def __init__(self, path: str, fsync_policy: str, header: bytes) -> None:
+    self.path = path
+    self.fsync_policy = fsync_policy
+    self.file = open(path, "wb")
+    self.buffer = bytearray()
+    self.first_buffered_time = 0.0
+    self.last_fsync_time = time.monotonic()
+    # Bytes written and buffered, the offset of the next data
+    self.size = 0
+
+    self.add(header, time.monotonic())
+    self.flush(time.monotonic())
+
+  def add(self, data: bytes, now: float) -> None:
+    if not self.buffer:
+      self.first_buffered_time = now
+    self.buffer += data
+    self.size += len(data)
+
+  def is_due(self, now: float) -> bool:
+    return len(self.buffer) >= LOG_FLUSH_SIZE or (len(self.buffer) > 0 and now - self.first_buffered_time >= LOG_FLUSH_INTERVAL)
+
+  def get_flush_time(self):
+    """
+    Returns the monotonic time at which the buffered data is due, or None if nothing is buffered.
+    """
+    if not self.buffer:
+      return None
+    return self.first_buffered_time + LOG_FLUSH_INTERVAL
+
+  def flush(self, now: float) -> None:
+    if self.buffer:
+      self.file.write(self.buffer)
+      self.file.flush()
+      self.buffer = bytearray()
+    if self.fsync_policy == "flush" or (self.fsync_policy == "interval" and now - self.last_fsync_time >= LOG_FSYNC_INTERVAL):
+      os.fsync(self.file.fileno())
+      self.last_fsync_time = now
+
+  def close(self) -> None:
+    self.flush(time.monotonic())
+    if self.fsync_policy != "never":
+      os.fsync(self.file.fileno())
+    self.file.close()
+
+class FlightLog:
+  """
+  Binary log of the raw packets with its sparse time and APID index.
+  The records are flushed before the index, so the index never points past the records on disk.
+  """
+  def __init__(self, path: str, index_path: str, fsync_policy: str) -> None:
+    self.records = LogFile(path, fsync_policy, FLIGHT_LOG_MAGIC)
+    self.index = LogFile(index_path, fsync_policy, FLIGHT_INDEX_MAGIC)
+    self.interval_start = None
+    self.indexed_apids = set()
+
+  def add_record(self, direction: int, link_id: int, wall_ns: int, monotonic_ns: int, packet_data: bytes, now: float) -> None:
+    offset = self.records.size
+    if self.interval_start is None or wall_ns - self.interval_start >= INDEX_INTERVAL * 1_000_000_000:
+      self.interval_start = wall_ns
+      self.indexed_apids.clear()
+      self.index.add(INDEX_ENTRY.pack(wall_ns, offset, TIME_INDEX_APID), now)
+    if len(packet_data) >= 2:
+      apid = peek_ccsds_header(packet_data)[0]
+      if apid not in self.indexed_apids:
+        self.indexed_apids.add(apid)
+        self.index.add(INDEX_ENTRY.pack(wall_ns, offset, apid), now)
+
+    self.records.add(RECORD_HEADER.pack(monotonic_ns, wall_ns, direction, link_id, len(packet_data)), now)
+    self.records.add(packet_data, now)
+
+  def is_due(self, now: float) -> bool:
+    return self.records.is_due(now) or self.index.is_due(now)
+
+  def get_flush_time(self):
+    flush_times = [flush_time for flush_time in (self.records.get_flush_time(), self.index.get_flush_time()) if flush_time is not None]
+    return min(flush_times, default=None)
+
+  def flush(self, now: float) -> None:
+    self.records.flush(now)
+    self.index.flush(now)
+
+  def close(self) -> None:
+    self.records.close()
+    self.index.close()
+
+class FlightLogReader:
+  """
+  Reads a binary flight log through mmap, so finding a time only reads the index and the pages of one index interval.
+  A log cut off by a crash is read up to its last complete record. Without an index file the log is read from the start.
+  """
+  def __init__(self, path: str, index_path: str = None) -> None:
+    if index_path is None:
+      index_path = os.path.splitext(path)[0] + ".idx"
+
+    self.file = open(path, "rb")
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.map[:len(FLIGHT_LOG_MAGIC)] != FLIGHT_LOG_MAGIC:
+      self.close()
+      raise Exception(f"Not a flight log: {path}")
+
+    # Time entries and the entries of every APID, as (wall time, offset) sorted by offset
+    self.time_index = []
+    self.apid_index = {}
+    if os.path.exists(index_path):
+      with open(index_path, "rb") as index_file:
+        index_data = index_file.read()
+      if index_data[:len(FLIGHT_INDEX_MAGIC)] == FLIGHT_INDEX_MAGIC:
+        entries_size = (len(index_data) - len(FLIGHT_INDEX_MAGIC)) // INDEX_ENTRY.size * INDEX_ENTRY.size
+        for wall_ns, offset, apid in INDEX_ENTRY.iter_unpack(index_data[len(FLIGHT_INDEX_MAGIC):len(FLIGHT_INDEX_MAGIC) + entries_size]):
+          if offset >= len(self.map):
+            break
+          if apid == TIME_INDEX_APID:
+            self.time_index.append((wall_ns, offset))
+          else:
+            self.apid_index.setdefault(apid, []).append((wall_ns, offset))
+    self.time_index_times = [wall_ns for wall_ns, offset in self.time_index]
+    self.time_index_offsets = [offset for wall_ns, offset in self.time_index]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    self.close()
+
+  def close(self) -> None:
+    self.map.close()
+    self.file.close()
+
+  def read_record(self, offset: int):
+    """
+    Returns the record at an offset, or None at the end of the log or if the record is incomplete.
+    """
+    data_offset = offset + RECORD_HEADER.size
+    if data_offset > len(self.map):
+      return None
+    monotonic_ns, wall_ns, direction, link_id, length = RECORD_HEADER.unpack_from(self.map, offset)
+    if data_offset + length > len(self.map):
+      return None
+    return FlightLogRecord(offset, monotonic_ns, wall_ns, direction, LOG_LINKS[link_id], self.map[data_offset:data_offset + length])
+
+  def iterate_records(self, offset: int = len(FLIGHT_LOG_MAGIC), end_offset: int = None):
+    """
+    Yields the records from an offset up to end_offset, or to the end of the log.
+    """
+    if end_offset is None:
+      end_offset = len(self.map)
+    while offset < end_offset:
+      record = self.read_record(offset)
+      if record is None:
+        return
+      yield record
+      offset += RECORD_HEADER.size + len(record.data)
+
+  def seek(self, wall_ns: int) -> int:
+    """
+    Returns the offset of the first record at or after a wall time, or the end of the log.
+    The records of the index interval before the time are the only ones read.
+    """
+    index = bisect_right(self.time_index_times, wall_ns) - 1
+    offset = self.time_index_offsets[index] if index >= 0 else len(FLIGHT_LOG_MAGIC)
+    for record in self.iterate_records(offset):
+      if record.wall_ns >= wall_ns:
+        return record.offset
+    return len(self.map)
+
+  def read_records(self, start_ns: int = None, end_ns: int = None, apid: int = None):
+    """
+    Yields the records from start_ns up to, but not including, end_ns (wall times), only the packets of an APID if one is given.
+    With an APID, only the index intervals that have a packet of the APID are read.
+    """
+    offset = len(FLIGHT_LOG_MAGIC) if start_ns is None else self.seek(start_ns)
+    if apid is None or not self.time_index:
+      ranges = [(offset, None)]
+    else:
+      # Every APID entry is the first packet of the APID in its interval, the interval ends where the next time entry starts
+      ranges = []
+      for entry_wall_ns, entry_offset in self.apid_index.get(apid, []):
+        next_interval = bisect_right(self.time_index_offsets, entry_offset)
+        interval_end = self.time_index_offsets[next_interval] if next_interval < len(self.time_index_offsets) else None
+        if interval_end is not None and interval_end <= offset:
+          continue
+        ranges.append((max(entry_offset, offset), interval_end))
+
+    for range_start, range_end in ranges:
+      for record in self.iterate_records(range_start, range_end):
+        if end_ns is not None and record.wall_ns >= end_ns:
+          return
+        if apid is not None and (len(record.data) < 2 or peek_ccsds_header(record.data)[0] != apid):
+          continue
+        yield record
+
+  def get_time_range(self) -> tuple:
+    """
+    Returns the wall times of the first and the last indexed interval, or (None, None) for a log without an index.
+    """
+    if not self.time_index:
+      return (None, None)
+    return (self.time_index_times[0], self.time_index_times[-1])
 
 class Logger:
-  def __init__(self) -> None:
+  """
+  Logs telemetry and telecommand packets from a background writer thread, to CSV files, a binary flight log or both (see LOG_FORMATS).
+  Only the CSV files are written by default, like LOG_FILE_FORMATS in the config.
+  The log methods only append the packets and the time to a deque (thread safe without a lock in CPython) and wake the writer,
+  the writer formats them, keeps the files open and writes in batches. close() writes everything left before the program exits.
+  The writer sleeps until a packet is logged or a flush is due, so it never wakes while nothing is logged.
+  Packets are formatted later, so they must not be changed after they are logged.
+  """
+  def __init__(self, fsync_policy: str = "flush", formats: tuple = ("csv",)) -> None:
+    if fsync_policy not in LOG_FSYNC_POLICIES:
+      raise Exception(f"Unknown fsync policy: {fsync_policy}")
+    if not formats:
+      raise Exception(f"At least one log format is needed: {LOG_FORMATS}")
+    for log_format in formats:
+      if log_format not in LOG_FORMATS:
+        raise Exception(f"Unknown log format: {log_format}")
+
     # Get the directory of the current script
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # Create logs folder if it doesn't exist
     logs_dir = os.path.join(script_dir, "..", "logs")
-    
+
     # Create a folder for the current date if it doesn't exist
     time_now = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
     current_date_dir = os.path.join(logs_dir, time_now)
-    
+
     # os.makedirs creates all intermediate-level directories needed to create the leaf directory
     os.makedirs(current_date_dir, exist_ok=True)
-    
+
     # Create log files
     self.telemetry_log_file = os.path.join(current_date_dir, f"telemetry.csv")
     self.telecommand_log_file = os.path.join(current_date_dir, f"telecommand.csv")
+    self.flight_log_file = os.path.join(current_date_dir, f"flight.bin")
+    self.flight_index_file = os.path.join(current_date_dir, f"flight.idx")
+
+    # CSV log files of each direction
+    self.csv_files = {}
+    if "csv" in formats:
+      self.csv_files = {
+        DIRECTION_DOWNLINK: LogFile(self.telemetry_log_file, fsync_policy, CSV_HEADER),
+        DIRECTION_UPLINK: LogFile(self.telecommand_log_file, fsync_policy, CSV_HEADER),
+      }
+    self.flight_log = None
+    if "binary" in formats:
+      self.flight_log = FlightLog(self.flight_log_file, self.flight_index_file, fsync_policy)
+    self.log_files = list(self.csv_files.values()) + ([self.flight_log] if self.flight_log is not None else [])
+
+    # (direction, link id, wall time ns, monotonic time ns, packets) entries waiting for the writer
+    self.entries = deque()
+    # Formatted time of the last second a packet was logged in
+    self.formatted_second = None
+    self.formatted_second_text = ""
+
+    # Statistics
+    self.written_packets = 0
+    self.high_water_mark = 0
+
+    # Set by the log methods to wake the writer, cleared by the writer before it takes the entries
+    self.entries_logged = Event()
+    self.stop_event = Event()
+    self.writer = Thread(target=self.__write_logs, name="Log Writer")
+    self.writer.daemon = True
+    self.writer.start()
+
+  def log_telecommand_data(self, packet_data, link: str):
+    self.entries.append((DIRECTION_UPLINK, LINK_IDS[link], time.time_ns(), time.monotonic_ns(), (packet_data,)))
+    self.__wake_writer()
+
+  def log_telemetry_data(self, packet_data, link: str = "yamcs"):
+    self.entries.append((DIRECTION_DOWNLINK, LINK_IDS[link], time.time_ns(), time.monotonic_ns(), (packet_data,)))
+    self.__wake_writer()
+
+  def log_telemetry_batch(self, packets, link: str = "yamcs"):
+    # The whole batch is one entry with the same time
+    self.entries.append((DIRECTION_DOWNLINK, LINK_IDS[link], time.time_ns(), time.monotonic_ns(), packets))
+    self.__wake_writer()
+
+  def close(self) -> None:
+    """
+    Stops the writer after it has written all logged packets and closes the files.
+    """
+    self.stop_event.set()
+    self.entries_logged.set()
+    self.writer.join()
+
+  def __wake_writer(self) -> None:
+    # Only the first packet logged after the writer took the entries has to take the event lock.
+    # The writer clears the event before it takes the entries, so a packet appended before the clear is still taken.
+    if not self.entries_logged.is_set():
+      self.entries_logged.set()
+
+  def __format_time(self, wall_ns: int) -> str:
+    # Hours, minutes and seconds only change once per second
+    second, nanoseconds = divmod(wall_ns, 1_000_000_000)
+    if second != self.formatted_second:
+      self.formatted_second = second
+      self.formatted_second_text = time.strftime("%H:%M:%S", time.localtime(second))
+    return f"{self.formatted_second_text}.{nanoseconds // 1_000_000:03d}"
+
+  def __take_entries(self, now: float) -> None:
+    entries = self.entries
+    self.high_water_mark = max(self.high_water_mark, len(entries))
+    while entries:
+      direction, link_id, wall_ns, monotonic_ns, packets = entries.popleft()
+      csv_file = self.csv_files.get(direction)
+      if csv_file is not None:
+        time_text = self.__format_time(wall_ns)
+        for packet_data in packets:
+          csv_file.add(f"{time_text},{packet_data.hex()}{LOG_LINE_TERMINATOR}".encode("ascii"), now)
+      if self.flight_log is not None:
+        for packet_data in packets:
+          self.flight_log.add_record(direction, link_id, wall_ns, monotonic_ns, packet_data, now)
+      self.written_packets += len(packets)
+
+  def __write_logs(self) -> None:
+    while True:
+      stopping = self.stop_event.is_set()
+      now = time.monotonic()
+      self.entries_logged.clear()
+      try:
+        self.__take_entries(now)
+        for log_file in self.log_files:
+          if stopping or log_file.is_due(now):
+            log_file.flush(now)
+      except Exception as e:
+        print(f"An error occurred while writing the logs: {e}")
+
+      if stopping:
+        for log_file in self.log_files:
+          log_file.close()
+        return
 
-    header = ["Time", "Packet data"]
-    with open(self.telemetry_log_file, "w", newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-    with open(self.telecommand_log_file, "w", newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-
-
-  def log_telecommand_data(self, packet_data):
-    hex_data = binascii.hexlify(packet_data).decode("utf-8")
-    with open(self.telecommand_log_file, "a", newline='') as file:
-      writer = csv.writer(file)
-      writer.writerow([datetime.now().strftime("%H:%M:%S.%f")[:-3], hex_data])
-  
-  def log_telemetry_data(self, packet_data):
-    hex_data = binascii.hexlify(packet_data).decode("utf-8")
-    with open(self.telemetry_log_file, "a", newline='') as file:
-      writer = csv.writer(file)
-      writer.writerow([datetime.now().strftime("%H:%M:%S.%f")[:-3], hex_data])
-    
\ No newline at end of file
+      # Sleep until a packet is logged or the next flush is due, whichever comes first
+      flush_times = [flush_time for flush_time in (log_file.get_flush_time() for log_file in self.log_files) if flush_time is not None]
+      timeout = max(min(flush_times) - time.monotonic(), 0) if flush_times else None
+      self.entries_logged.wait(timeout)
@@ -4,7 +4,6 @@ import flask
 import folium
 import os
 import pandas as pd
-from time import sleep
 from requests import Session, Request
 from config import *
 from modules.processor import PacketProcessor
@@ -59,6 +58,21 @@ class Map:
       else:
         return jsonify({"status": "error", "message": "Invalid vehicle."})
     
+    @self.app.route("/latency")
+    def latency() -> flask.Response:
+      # Latency percentiles of the packet stages in milliseconds
+      return jsonify(self.processor.latency.get_summary())
+    
+    @self.app.route("/latency/lanes")
+    def lane_latency() -> flask.Response:
+      # Latency percentiles of each lane of the received messages in milliseconds
+      return jsonify(self.processor.latency.get_lane_summary())
+    
+    @self.app.route("/telemetry/xtce")
+    def xtce_telemetry() -> flask.Response:
+      # Latest values of the telemetry decoded with the mission database (see DECODE_XTCE_TELEMETRY in config.py)
+      return jsonify(self.processor.get_xtce_telemetry())
+    
     
   def run_server(self) -> None:
     self.app.run(port=self.port, host="0.0.0.0", debug=False, use_reloader=False)
@@ -66,7 +80,6 @@ class Map:
   def update_map(self) -> None:
     if self.map_update_required:
       self.create_map()
-    sleep(0.1)
   
   def add_coordinates_to_map(self, coordinates, start_color, end_color, line_color, tooltip):
     if coordinates:
@@ -4,20 +4,34 @@ from config import *
 from modules.calculations import *
 from modules.ccsds import *
 from modules.connection_manager import ConnectionManager 
+from modules.decoders import compile_telemetry_decoders, compile_telecommand_decoders, read_packet_id
+from modules.dispatch import DispatchTable, get_apids
+from modules.events import EventBus
+from modules.lanes import get_packet_lane
+from modules.reorder import ReorderBuffer
 from modules.rotator import Rotator
+from modules.xtce import XtceSchema
 
 class PacketProcessor:
   def __init__(self, 
          connection_manager: ConnectionManager,
-         rotator: Rotator) -> None:
+         rotator: Rotator,
+         events: EventBus = None) -> None:
     # Objects
     self.connection_manager = connection_manager
     self.rotator = rotator
     
+    # Change notifications, shared with the rotator unless another event bus is given
+    self.events = events if events is not None else rotator.events
+    
+    # Telemetry and telecommand decoders, compiled once from the message structures
+    self.telemetry_decoders = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)
+    self.telecommand_decoders = compile_telecommand_decoders(PACKETID_TO_TYPE, TELECOMMAND_MESSAGE_STRUCTURE, TELECOMMAND_APID, LITTLE_ENDIAN_TELECOMMANDS)
+    
     # Telemetry
-    self.pfc_telemetry = {value: 0.0 for type, value in TELEMETRY_MESSAGE_STRUCTURE["pfc"]}
-    self.bfc_telemetry = {value: 0.0 for type, value in TELEMETRY_MESSAGE_STRUCTURE["bfc"]}
-    self.rotator_telemetry = {value: 0.0 for type, value in TELEMETRY_MESSAGE_STRUCTURE["rotator"]}
+    self.pfc_telemetry = self.telemetry_decoders["pfc"].empty()
+    self.bfc_telemetry = self.telemetry_decoders["bfc"].empty()
+    self.rotator_telemetry = self.telemetry_decoders["rotator"].empty()
     
     # Timing
     self.last_pfc_telemetry_epoch_seconds = 0
@@ -29,141 +43,279 @@ class PacketProcessor:
     self.bfc_packet_received_time = 0
     self.rotator_packet_received_time = 0
     
+    # Essential telemetry of each vehicle updates the calculations in epoch time order when reordering is enabled
+    self.telemetry_updates = {
+      "pfc": (self.__update_pfc_telemetry, "pfc_telemetry"),
+      "bfc": (self.__update_bfc_telemetry, "bfc_telemetry"),
+    }
+    self.reorder_buffers = {}
+    if REORDER_TELEMETRY:
+      self.reorder_buffers = {vehicle: ReorderBuffer(REORDER_HOLD_TIME) for vehicle in self.telemetry_updates}
+    
     # Calculations
     self.pfc_calculations = dict.fromkeys(CALCULATION_MESSAGE_STRUCTURE["pfc"], 0.0)
     self.bfc_calculations = dict.fromkeys(CALCULATION_MESSAGE_STRUCTURE["bfc"], 0.0)
     self.rotator_calculations = dict.fromkeys(CALCULATION_MESSAGE_STRUCTURE["rotator"], 0.0)
-    self.pfc_calculations_index = 0
-    self.bfc_calculations_index = 0
-    self.rotator_calculations_index = 0
     
-    # Queues
-    self.processed_packets = queue.Queue()
+    # Packet builder, keeps the sequence counts of all packets created by the ground station
+    self.packet_builder = PacketBuilder()
+    self.pfc_calculations_apid = get_apids("pfc_calculations")[0]
+    self.bfc_calculations_apid = get_apids("bfc_calculations")[0]
+    self.rotator_position_apid = get_apids("rotator_position")[0]
+    
+    # Dispatch tables, compiled once from config
+    # Packets without a handler have no local consumer and are only forwarded to YAMCS
+    self.dispatch = DispatchTable()
+    self.dispatch.register_packet_type_handler("pfc_essential", self.__handle_pfc_essential)
+    self.dispatch.register_packet_type_handler("bfc_essential", self.__handle_bfc_essential)
+    self.dispatch.register_packet_type_handler("rotator_position", self.__handle_rotator_position)
+    
+    # Telecommands not processed by the ground station are sent to the transceiver that handles the vehicle
+    self.telecommand_destinations = {TELECOMMAND_APID["bfc"]: "primary", TELECOMMAND_APID["pfc"]: "secondary"}
+    for apid in TELECOMMAND_APID.values():
+      self.dispatch.register_apid_handler(apid, self.__handle_telecommand)
+    
+    # Statistics
+    self.unknown_telecommands = 0
+    self.short_telecommands = 0
+    
+    # Rotator commands are processed by the ground station
+    self.dispatch.register_packet_id_handler("rotator_set_target_request", self.__set_rotator_target)
+    self.dispatch.register_packet_id_handler("rotator_auto_tracking_request", self.__set_rotator_auto_tracking)
+    self.dispatch.register_packet_id_handler("rotator_auto_rotator_position_request", self.__set_rotator_auto_position)
+    self.dispatch.register_packet_id_handler("rotator_manual_rotator_position_request", self.__set_rotator_manual_position)
+    self.dispatch.register_packet_id_handler("rotator_manual_angles_request", self.__set_rotator_manual_angles)
+    self.dispatch.register_packet_id_handler("rotator_manual_target_coordinates_request", self.__set_rotator_manual_target)
+    
+    # Decoders and encoders for every container and command of the Yamcs mission database
+    # Telemetry in APID_TO_TYPE without another handler is decoded with its container into xtce_telemetry, by packet type, before it is sent to YAMCS
+    self.xtce_telemetry = {}
+    self.xtce = None
+    if DECODE_XTCE_TELEMETRY:
+      try:
+        self.xtce = XtceSchema(XTCE_FILE, XTCE_CACHE_FILE)
+      except Exception as e:
+        print(f"Error loading the XTCE mission database: {e}")
+    if self.xtce is not None:
+      for apid in APID_TO_TYPE:
+        if self.xtce.get_container(apid) is not None and self.dispatch.get_apid_handler(apid) is None:
+          self.dispatch.register_apid_handler(apid, self.__handle_xtce_telemetry)
+    
+    # Latency trace of the packet being processed, packets routed to YAMCS carry its received time
+    self.latency = connection_manager.latency
+    self.packet_received_time = None
+    self.packet_decoded_time = None
+    
+    # Route table, processed packets are delivered straight to the queue or outbox of their destination
+    self.create_routes()
+  
+  def create_routes(self) -> None:
+    """
+    Creates the route table from the destination of a packet to the function that delivers it.
+    Called again by the async runtime after it replaces the queues.
+    """
+    self.routes = {
+      "yamcs": self.__send_to_yamcs,
+      "primary": self.connection_manager.schedule_telecommand,
+      "secondary": self.connection_manager.schedule_telecommand,
+    }
+  
+  def route_packet(self, packet) -> None:
+    """
+    Delivers a (wait_for_cycle, destination, data) packet to its destination.
+    """
+    self.routes[packet[1]](packet)
   
   def process_packet(self) -> None:
+    # Wait at most until the next held packet is released
+    wait_time = self.get_reorder_wait_time()
     try:
-      packet = self.connection_manager.received_messages.get(timeout=1)
+      packet = self.connection_manager.received_messages.get(timeout=1 if wait_time is None else min(wait_time, 1))
     except queue.Empty:
+      self.release_reordered_telemetry()
       return
     
+    self.handle_packet(packet)
+    self.connection_manager.received_messages.task_done()
+    self.release_reordered_telemetry()
+  
+  def get_reorder_wait_time(self):
+    """
+    Returns the seconds until the next held telemetry packet is released, or None if none are held.
+    """
+    now = time.monotonic()
+    wait_times = [wait_time for wait_time in (buffer.get_wait_time(now) for buffer in self.reorder_buffers.values()) if wait_time is not None]
+    return min(wait_times) if wait_times else None
+  
+  def release_reordered_telemetry(self) -> None:
+    """
+    Updates the telemetry and calculations with the held packets whose hold time is over, used by both runtimes.
+    """
+    now = time.monotonic()
+    for vehicle, buffer in self.reorder_buffers.items():
+      for (epoch_seconds, epoch_subseconds), packet_data in buffer.take_due(now):
+        self.__update_vehicle_telemetry(vehicle, packet_data, epoch_seconds, epoch_subseconds)
+  
+  def handle_packet(self, packet) -> None:
+    """
+    Processes a (wait_for_cycle, destination, data, received time) packet from the received messages, used by both runtimes.
+    """
+    dequeued_time = time.monotonic()
+    self.packet_received_time = packet[3]
+    self.latency.record("queue", dequeued_time - packet[3])
+    lane = get_packet_lane(packet)
+    self.latency.record_lane(lane, "queue", dequeued_time - packet[3])
     try:
+      # Peek at the APID and packet type, telemetry without a local consumer is sent to YAMCS without decoding
+      apid, packet_type = peek_ccsds_header(packet[2])
+      handler = self.dispatch.get_apid_handler(apid)
+      if handler is None:
+        if packet_type == 0 and len(packet[2]) >= PRIMARY_HEADER.size + SECONDARY_HEADER.size:
+          self.__set_decoded(dequeued_time)
+          self.__forward_to_yamcs(packet[2])
+          return
+        handler = self.__forward_to_yamcs_after_decoding
+      
       parsed = parse_ccsds_packet(packet[2])
       if parsed is None:
         raise Exception("Invalid ccsds packet")
       
+      self.__set_decoded(dequeued_time)
       apid, epoch_seconds, epoch_subseconds, packet_data = parsed
       print(f"APID: {apid}, Epoch Seconds: {epoch_seconds}, Epoch Subseconds: {epoch_subseconds}")
-      # If the packet is a telecommand
-      if apid in TELECOMMAND_APID.values():
-        # Get packet id, which is the first 16 bits of the packet data
-        packet_id = int(packet_data[:16], 2)
-        packet_data = packet_data[16:]
-        
-        # If the packet is meant for the rotator, process it, else put it in the processed packets queue
-        if not self.__process_rotator_command(packet_id, packet_data):
-          if apid == TELECOMMAND_APID["bfc"]:
-            self.processed_packets.put((True, "primary", packet[2]))
-          elif apid == TELECOMMAND_APID["pfc"]:
-            self.processed_packets.put((True, "secondary", packet[2]))
-
-          self.connection_manager.received_messages.task_done()
-          return
-
-      # Update telemetry from essential packets
-      elif apid in [key for key, value in APID_TO_TYPE.items() if value == "pfc_essential"]:
-        self.pfc_packet_received_time = time.time()
-        self.__update_pfc_telemetry(packet_data, epoch_seconds, epoch_subseconds)
-      elif apid in [key for key, value in APID_TO_TYPE.items() if value == "bfc_essential"]:
-        self.bfc_packet_received_time = time.time()
-        self.__update_bfc_telemetry(packet_data, epoch_seconds, epoch_subseconds)
-      elif apid in [key for key, value in APID_TO_TYPE.items() if value == "rotator_position"]:
-        self.rotator_packet_received_time = time.time()
-        self.__update_rotator_telemetry(packet_data)
-        
-      self.processed_packets.put((False, "yamcs", packet[2]))
-            
-      # Complete the task
-      self.connection_manager.received_messages.task_done()
+      handler(packet[2], apid, epoch_seconds, epoch_subseconds, packet_data)
                     
     except Exception as e:
-      self.connection_manager.received_messages.task_done()
       print(f"An error occurred while processing packet: {e}")
+    finally:
+      self.latency.record_lane(lane, "handled", time.monotonic() - packet[3])
+      self.packet_received_time = None
+      self.packet_decoded_time = None
+  
+  def __set_decoded(self, dequeued_time: float) -> None:
+    self.packet_decoded_time = time.monotonic()
+    self.latency.record("decode", self.packet_decoded_time - dequeued_time)
+  
+  def __send_to_yamcs(self, packet) -> None:
+    """
+    Puts a packet in the YAMCS sender queue with the received time of the packet being processed and the time it was routed.
+    """
+    routed_time = time.monotonic()
+    if self.packet_decoded_time is not None:
+      self.latency.record("process", routed_time - self.packet_decoded_time)
+    self.connection_manager.sendable_to_yamcs_messages.put((packet[0], packet[1], packet[2], self.packet_received_time, routed_time))
+  
+  def __forward_to_yamcs(self, packet) -> None:
+    self.routes["yamcs"]((False, "yamcs", packet))
+  
+  # APID HANDLERS
+  def __forward_to_yamcs_after_decoding(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    self.__forward_to_yamcs(packet)
   
-  def __process_rotator_command(self, packet_id: int, packet_data) -> bool:
+  def __handle_pfc_essential(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    self.pfc_packet_received_time = time.time()
+    self.__handle_essential_telemetry("pfc", packet, epoch_seconds, epoch_subseconds, packet_data)
+  
+  def __handle_bfc_essential(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    self.bfc_packet_received_time = time.time()
+    self.__handle_essential_telemetry("bfc", packet, epoch_seconds, epoch_subseconds, packet_data)
+  
+  def __handle_essential_telemetry(self, vehicle, packet, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    buffer = self.reorder_buffers.get(vehicle)
+    if buffer is None:
+      self.__update_vehicle_telemetry(vehicle, packet_data, epoch_seconds, epoch_subseconds)
+      self.route_packet((False, "yamcs", packet))
+      return
+    
+    # Held packets are sent to YAMCS right away, late packets are only sent to YAMCS
+    buffer.add((epoch_seconds, epoch_subseconds), packet_data, time.monotonic())
+    self.route_packet((False, "yamcs", packet))
+  
+  def __update_vehicle_telemetry(self, vehicle, packet_data, epoch_seconds, epoch_subseconds) -> None:
+    update, topic = self.telemetry_updates[vehicle]
+    update(packet_data, epoch_seconds, epoch_subseconds)
+    self.events.publish(topic)
+  
+  def __handle_rotator_position(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    self.rotator_packet_received_time = time.time()
+    self.__update_rotator_telemetry(packet_data)
+    self.events.publish("rotator_telemetry")
+    self.route_packet((False, "yamcs", packet))
+  
+  def get_xtce_telemetry(self) -> dict:
+    """
+    Returns the latest values of every packet type decoded with the XTCE mission database, with strings decoded so they can be sent as JSON.
+    """
+    return {packet_type: {field: value.decode(errors="replace") if isinstance(value, bytes) else value for field, value in record.items()}
+            for packet_type, record in list(self.xtce_telemetry.items())}
+  
+  def __handle_xtce_telemetry(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    container = self.xtce.get_container(apid)
     try:
-      # Set target PFC
-      if packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_set_target_request"][0]:
-        target = binary_to_int(packet_data[:8])
-        if target == 0:
-          self.rotator.set_target("pfc")
-        elif target == 1:
-          self.rotator.set_target("bfc")
-        return True
-            
-      # Set rotator to auto tracking mode
-      elif packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_auto_tracking_request"][0]:
-        self.rotator.set_control_mode("auto")
-        return True
-        
-      # Set rotator to auto rotator position mode
-      elif packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_auto_rotator_position_request"][0]:
-        self.rotator.set_rotator_position_mode("auto")
-        return True
-      
-      # Set rotator to manual rotator position mode
-      elif packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_manual_rotator_position_request"][0]:
-        latitude = binary_to_float(packet_data[:32])
-        longitude = binary_to_float(packet_data[32:64])
-        altitude = binary_to_float(packet_data[64:96])
-        self.rotator.set_manual_rotator_position(latitude, longitude, altitude)
-        return True
-      
-      # Set rotator to manual angles mode
-      elif packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_manual_angles_request"][0]:
-        azimuth = binary_to_float(packet_data[:32])
-        elevation = binary_to_float(packet_data[32:64])
-        self.rotator.set_manual_angles(azimuth, elevation)
-        return True
-        
-      # Set rotator to manual target coordinates mode
-      elif packet_id == [key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_manual_target_coordinates_request"][0]: 
-        latitude = binary_to_float(packet_data[:32])
-        longitude = binary_to_float(packet_data[32:64])
-        altitude = binary_to_float(packet_data[64:96])
-        self.rotator.set_manual_target_position(latitude, longitude, altitude)
-        return True
-
+      self.xtce_telemetry[APID_TO_TYPE[apid]] = container.decode(packet_data)
+    except Exception as e:
+      print(f"Error decoding {APID_TO_TYPE[apid]} telemetry: {e}")
+    self.__forward_to_yamcs(packet)
+  
+  def __handle_telecommand(self, packet, apid, epoch_seconds, epoch_subseconds, packet_data) -> None:
+    # Get packet id, which is the first 2 bytes of the packet data
+    packet_id = read_packet_id(packet_data)
+    
+    # Telecommands that are unknown or too short for their arguments are counted and sent to the vehicles unchanged
+    decoder = self.telecommand_decoders.get(packet_id)
+    if decoder is None or decoder.apid != apid:
+      self.unknown_telecommands += 1
+    elif not decoder.validate(packet_data, 2):
+      self.short_telecommands += 1
+    # If the packet is meant for the ground station, process it, else put it in the processed packets queue
+    elif self.__process_telecommand(packet_id, decoder.decode(packet_data, 2)):
+      return
+    
+    destination = self.telecommand_destinations.get(apid)
+    if destination is not None:
+      self.route_packet((True, destination, packet))
+  
+  def __process_telecommand(self, packet_id: int, arguments) -> bool:
+    handler = self.dispatch.get_packet_id_handler(packet_id)
+    if handler is None:
       return False
-      
+    
+    try:
+      handler(arguments)
+      return True
     except Exception as e:
       print(f"Error processing rotator command: {e}")
-      return False  
-  
-  def __convert_binary_to_telemetry(self, packet_data, telemetry_type: str):
-    """
-    Converts binary packet data to telemetry data.
-    """
-    new_telemetry = {}
-    start = 0
-    for data_type, data_value in TELEMETRY_MESSAGE_STRUCTURE[telemetry_type]:
-        if data_type == "float":
-            end = start + 32
-            new_telemetry[data_value] = binary_to_float(packet_data[start:end])
-            start = end
-        elif data_type == "int":
-            end = start + 32
-            new_telemetry[data_value] = binary_to_int(packet_data[start:end])
-            start = end
-        else:
-            raise Exception(f"Invalid data type: {data_type} and {data_value}")
-    return new_telemetry
+      return False
+  
+  # PACKET ID HANDLERS
+  # Handlers get the arguments decoded by the telecommand decoders
+  def __set_rotator_target(self, arguments) -> None:
+    if arguments.target == 0:
+      self.rotator.set_target("pfc")
+    elif arguments.target == 1:
+      self.rotator.set_target("bfc")
+  
+  def __set_rotator_auto_tracking(self, arguments) -> None:
+    self.rotator.set_control_mode("auto")
+  
+  def __set_rotator_auto_position(self, arguments) -> None:
+    self.rotator.set_rotator_position_mode("auto")
+  
+  def __set_rotator_manual_position(self, arguments) -> None:
+    self.rotator.set_manual_rotator_position(arguments.latitude, arguments.longitude, arguments.altitude)
+  
+  def __set_rotator_manual_angles(self, arguments) -> None:
+    self.rotator.set_manual_angles(arguments.azimuth, arguments.elevation)
+  
+  def __set_rotator_manual_target(self, arguments) -> None:
+    self.rotator.set_manual_target_position(arguments.latitude, arguments.longitude, arguments.altitude)
   
   def __update_pfc_telemetry(self, packet_data, epoch_seconds, epoch_subseconds) -> None:
     """
     Updates the PFC telemetry data.
     """
     try:
-        new_telemetry = self.__convert_binary_to_telemetry(packet_data, "pfc")
+        new_telemetry = self.telemetry_decoders["pfc"].decode(packet_data)
         
         # PFC essential telemetry
         old_pfc_telemetry_epoch_seconds = self.last_pfc_telemetry_epoch_seconds
@@ -179,15 +331,8 @@ class PacketProcessor:
             self.pfc_calculations = calculate_flight_computer_extra_telemetry(self.pfc_telemetry, new_telemetry, self.rotator.rotator_position, time_delta, CALCULATION_MESSAGE_STRUCTURE["pfc"])
         
         # Create a ccsds packet from the calculations
-        apid = [key for key, value in APID_TO_TYPE.items() if value == "pfc_calculations"][0]
-        message = ",".join([str(x) for x in self.pfc_calculations.values()]) 
-        ccsds = convert_message_to_ccsds(apid, self.pfc_calculations_index, message)
-        
-        if ccsds is None:
-            raise Exception("Invalid ccsds packet created")
-        
-        self.processed_packets.put((False, "yamcs", ccsds))
-        self.pfc_calculations_index += 1
+        ccsds = self.packet_builder.build_telemetry(self.pfc_calculations_apid, tuple(self.pfc_calculations.values()))
+        self.route_packet((False, "yamcs", ccsds))
         self.pfc_telemetry = new_telemetry
 
     except Exception as e:
@@ -195,7 +340,7 @@ class PacketProcessor:
       
   def __update_bfc_telemetry(self, packet_data, epoch_seconds, epoch_subseconds) -> None:
     try:
-      new_telemetry = self.__convert_binary_to_telemetry(packet_data, "bfc")
+      new_telemetry = self.telemetry_decoders["bfc"].decode(packet_data)
         
       # BFC essential telemetry
       old_bfc_telemetry_epoch_seconds = self.last_bfc_telemetry_epoch_seconds
@@ -211,15 +356,8 @@ class PacketProcessor:
         self.bfc_calculations = calculate_flight_computer_extra_telemetry(self.bfc_telemetry, new_telemetry, self.rotator.rotator_position, time_delta, CALCULATION_MESSAGE_STRUCTURE["bfc"])
         
       # Create a ccsds packet from the calculations
-      apid = [key for key, value in APID_TO_TYPE.items() if value == "bfc_calculations"][0]
-      message = ",".join([str(x) for x in self.bfc_calculations.values()]) 
-      ccsds = convert_message_to_ccsds(apid, self.bfc_calculations_index, message)
-      
-      if ccsds is None:
-        raise Exception("Invalid ccsds packet created")
-      
-      self.processed_packets.put((False, "yamcs", ccsds))
-      self.bfc_calculations_index += 1
+      ccsds = self.packet_builder.build_telemetry(self.bfc_calculations_apid, tuple(self.bfc_calculations.values()))
+      self.route_packet((False, "yamcs", ccsds))
       self.bfc_telemetry = new_telemetry
         
     except Exception as e:
@@ -227,18 +365,11 @@ class PacketProcessor:
       
   def __update_rotator_telemetry(self, packet_data) -> None:
     try:
-      new_telemetry = self.__convert_binary_to_telemetry(packet_data, "rotator")
+      new_telemetry = self.telemetry_decoders["rotator"].decode(packet_data)
         
       # Create a ccsds packet from the rotator position
-      apid = [key for key, value in APID_TO_TYPE.items() if value == "rotator_position"][0]
-      message = ",".join([str(x) for x in new_telemetry.values()])
-      ccsds = convert_message_to_ccsds(apid, self.rotator_calculations_index, message)
-      
-      if ccsds is None:
-        raise Exception("Invalid ccsds packet created")
-      
-      self.processed_packets.put((False, "yamcs", ccsds))
-      self.rotator_calculations_index += 1        
+      ccsds = self.packet_builder.build_telemetry(self.rotator_position_apid, new_telemetry)
+      self.route_packet((False, "yamcs", ccsds))
       self.rotator_telemetry = new_telemetry
       
     except Exception as e:
@@ -0,0 +1,84 @@
+import heapq
+import itertools
+from collections import deque, namedtuple
+
+# Heap entry of a reorder buffer, ordered by epoch time and then by the order the packets arrived in
+HeldPacket = namedtuple("HeldPacket", ["epoch_time", "sequence", "release_time", "item"])
+
+class ReorderBuffer:
+  """
+  Releases the packets of one source in epoch time order.
+  Every packet is held for hold_time seconds after it arrives, so packets delayed by the other transceiver or a replayed log
+  can overtake it. When the hold time of a packet is over it is released together with all held packets older than it.
+  Packets not newer than the last released packet are late: they are not held, and the caller decides what to do with them.
+  Every method is O(1) apart from the heap pushes and pops.
+  """
+  def __init__(self, hold_time: float) -> None:
+    self.hold_time = hold_time
+    self.packets = []
+    # (release time, epoch time) of the held packets in arrival order. Release times only increase, so the first one is released next.
+    # Entries of packets released together with a newer packet are removed once they reach the front.
+    self.release_times = deque()
+    # Epoch time of the newest held packet, None if no packets are held
+    self.newest_time = None
+    self.sequence = itertools.count()
+    self.last_released_time = None
+
+    # Statistics
+    self.held_packets = 0
+    self.reordered_packets = 0
+    self.late_packets = 0
+    self.high_water_mark = 0
+
+  def add(self, epoch_time: tuple, item, now: float) -> bool:
+    """
+    Holds an item with its (epoch seconds, epoch subseconds), returns False if it is late.
+    """
+    if self.last_released_time is not None and epoch_time <= self.last_released_time:
+      self.late_packets += 1
+      return False
+
+    # An item overtakes the held items newer than it
+    if self.newest_time is not None and epoch_time < self.newest_time:
+      self.reordered_packets += 1
+    else:
+      self.newest_time = epoch_time
+    release_time = now + self.hold_time
+    heapq.heappush(self.packets, HeldPacket(epoch_time, next(self.sequence), release_time, item))
+    self.release_times.append((release_time, epoch_time))
+    self.held_packets += 1
+    self.high_water_mark = max(self.high_water_mark, len(self.packets))
+    return True
+
+  def get_wait_time(self, now: float):
+    """
+    Returns the seconds until the next item is released, or None if no items are held.
+    """
+    if not self.release_times:
+      return None
+    return max(0.0, self.release_times[0][0] - now)
+
+  def take_due(self, now: float) -> list:
+    """
+    Removes and returns the (epoch time, item) of the released items, oldest first.
+    """
+    release_times = self.release_times
+    release_until = None
+    while release_times and release_times[0][0] <= now:
+      epoch_time = release_times.popleft()[1]
+      if release_until is None or epoch_time > release_until:
+        release_until = epoch_time
+    if release_until is None:
+      return []
+
+    due = []
+    while self.packets and self.packets[0].epoch_time <= release_until:
+      packet = heapq.heappop(self.packets)
+      due.append((packet.epoch_time, packet.item))
+    self.last_released_time = release_until
+    # Drop the entries of the packets released with this one, so the first entry is the next packet to release
+    while release_times and release_times[0][1] <= release_until:
+      release_times.popleft()
+    if not self.packets:
+      self.newest_time = None
+    return due
@@ -0,0 +1,177 @@
+from collections import namedtuple
+from datetime import datetime
+import os
+import socket
+import time
+
+from tabulate import tabulate
+
+from config import *
+from modules.ccsds import peek_ccsds_header
+from modules.connection_manager import ConnectionManager
+from modules.dispatch import get_apids
+from modules.logging import DIRECTION_DOWNLINK, FlightLogReader
+
+# Where the replayed packets go
+# "queue" - straight into the received messages, like packets the transceivers received
+# "udp" - to the telemetry port of a transceiver, so the receiver, the duplicate filter and the batching are also replayed.
+# The primary transceiver receiver prints every packet, so the secondary one is used by default.
+REPLAY_TARGETS = ("queue", "udp")
+REPLAY_UDP_ADDRESSES = {
+  "primary": TRANSCEIVER_TM_ADDRESS,
+  "secondary": SECONDARY_TRANSCEIVER_TM_ADDRESS,
+}
+# The processor builds these packets from the essential telemetry, so their logged copies are not replayed
+GENERATED_PACKET_TYPES = ("pfc_calculations", "bfc_calculations", "rotator_calculations")
+GENERATED_APIDS = frozenset(apid for packet_type in GENERATED_PACKET_TYPES for apid in get_apids(packet_type))
+
+# The replayer sleeps when it is more than REPLAY_SLEEP_THRESHOLD seconds ahead of the log
+REPLAY_SLEEP_THRESHOLD = 0.001
+# After the last packet, the pipeline is drained when its queues are empty and nothing was sent to YAMCS for REPLAY_DRAIN_IDLE seconds
+REPLAY_DRAIN_IDLE = 0.5
+REPLAY_DRAIN_TIMEOUT = 30
+
+ReplayPacket = namedtuple("ReplayPacket", ["time", "data"])
+
+def read_logged_telemetry(path: str) -> list:
+  """
+  Returns the telemetry of a log folder written by Logger, or of one of its log files, as ReplayPackets with the time in seconds.
+  The binary flight log is used if there is one, its monotonic times are exact. The CSV log only has the time of day in milliseconds.
+  """
+  if os.path.isdir(path):
+    if os.path.exists(os.path.join(path, "flight.bin")):
+      path = os.path.join(path, "flight.bin")
+    else:
+      path = os.path.join(path, "telemetry.csv")
+
+  if path.endswith(".bin"):
+    with FlightLogReader(path) as reader:
+      packets = [ReplayPacket(record.monotonic_ns / 1e9, bytes(record.data)) for record in reader.read_records() if record.direction == DIRECTION_DOWNLINK]
+  else:
+    packets = []
+    day_offset = 0
+    with open(path, "r") as file:
+      next(file)
+      for line in file:
+        time_text, packet_hex = line.strip().split(",")
+        logged_time = datetime.strptime(time_text, "%H:%M:%S.%f")
+        seconds = logged_time.hour * 3600 + logged_time.minute * 60 + logged_time.second + logged_time.microsecond / 1e6 + day_offset
+        # The log went past midnight
+        if packets and seconds < packets[-1].time - 43200:
+          day_offset += 86400
+          seconds += 86400
+        packets.append(ReplayPacket(seconds, bytes.fromhex(packet_hex)))
+
+  return [packet for packet in packets if len(packet.data) < 2 or peek_ccsds_header(packet.data)[0] not in GENERATED_APIDS]
+
+class LogReplayer:
+  """
+  Replays logged telemetry through the packet processor and the routing, for load and regression testing.
+  Packets are sent with the intervals of the log divided by the speed, or as fast as possible with speed 0.
+  The latencies are those of the connection manager, so the ground station should not receive anything else during a replay.
+  """
+  def __init__(self, connection_manager: ConnectionManager, target: str = "queue", speed: float = 1, transceiver: str = "secondary") -> None:
+    if target not in REPLAY_TARGETS:
+      raise Exception(f"Unknown replay target: {target}")
+    self.connection_manager = connection_manager
+    self.target = target
+    self.speed = speed
+    self.transceiver = transceiver
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if target == "udp" else None
+
+    # Statistics
+    self.replayed_packets = 0
+    self.max_lag = 0.0
+    self.start_time = 0.0
+    self.replay_end_time = 0.0
+    self.drained_time = 0.0
+    self.first_sent_count = 0
+
+  def replay(self, packets: list, stop_event=None) -> None:
+    """
+    Sends the packets on their schedule, then waits until the pipeline has sent everything it is going to send to YAMCS.
+    """
+    latency = self.connection_manager.latency
+    self.first_sent_count = latency.histograms["total"].count
+    self.start_time = time.monotonic()
+    first_packet_time = packets[0].time if packets else 0.0
+
+    for packet in packets:
+      if stop_event is not None and stop_event.is_set():
+        break
+      if self.speed > 0:
+        # Lag is how far the replayer is behind the log, when the pipeline pushes back or the replayer is too slow
+        due_time = self.start_time + (packet.time - first_packet_time) / self.speed
+        now = time.monotonic()
+        if due_time - now > REPLAY_SLEEP_THRESHOLD:
+          time.sleep(due_time - now)
+        else:
+          self.max_lag = max(self.max_lag, now - due_time)
+      self.__send(packet.data)
+      self.replayed_packets += 1
+    self.replay_end_time = time.monotonic()
+
+    self.__wait_until_drained()
+
+  def __send(self, data: bytes) -> None:
+    if self.target == "udp":
+      self.socket.sendto(data, REPLAY_UDP_ADDRESSES[self.transceiver])
+    else:
+      self.connection_manager.received_messages.put((False, "yamcs", data, time.monotonic()))
+
+  def __wait_until_drained(self) -> None:
+    connection_manager = self.connection_manager
+    total_histogram = connection_manager.latency.histograms["total"]
+    sent_count = total_histogram.count
+    last_sent_time = time.monotonic()
+    self.drained_time = last_sent_time
+    while time.monotonic() - self.replay_end_time < REPLAY_DRAIN_TIMEOUT:
+      time.sleep(0.05)
+      now = time.monotonic()
+      if total_histogram.count != sent_count:
+        sent_count = total_histogram.count
+        last_sent_time = now
+        self.drained_time = now
+      queues_empty = connection_manager.received_messages.qsize() == 0 and connection_manager.sendable_to_yamcs_messages.qsize() == 0
+      if queues_empty and now - last_sent_time >= REPLAY_DRAIN_IDLE:
+        return
+    print(f"The pipeline did not drain in {REPLAY_DRAIN_TIMEOUT} seconds, the report only includes the packets sent until then.")
+
+  def get_report(self) -> dict:
+    connection_manager = self.connection_manager
+    sent_packets = connection_manager.latency.histograms["total"].count - self.first_sent_count
+    replay_duration = self.replay_end_time - self.start_time
+    pipeline_duration = self.drained_time - self.start_time
+    return {
+      "replayed_packets": self.replayed_packets,
+      "replay_duration": replay_duration,
+      "replay_rate": self.replayed_packets / replay_duration if replay_duration > 0 else 0.0,
+      "max_lag": self.max_lag,
+      "sent_packets": sent_packets,
+      "pipeline_duration": pipeline_duration,
+      "sent_rate": sent_packets / pipeline_duration if pipeline_duration > 0 else 0.0,
+      "duplicate_packets": sum(connection_manager.duplicate_filter.duplicate_packets.values()),
+      "received_messages_dropped": connection_manager.received_messages.dropped,
+      "sendable_to_yamcs_dropped": connection_manager.sendable_to_yamcs_messages.dropped,
+      "received_messages_high_water_mark": connection_manager.received_messages.high_water_mark,
+      "latency": connection_manager.latency.get_summary(),
+      "lane_latency": connection_manager.latency.get_lane_summary(),
+    }
+
+  def print_report(self) -> None:
+    report = self.get_report()
+    speed = f"{self.speed:g}x" if self.speed > 0 else "as fast as possible"
+
+    headers = ["Target", "Speed", "Replayed", "Replay Rate (pkt/s)", "Max Lag (s)", "Sent to YAMCS", "Sent Rate (pkt/s)", "Duplicates", "Dropped (received / YAMCS)", "Received High Water Mark"]
+    table = [[self.target, speed, report["replayed_packets"], f"{report['replay_rate']:.0f}", f"{report['max_lag']:.3f}", report["sent_packets"], f"{report['sent_rate']:.0f}",
+              report["duplicate_packets"], f"{report['received_messages_dropped']} / {report['sendable_to_yamcs_dropped']}", report["received_messages_high_water_mark"]]]
+    print("Replay")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+
+    headers = ["Stage", "Packets", "Mean (ms)", "p50 (ms)", "p90 (ms)", "p99 (ms)", "p99.9 (ms)", "Max (ms)"]
+    table = [[stage, summary["count"]] + [f"{summary[key]:.2f}" for key in ("mean", "p50", "p90", "p99", "p99.9", "max")] for stage, summary in report["latency"].items()]
+    for lane, stages in report["lane_latency"].items():
+      for stage, summary in stages.items():
+        table.append([f"{lane} {stage}", summary["count"]] + [f"{summary[key]:.2f}" for key in ("mean", "p50", "p90", "p99", "p99.9", "max")])
+    print("Replay Latency")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
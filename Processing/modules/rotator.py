@@ -1,10 +1,14 @@
 import numpy as np
 from astropy.coordinates import EarthLocation
-from time import sleep
 import math
 
+from modules.events import EventBus
+
 class Rotator:
-  def __init__(self):
+  def __init__(self, events: EventBus = None):
+    # Change notifications
+    self.events = events if events is not None else EventBus()
+    
     # Control
     self.rotator_target = "pfc"
     self.rotator_control_mode = "auto"
@@ -21,7 +25,6 @@ class Rotator:
     # Commands
     self.rotator_command = ""
     self.rotator_last_command = ""
-    self.rotator_command_index = 1
     
   def control_rotator(self) -> None:
     # Check if new angles are required
@@ -29,7 +32,10 @@ class Rotator:
       self.calculate_rotator_angles()
       self.create_rotator_command()
       self.new_angles_required = False
-    sleep(0.1)
+  
+  def __require_new_angles(self) -> None:
+    self.new_angles_required = True
+    self.events.publish("rotator_angles_required")
 
   def calculate_rotator_angles(self) -> None:
     # Refrences: 
@@ -90,18 +96,22 @@ class Rotator:
   def create_rotator_command(self) -> None:
     self.rotator_last_command = self.rotator_command
     self.rotator_command = f"{self.rotator_angles['azimuth']},{self.rotator_angles['elevation']}"
+    self.events.publish("rotator_command")
     
   def set_target(self, target) -> None:
     print(f"Setting rotator target from {self.rotator_target} to {target}")
     self.rotator_target = target
+    self.events.publish("rotator_settings")
     
   def set_control_mode(self, mode) -> None:
     print(f"Setting rotator control from {self.rotator_control_mode} to {mode}")
     self.rotator_control_mode = mode
+    self.events.publish("rotator_settings")
     
   def set_rotator_position_mode(self, mode) -> None:
     print(f"Setting rotator position mode from {self.rotator_position_mode} to {mode}")
     self.rotator_position_mode = mode
+    self.events.publish("rotator_settings")
   
   def set_auto_rotator_position(self, latitude, longitude, altitude) -> None:
     if (self.rotator_position_mode == "auto" and
@@ -110,15 +120,18 @@ class Rotator:
          self.rotator_position["longitude"] != longitude or 
          self.rotator_position["altitude"] != altitude)):
       self.rotator_position = {"latitude": latitude, "longitude": longitude, "altitude": altitude}
-      self.new_angles_required = True
-    sleep(0.1)
+      self.events.publish("rotator_position")
+      self.__require_new_angles()
   
   def set_auto_target_position(self, latitude, longitude, altitude) -> None:
     # Check if in auto mode and passed values are floats and not already the same as the current target position
     if (self.rotator_control_mode == "auto" and
-        isinstance(latitude, float) and isinstance(longitude, float) and isinstance(altitude, float)):
+        isinstance(latitude, float) and isinstance(longitude, float) and isinstance(altitude, float) and
+        (self.target_position["latitude"] != latitude or
+         self.target_position["longitude"] != longitude or
+         self.target_position["altitude"] != altitude)):
       self.target_position = {"latitude": latitude, "longitude": longitude, "altitude": altitude}
-      self.new_angles_required = True
+      self.__require_new_angles()
     
   def set_manual_rotator_position(self, latitude, longitude, altitude) -> None:
     if self.rotator_position_mode == "auto":
@@ -126,7 +139,8 @@ class Rotator:
       print(f"Rototor is now in manual position mode")
     print(f"Rotator position is manually set to {latitude}, {longitude}, {altitude}")
     self.rotator_position = {"latitude": latitude, "longitude": longitude, "altitude": altitude}
-    self.new_angles_required = True
+    self.events.publish("rotator_position")
+    self.__require_new_angles()
   
   def set_manual_target_position(self, latitude, longitude, altitude) -> None:
     if self.rotator_control_mode == "auto":
@@ -134,7 +148,7 @@ class Rotator:
       print(f"Rototor is now in manual control mode")
     print(f"Setting rotator target position to {latitude}, {longitude}, {altitude}")
     self.target_position = {"latitude": latitude, "longitude": longitude, "altitude": altitude}
-    self.new_angles_required = True
+    self.__require_new_angles()
     
   def set_manual_angles(self, azimuth, elevation):
     if self.rotator_control_mode == "auto":
@@ -146,4 +160,5 @@ class Rotator:
     self.rotator_command = f"{self.rotator_angles['azimuth']},{self.rotator_angles['elevation']}"
     
     # Set the last command to empty so that the custom angles are sent right away
-    self.rotator_last_command = ""
\ No newline at end of file
+    self.rotator_last_command = ""
+    self.events.publish("rotator_command")
\ No newline at end of file
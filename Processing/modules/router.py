@@ -1,14 +1,11 @@
-from time import sleep
-import queue
-
 from modules.connection_manager import ConnectionManager
 from modules.map import Map
 from modules.processor import PacketProcessor
 from modules.rotator import Rotator
 from modules.sondehub import SondeHubUploader
+from modules.dispatch import get_packet_id
 
-from config import BALLOON_UPLOAD, PACKETID_TO_TYPE, PAYLOAD_UPLOAD, TELECOMMAND_APID
-from modules.ccsds import convert_message_to_ccsds
+from config import BALLOON_UPLOAD, PAYLOAD_UPLOAD
 
 class Router:
   def __init__(self, processor: PacketProcessor, connection: ConnectionManager, rotator: Rotator, map: Map, sondehub: SondeHubUploader) -> None:
@@ -17,6 +14,8 @@ class Router:
     self.rotator = rotator
     self.map = map
     self.sondehub = sondehub
+    
+    self.rotator_angles_request = self.processor.telecommand_decoders[get_packet_id("rotator_angles_request")]
   
   def send_data_to_map(self):
     def add_coordinates(coordinates, latitude, longitude):
@@ -28,41 +27,21 @@ class Router:
     add_coordinates(self.map.ballon_coordinates, self.processor.bfc_telemetry["gps_latitude"], self.processor.bfc_telemetry["gps_longitude"])
     add_coordinates(self.map.payload_coordinates, self.processor.pfc_telemetry["gps_latitude"], self.processor.pfc_telemetry["gps_longitude"])
     add_coordinates(self.map.rotator_coordinates, self.rotator.rotator_position["latitude"], self.rotator.rotator_position["longitude"])
-
-    sleep(0.1)
   
-  def send_processed_data(self):
-    try:
-      packet = self.processor.processed_packets.get(timeout=1)
-      if packet[1] == "primary" or packet[1] == "secondary":
-        self.connection.sendable_to_transceiver_messages.put(packet)
-      elif packet[1] == "yamcs":
-        self.connection.sendable_to_yamcs_messages.put(packet)
-      self.processor.processed_packets.task_done()
-    except queue.Empty:
-      pass
-    except Exception as e:
-      print(f"An error occurred while sending processed data: {e}")
-    
   def send_rotator_command_to_transceiver(self):
     if self.rotator.rotator_last_command != self.rotator.rotator_command:
-      apid = TELECOMMAND_APID["rotator"]
-      
-      # As this is a command, we need to add packet id
-      data_str = str([key for key, value in PACKETID_TO_TYPE.items() if value == "rotator_angles_request"][0])      
-      data_str += "," + self.rotator.rotator_command      
+      angles = (float(self.rotator.rotator_angles["azimuth"]), float(self.rotator.rotator_angles["elevation"]))
       
-      ccsds = convert_message_to_ccsds(apid, self.rotator.rotator_command_index, data_str, True) 
-      if ccsds is None:
+      try:
+        ccsds = self.rotator_angles_request.build(self.processor.packet_builder, *angles)
+      except Exception as e:
+        print(f"Error creating rotator command: {e}")
         return
       
-      self.processor.processed_packets.put((False, "primary", ccsds))
-      self.rotator.rotator_command_index += 1
+      self.processor.route_packet((False, "primary", ccsds))
       self.rotator.rotator_last_command = self.rotator.rotator_command
       
-      print(f"Rotator command sent: Azimuth: {float(self.rotator.rotator_command.split(',')[0])} | Elevation: {float(self.rotator.rotator_command.split(',')[1])}")
-      
-    sleep(0.1)
+      print(f"Rotator command sent: Azimuth: {angles[0]} | Elevation: {angles[1]}")
     
   def update_rotator_data(self):
     # Update the rotator position
@@ -80,7 +59,6 @@ class Router:
       self.rotator.set_auto_target_position(self.processor.bfc_telemetry["gps_latitude"],
                                               self.processor.bfc_telemetry["gps_longitude"],
                                               self.processor.bfc_telemetry["gps_altitude"])
-    sleep(0.1)
   
   def send_data_to_sondehub(self):
     if BALLOON_UPLOAD:
@@ -93,5 +71,4 @@ class Router:
                                         self.processor.pfc_telemetry["gps_latitude"],
                                         self.processor.pfc_telemetry["gps_longitude"],
                                         self.processor.pfc_telemetry["gps_altitude"])
-    sleep(1)
                               
\ No newline at end of file
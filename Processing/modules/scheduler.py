@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import time
+from collections import namedtuple
+from threading import Condition
+
+# Commands due within this many seconds of each other are sent in one wakeup
+BATCH_WINDOW = 0.05
+# A cycle aligned command that could not be sent this many seconds after its send time
+# (e.g. because its link was disconnected) waits for the next cycle
+MAX_CYCLE_LATENESS = 0.5
+
+# Heap entry of an outbox, ordered by send time and then by the order the commands were scheduled in
+ScheduledCommand = namedtuple("ScheduledCommand", ["send_time", "sequence", "data", "cycle_aligned", "scheduled_time"])
+
+def get_cycle_send_time(now: float, cycle_time: float, send_offset: float) -> float:
+  """
+  Returns the first epoch time from now at which cycle aligned telecommands are sent.
+  Cycles start when epoch time is divisible by cycle_time, telecommands are sent send_offset seconds after the cycle start.
+  """
+  return now + (send_offset - now) % cycle_time
+
+class Outbox:
+  """
+  Telecommands waiting to be sent on one link.
+  """
+  def __init__(self, name: str, send, connected: bool) -> None:
+    self.name = name
+    self.send = send
+    self.connected = connected
+    self.commands = []
+    self.condition = Condition()
+
+    # Statistics
+    self.sending = False
+    self.sent_commands = 0
+    self.rescheduled_commands = 0
+    self.high_water_mark = 0
+
+class TelecommandScheduler:
+  """
+  Sends telecommands through one outbox per link.
+  Cycle aligned commands get the send time of the next communication cycle when they are scheduled, other commands are due right away.
+  A sender waits on a timer until the first command of its outbox is due and sends every command due in the batch window at once,
+  so a command waiting for the next cycle does not hold up the commands behind it.
+  Outboxes of disconnected links are parked until the link connects again, without waking up.
+  Telecommands are never dropped, the capacity of the outboxes is only compared with their high water marks.
+  """
+  def __init__(self, cycle_time: float, send_offset: float = 1, capacity: int = 0) -> None:
+    self.cycle_time = cycle_time
+    self.send_offset = send_offset
+    self.capacity = capacity
+    self.outboxes = {}
+    self.sequence = itertools.count()
+    # Callbacks called with the link name when an outbox changes, used by the async runtime to wake up its senders
+    self.listeners = []
+
+  def add_outbox(self, name: str, send, connected: bool = False) -> None:
+    """
+    Adds an outbox, send is called with the data of every command sent on the link.
+    """
+    self.outboxes[name] = Outbox(name, send, connected)
+
+  def add_listener(self, listener) -> None:
+    self.listeners.append(listener)
+
+  def __notify(self, outbox: Outbox) -> None:
+    outbox.condition.notify_all()
+    for listener in self.listeners:
+      listener(outbox.name)
+
+  def schedule(self, link: str, data: bytes, cycle_aligned: bool) -> None:
+    outbox = self.outboxes.get(link)
+    if outbox is None:
+      raise Exception(f"Unknown telecommand link: {link}")
+
+    now = time.time()
+    send_time = get_cycle_send_time(now, self.cycle_time, self.send_offset) if cycle_aligned else now
+    with outbox.condition:
+      heapq.heappush(outbox.commands, ScheduledCommand(send_time, next(self.sequence), data, cycle_aligned, now))
+      outbox.high_water_mark = max(outbox.high_water_mark, len(outbox.commands))
+      self.__notify(outbox)
+
+  def set_connected(self, link: str, connected: bool) -> None:
+    outbox = self.outboxes[link]
+    if outbox.connected == connected:
+      return
+    with outbox.condition:
+      outbox.connected = connected
+      self.__notify(outbox)
+
+  def get_wait_time(self, link: str, now: float):
+    """
+    Returns the seconds until the first command of an outbox is due, or None if the outbox is empty or parked.
+    """
+    outbox = self.outboxes[link]
+    with outbox.condition:
+      if not outbox.connected or not outbox.commands:
+        return None
+      return max(0.0, outbox.commands[0].send_time - now)
+
+  def take_due_commands(self, link: str, now: float) -> list:
+    """
+    Removes and returns the commands of an outbox due in the batch window.
+    Cycle aligned commands that missed their cycle are moved to the next one.
+    """
+    outbox = self.outboxes[link]
+    due_commands = []
+    with outbox.condition:
+      if not outbox.connected:
+        return due_commands
+      while outbox.commands and outbox.commands[0].send_time <= now + BATCH_WINDOW:
+        command = heapq.heappop(outbox.commands)
+        if command.cycle_aligned and now - command.send_time > MAX_CYCLE_LATENESS:
+          send_time = get_cycle_send_time(now, self.cycle_time, self.send_offset)
+          heapq.heappush(outbox.commands, command._replace(send_time=send_time))
+          outbox.rescheduled_commands += 1
+          continue
+        due_commands.append(command)
+    return due_commands
+
+  def run_outbox(self, link: str, timeout: float = 1) -> None:
+    """
+    Waits until commands of an outbox are due, at most timeout seconds, and sends them.
+    """
+    outbox = self.outboxes[link]
+    with outbox.condition:
+      wait_time = self.get_wait_time(link, time.time())
+      if wait_time is None or wait_time > 0:
+        outbox.condition.wait(timeout if wait_time is None else min(wait_time, timeout))
+      commands = self.take_due_commands(link, time.time())
+
+    if not commands:
+      return
+    outbox.sending = True
+    for command in commands:
+      try:
+        outbox.send(command.data)
+      except Exception as e:
+        print(f"An error occurred while sending to {link}: {e}")
+    outbox.sent_commands += len(commands)
+    outbox.sending = False
+
+  def get_command_etas(self, now: float = None) -> list:
+    """
+    Returns (link, data, seconds waited, seconds until sent) for every scheduled command.
+    Seconds until sent is None for commands of parked outboxes.
+    """
+    if now is None:
+      now = time.time()
+    etas = []
+    for outbox in self.outboxes.values():
+      with outbox.condition:
+        commands = sorted(outbox.commands)
+        connected = outbox.connected
+      for command in commands:
+        eta = None
+        if connected:
+          send_time = command.send_time
+          if command.cycle_aligned and now - send_time > MAX_CYCLE_LATENESS:
+            send_time = get_cycle_send_time(now, self.cycle_time, self.send_offset)
+          eta = max(0.0, send_time - now)
+        etas.append((outbox.name, command.data, now - command.scheduled_time, eta))
+    return etas
+
+  def get_queued_commands(self, link: str) -> int:
+    return len(self.outboxes[link].commands)
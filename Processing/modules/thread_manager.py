@@ -1,6 +1,9 @@
 from threading import Thread, Event
 
-from modules.connection_manager import ConnectionManager
+from config import UPDATE_INTERVALS
+from modules.events import TASK_TOPICS, EVENT_WAIT_TIMEOUT
+
+from modules.connection_manager import ConnectionManager, TRANSCEIVERS
 from modules.processor import PacketProcessor
 from modules.router import Router
 from modules.sondehub import SondeHubUploader
@@ -21,6 +24,9 @@ class ThreadManager:
     self.active_threads = []
     self.stop_event = Event()
     
+    # Change notifications that wake up the rotator and map data threads
+    self.events = packet_processor.events
+    
   # THREAD STARTERS
   def start_receive_from_primary_transceiver_thread(self):
     def receive_from_primary_transceiver_thread():
@@ -53,14 +59,16 @@ class ThreadManager:
     self.active_threads.append(thread)
     
   def start_send_to_transceiver_thread(self):
-    def send_to_transceiver_thread():
+    # Every transceiver has its own outbox and sender, so a disconnected transceiver does not hold up the other one
+    def send_to_transceiver_thread(transceiver):
       while not self.stop_event.is_set():
-        self.connection_manager.send_to_transceiver()
-      
-    thread = Thread(target=send_to_transceiver_thread, name="Transceiver Sender")
-    thread.daemon = True
-    thread.start()
-    self.active_threads.append(thread)
+        self.connection_manager.send_to_transceiver(transceiver)
+    
+    for transceiver in TRANSCEIVERS:
+      thread = Thread(target=send_to_transceiver_thread, args=(transceiver,), name=f"{transceiver.capitalize()} Transceiver Sender")
+      thread.daemon = True
+      thread.start()
+      self.active_threads.append(thread)
   
   def start_send_to_yamcs_thread(self):
     def send_to_yamcs_thread():
@@ -82,16 +90,6 @@ class ThreadManager:
     thread.start()
     self.active_threads.append(thread)
     
-  def start_send_processed_data_thread(self):
-    def send_processed_data_thread():
-      while not self.stop_event.is_set():
-        self.router.send_processed_data()
-    
-    thread = Thread(target=send_processed_data_thread, name="Processed Data Sender")
-    thread.daemon = True
-    thread.start()
-    self.active_threads.append(thread)
-    
   def start_map_server_thread(self):
     def map_server_thread():
       while not self.stop_event.is_set():
@@ -105,7 +103,8 @@ class ThreadManager:
   def start_map_update_thread(self):
     def map_update_thread():
       while not self.stop_event.is_set():
-        self.map.update_map()  
+        self.map.update_map()
+        self.stop_event.wait(UPDATE_INTERVALS["map"])
     
     thread = Thread(target=map_update_thread, name="Map Updater")
     thread.daemon = True
@@ -114,8 +113,10 @@ class ThreadManager:
     
   def start_send_data_to_map_thread(self):
     def send_data_to_map_thread():
+      subscription = self.events.subscribe(TASK_TOPICS["map_data"])
       while not self.stop_event.is_set():
-        self.router.send_data_to_map()
+        if subscription.wait(EVENT_WAIT_TIMEOUT):
+          self.router.send_data_to_map()
       
     thread = Thread(target=send_data_to_map_thread, name="Map Data Sender")
     thread.daemon = True
@@ -124,8 +125,10 @@ class ThreadManager:
     
   def start_rotator_command_to_transceiver_thread(self):
     def rotator_command_to_transceiver_thread():
+      subscription = self.events.subscribe(TASK_TOPICS["rotator_command"])
       while not self.stop_event.is_set():
-        self.router.send_rotator_command_to_transceiver()
+        if subscription.wait(EVENT_WAIT_TIMEOUT):
+          self.router.send_rotator_command_to_transceiver()
       
     thread = Thread(target=rotator_command_to_transceiver_thread, name="Rotator Command Sender")
     thread.daemon = True
@@ -134,8 +137,10 @@ class ThreadManager:
     
   def start_rotator_data_update_thread(self):
     def rotator_data_update_thread():
+      subscription = self.events.subscribe(TASK_TOPICS["rotator_data"])
       while not self.stop_event.is_set():
-        self.router.update_rotator_data()
+        if subscription.wait(EVENT_WAIT_TIMEOUT):
+          self.router.update_rotator_data()
       
     thread = Thread(target=rotator_data_update_thread, name="Rotator Data Updater")
     thread.daemon = True
@@ -154,8 +159,10 @@ class ThreadManager:
     
   def start_control_rotator_thread(self):
     def control_rotator_thread():
+      subscription = self.events.subscribe(TASK_TOPICS["rotator_control"])
       while not self.stop_event.is_set():
-        self.rotator.control_rotator()
+        if subscription.wait(EVENT_WAIT_TIMEOUT):
+          self.rotator.control_rotator()
       
     thread = Thread(target=control_rotator_thread, name="Rotator Controller")
     thread.daemon = True
@@ -166,6 +173,7 @@ class ThreadManager:
     def sondehub_uploader_thread():
       while not self.stop_event.is_set():
         self.router.send_data_to_sondehub()
+        self.stop_event.wait(UPDATE_INTERVALS["sondehub"])
       self.sondehub.close_uploader()
     
     thread = Thread(target=sondehub_uploader_thread, name="SondeHub Uploader")
@@ -0,0 +1,435 @@
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from struct import Struct
+
+from modules.decoders import TelemetryRecord
+
+XTCE_NAMESPACE = "{http://www.omg.org/spec/XTCE/20180204}"
+
+# Increase when the compiled layout format changes, so old cache files are compiled again
+XTCE_CACHE_VERSION = 1
+
+# Struct format characters of the byte aligned integer and float encodings (all values are big endian)
+INTEGER_FORMATS = {
+  (8, False): "B", (16, False): "H", (32, False): "I", (64, False): "Q",
+  (8, True): "b", (16, True): "h", (32, True): "i", (64, True): "q",
+}
+FLOAT_FORMATS = {
+  32: "f",
+  64: "d",
+}
+
+def tag(name: str) -> str:
+  return XTCE_NAMESPACE + name
+
+# SCHEMA COMPILER
+def read_data_type(element) -> dict:
+  """
+  Reads a parameter or argument type into a field description: kind, size in bits, signedness and enumeration labels.
+  """
+  type_name = element.tag[len(XTCE_NAMESPACE):]
+  data_type = {"kind": None, "bits": 0, "signed": False, "enumerations": {}}
+
+  if type_name in ("IntegerParameterType", "IntegerArgumentType"):
+    data_type["kind"] = "int"
+    data_type["signed"] = element.get("signed", "true") == "true"
+  elif type_name in ("FloatParameterType", "FloatArgumentType"):
+    data_type["kind"] = "float"
+  elif type_name in ("BooleanParameterType", "BooleanArgumentType"):
+    data_type["kind"] = "bool"
+    data_type["enumerations"] = {element.get("zeroStringValue", "False"): 0, element.get("oneStringValue", "True"): 1}
+  elif type_name in ("EnumeratedParameterType", "EnumeratedArgumentType"):
+    data_type["kind"] = "enum"
+    data_type["enumerations"] = {enumeration.get("label"): int(enumeration.get("value")) for enumeration in element.iter(tag("Enumeration"))}
+  elif type_name in ("StringParameterType", "StringArgumentType"):
+    data_type["kind"] = "string"
+  else:
+    # Aggregates are only used by the CCSDS headers, which are decoded by parse_ccsds_packet
+    return data_type
+
+  encoding = element.find(tag("IntegerDataEncoding"))
+  if encoding is None:
+    encoding = element.find(tag("FloatDataEncoding"))
+  if encoding is not None:
+    data_type["bits"] = int(encoding.get("sizeInBits", 32 if data_type["kind"] == "float" else 8))
+    if encoding.get("encoding") == "twosComplement":
+      data_type["signed"] = True
+
+  # Only strings with a fixed size can be compiled into a struct format
+  fixed_size = element.find(f"{tag('StringDataEncoding')}/{tag('SizeInBits')}/{tag('Fixed')}/{tag('FixedValue')}")
+  if fixed_size is not None:
+    data_type["bits"] = int(fixed_size.text)
+
+  return data_type
+
+def compile_layout(name: str, fields: list) -> dict:
+  """
+  Compiles a list of fields into one big endian struct format.
+  Fields that are not byte aligned (booleans, 2-bit enums, 11-bit integers...) are packed into byte groups,
+  which are read as raw bytes and split into the fields with shifts and masks.
+  """
+  struct_format = ">"
+  # For every field: index of its raw struct value, and for bit fields also the shift and size of the field in its group
+  unpack_plan = []
+  raw_count = 0
+  # Bit fields waiting for their group to fill whole bytes
+  bit_group = []
+  bit_group_size = 0
+  bit_fields = False
+
+  def close_bit_group():
+    nonlocal struct_format, raw_count, bit_group, bit_group_size, bit_fields
+    group_bytes = (bit_group_size + 7) // 8
+    # The fields start from the most significant bit, the unused bits at the end of the group are padding
+    shift = group_bytes * 8
+    for field in bit_group:
+      shift -= field["bits"]
+      unpack_plan.append([raw_count, shift, field["bits"]])
+    bit_fields = True
+    struct_format += f"{group_bytes}s"
+    raw_count += 1
+    bit_group = []
+    bit_group_size = 0
+
+  for field in fields:
+    kind, bits, signed = field["kind"], field["bits"], field["signed"]
+
+    if kind is None or bits == 0:
+      raise Exception(f"Field {field['name']} in {name} has no fixed size encoding")
+
+    # Byte aligned fields are unpacked by the struct
+    if not bit_group:
+      if kind == "float":
+        field_format = FLOAT_FORMATS.get(bits)
+      elif kind == "string":
+        field_format = f"{bits // 8}s" if bits % 8 == 0 else None
+      else:
+        field_format = INTEGER_FORMATS.get((bits, signed and kind == "int"))
+
+      if field_format is not None:
+        struct_format += field_format
+        unpack_plan.append([raw_count])
+        raw_count += 1
+        continue
+
+    if kind in ("float", "string"):
+      raise Exception(f"Field {field['name']} in {name} is not byte aligned")
+    bit_group.append(field)
+    bit_group_size += bits
+    if bit_group_size % 8 == 0:
+      close_bit_group()
+
+  if bit_group:
+    close_bit_group()
+
+  return {
+    "name": name,
+    "fields": [field["name"] for field in fields],
+    "kinds": [field["kind"] for field in fields],
+    "signed": [field["signed"] for field in fields],
+    "enumerations": {field["name"]: field["enumerations"] for field in fields if field["enumerations"]},
+    "format": struct_format,
+    # Layouts without bit fields are decoded by the struct alone
+    "unpack_plan": unpack_plan if bit_fields else None,
+  }
+
+def compile_xtce(xtce_file: str) -> dict:
+  """
+  Parses the XTCE mission database and compiles the layout of every telemetry container with an APID and every command that is not abstract.
+  The CCSDS headers (the base containers without a base of their own) are left out, the layouts start at the user data field.
+  """
+  root = ElementTree.parse(xtce_file).getroot()
+
+  parameter_types = {element.get("name"): read_data_type(element) for element in root.find(f"{tag('TelemetryMetaData')}/{tag('ParameterTypeSet')}")}
+  parameters = {element.get("name"): parameter_types.get(element.get("parameterTypeRef")) for element in root.iter(tag("Parameter"))}
+  argument_types = {element.get("name"): read_data_type(element) for element in root.find(f"{tag('CommandMetaData')}/{tag('ArgumentTypeSet')}")}
+
+  # Telemetry containers
+  containers = {element.get("name"): element for element in root.iter(tag("SequenceContainer"))}
+  compiled_containers = {}
+  for name, element in containers.items():
+    if element.get("abstract") == "true":
+      continue
+
+    # Walk up the base containers, collecting the entries and the APID restriction
+    chain = []
+    apid = None
+    current = element
+    while current is not None:
+      base = current.find(tag("BaseContainer"))
+      if base is None:
+        break
+      chain.insert(0, current)
+      for comparison in base.iter(tag("Comparison")):
+        if comparison.get("parameterRef").endswith("/APID") and apid is None:
+          apid = int(comparison.get("value"))
+      current = containers.get(base.get("containerRef"))
+
+    if apid is None:
+      continue
+
+    fields = []
+    for container in chain:
+      entry_list = container.find(tag("EntryList"))
+      if entry_list is None:
+        continue
+      for entry in entry_list:
+        if entry.tag != tag("ParameterRefEntry"):
+          raise Exception(f"Unsupported entry {entry.tag[len(XTCE_NAMESPACE):]} in container {name}")
+        parameter = entry.get("parameterRef")
+        data_type = parameters.get(parameter)
+        if data_type is None:
+          raise Exception(f"Unknown parameter {parameter} in container {name}")
+        fields.append({"name": parameter, **data_type})
+
+    layout = compile_layout(name, fields)
+    layout["apid"] = apid
+    compiled_containers[apid] = layout
+
+  # Commands
+  meta_commands = {element.get("name"): element for element in root.iter(tag("MetaCommand"))}
+  compiled_commands = {}
+  for name, element in meta_commands.items():
+    if element.get("abstract") == "true":
+      continue
+
+    chain = []
+    current = element
+    while current is not None:
+      base = current.find(tag("BaseMetaCommand"))
+      chain.insert(0, current)
+      if base is None:
+        break
+      current = meta_commands.get(base.get("metaCommandRef"))
+
+    arguments = {}
+    assignments = {}
+    defaults = {}
+    for meta_command in chain:
+      for argument in meta_command.iter(tag("Argument")):
+        arguments[argument.get("name")] = argument_types.get(argument.get("argumentTypeRef"))
+        if argument.get("initialValue") is not None:
+          defaults[argument.get("name")] = argument.get("initialValue")
+      for assignment in meta_command.iter(tag("ArgumentAssignment")):
+        assignments[assignment.get("argumentName")] = assignment.get("argumentValue")
+
+    # The first meta command of the chain holds the CCSDS primary header
+    fields = []
+    for meta_command in chain[1:]:
+      entry_list = meta_command.find(f"{tag('CommandContainer')}/{tag('EntryList')}")
+      if entry_list is None:
+        continue
+      for entry in entry_list:
+        if entry.tag != tag("ArgumentRefEntry"):
+          raise Exception(f"Unsupported entry {entry.tag[len(XTCE_NAMESPACE):]} in command {name}")
+        argument = entry.get("argumentRef")
+        data_type = arguments.get(argument)
+        if data_type is None:
+          raise Exception(f"Unknown argument {argument} in command {name}")
+        fields.append({"name": argument, **data_type})
+
+    layout = compile_layout(name, fields)
+    layout["apid"] = int(assignments.get("CCSDS_APID", 0))
+    layout["assignments"] = {argument: value for argument, value in assignments.items() if argument in layout["fields"]}
+    layout["defaults"] = {argument: value for argument, value in defaults.items() if argument in layout["fields"]}
+    compiled_commands[name] = layout
+
+  return {"containers": compiled_containers, "commands": compiled_commands}
+
+def load_compiled_xtce(xtce_file: str, cache_file: str) -> dict:
+  """
+  Returns the compiled layouts of an XTCE file.
+  The layouts are read from the cache file if it was compiled from the same XTCE file, else the XTCE file is compiled and the cache is written again.
+  """
+  with open(xtce_file, "rb") as file:
+    xtce_hash = hashlib.sha256(file.read()).hexdigest()
+
+  try:
+    with open(cache_file, "r") as file:
+      cache = json.load(file)
+    if cache["version"] == XTCE_CACHE_VERSION and cache["xtce_hash"] == xtce_hash:
+      return cache["schema"]
+  except (OSError, ValueError, KeyError):
+    pass
+
+  schema = compile_xtce(xtce_file)
+  try:
+    cache_directory = os.path.dirname(cache_file)
+    if cache_directory:
+      os.makedirs(cache_directory, exist_ok=True)
+    with open(cache_file, "w") as file:
+      json.dump({"version": XTCE_CACHE_VERSION, "xtce_hash": xtce_hash, "schema": schema}, file)
+  except OSError as e:
+    print(f"Could not write XTCE cache file {cache_file}: {e}")
+
+  return schema
+
+# DECODERS AND ENCODERS
+class BitFieldStruct:
+  """
+  Struct for layouts with bit fields. Has the same size, unpack_from, pack and pack_into as a struct,
+  so records of these layouts can also be built by the packet builder.
+  """
+  def __init__(self, struct_format: str, unpack_plan: list, signed: list) -> None:
+    self.struct = Struct(struct_format)
+    self.size = self.struct.size
+    self.unpack_plan = unpack_plan
+    self.raw_count = max(plan[0] for plan in unpack_plan) + 1 if unpack_plan else 0
+    self.signed = signed
+
+  def unpack_from(self, buffer, offset: int = 0) -> tuple:
+    raw_values = self.struct.unpack_from(buffer, offset)
+    values = []
+    for plan, signed in zip(self.unpack_plan, self.signed):
+      if len(plan) == 1:
+        values.append(raw_values[plan[0]])
+        continue
+      raw_index, shift, bits = plan
+      value = (int.from_bytes(raw_values[raw_index], "big") >> shift) & ((1 << bits) - 1)
+      if signed and value >> (bits - 1):
+        value -= 1 << bits
+      values.append(value)
+    return tuple(values)
+
+  def __raw_values(self, values) -> list:
+    raw_values = [0] * self.raw_count
+    group_sizes = {}
+    for plan, value in zip(self.unpack_plan, values):
+      if len(plan) == 1:
+        raw_values[plan[0]] = value
+        continue
+      raw_index, shift, bits = plan
+      raw_values[raw_index] |= (int(value) & ((1 << bits) - 1)) << shift
+      group_sizes[raw_index] = max(group_sizes.get(raw_index, 0), shift + bits)
+    for raw_index, group_size in group_sizes.items():
+      raw_values[raw_index] = raw_values[raw_index].to_bytes((group_size + 7) // 8, "big")
+    return raw_values
+
+  def pack(self, *values) -> bytes:
+    return self.struct.pack(*self.__raw_values(values))
+
+  def pack_into(self, buffer, offset: int, *values) -> None:
+    self.struct.pack_into(buffer, offset, *self.__raw_values(values))
+
+class XtceDecoder:
+  """
+  Decoder and encoder for a compiled XTCE container or command layout.
+  Works like the telemetry decoders: byte aligned layouts are decoded with one unpack_from call into a record.
+  """
+  def __init__(self, layout: dict) -> None:
+    self.name = layout["name"]
+    self.apid = layout["apid"]
+    self.fields = tuple(layout["fields"])
+    self.kinds = tuple(layout["kinds"])
+    self.enumerations = layout["enumerations"]
+
+    if layout["unpack_plan"] is None:
+      self.struct = Struct(layout["format"])
+    else:
+      self.struct = BitFieldStruct(layout["format"], layout["unpack_plan"], [signed and kind == "int" for kind, signed in zip(layout["kinds"], layout["signed"])])
+    self.size = self.struct.size
+
+    # Parameter names are used as field names, rename=True only changes names that are not valid identifiers
+    self.record = type(self.name, (TelemetryRecord, namedtuple(self.name, self.fields, rename=True)), {"__slots__": (), "_struct": self.struct})
+
+  def decode(self, packet_data, offset: int = 0) -> TelemetryRecord:
+    """
+    Decodes the user data field of a packet into a record.
+    """
+    return self.record._make(self.struct.unpack_from(packet_data, offset))
+
+  def encode(self, record) -> bytes:
+    """
+    Encodes values (a record or any sequence in layout order) into packet data.
+    """
+    return self.struct.pack(*record)
+
+  def empty(self) -> TelemetryRecord:
+    """
+    Returns a record with all values set to 0.
+    """
+    return self.record._make(0.0 if kind == "float" else b"" if kind == "string" else 0 for kind in self.kinds)
+
+  def convert_value(self, field: str, value):
+    """
+    Converts an enumeration label or a string to the raw value of a field.
+    """
+    kind = self.kinds[self.fields.index(field)]
+    if isinstance(value, str):
+      if value in self.enumerations.get(field, {}):
+        return self.enumerations[field][value]
+      if kind == "float":
+        return float(value)
+      if kind == "string":
+        return value.encode()
+      return int(value)
+    if kind == "float":
+      return float(value)
+    return value
+
+class XtceCommand(XtceDecoder):
+  """
+  Encoder for a telecommand. Arguments assigned by the base commands (like the packet id) are filled in,
+  so only the arguments of the command itself have to be given.
+  """
+  def __init__(self, layout: dict) -> None:
+    super().__init__(layout)
+    self.assignments = {field: self.convert_value(field, value) for field, value in layout["assignments"].items()}
+    self.defaults = {field: self.convert_value(field, value) for field, value in layout["defaults"].items()}
+    self.arguments = tuple(field for field in self.fields if field not in self.assignments)
+    self.packet_id = self.assignments.get("Packet_ID")
+
+  def make(self, **arguments) -> TelemetryRecord:
+    """
+    Returns the command record with the given arguments. Arguments can be given as raw values or enumeration labels.
+    """
+    values = []
+    for field in self.fields:
+      if field in self.assignments:
+        values.append(self.assignments[field])
+      elif field in arguments:
+        values.append(self.convert_value(field, arguments[field]))
+      elif field in self.defaults:
+        values.append(self.defaults[field])
+      else:
+        raise ValueError(f"Missing argument {field} for command {self.name}")
+    return self.record._make(values)
+
+  def build(self, packet_builder, **arguments) -> bytes:
+    """
+    Builds the telecommand packet with a packet builder.
+    The packet id is big endian like every field of the mission database, which is how YAMCS encodes it
+    and how the telecommand registry builds the telecommands from YAMCS (see YAMCS_PACKET_ID in modules/decoders.py).
+    """
+    return packet_builder.build_command(self.apid, self.make(**arguments))
+
+class XtceSchema:
+  """
+  Decoders for every telemetry container (by APID) and encoders for every command (by name) of the XTCE mission database.
+  """
+  def __init__(self, xtce_file: str, cache_file: str) -> None:
+    schema = load_compiled_xtce(xtce_file, cache_file)
+    # JSON object keys are strings
+    self.containers = {int(apid): XtceDecoder(layout) for apid, layout in schema["containers"].items()}
+    self.commands = {name: XtceCommand(layout) for name, layout in schema["commands"].items()}
+
+  def get_container(self, apid: int):
+    return self.containers.get(apid)
+
+  def get_command(self, name: str) -> XtceCommand:
+    command = self.commands.get(name)
+    if command is None:
+      raise Exception(f"Unknown command: {name}")
+    return command
+
+  def decode(self, apid: int, packet_data):
+    """
+    Decodes the user data of a telemetry packet, returns None for APIDs without a container.
+    """
+    container = self.containers.get(apid)
+    if container is None:
+      return None
+    return container.decode(packet_data)
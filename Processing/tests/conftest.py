@@ -0,0 +1,5 @@
+import os
+import sys
+
+# config.py and the modules are imported from the Processing folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+"""
+Checks that the fast CCSDS decoders decode packets exactly like the bit string reference (parse_ccsds_packet_bitstring).
+Run from the Processing folder: python -m pytest tests
+"""
+import random
+
+import pytest
+
+from config import TELEMETRY_MESSAGE_STRUCTURE
+from modules.ccsds import *
+from modules.decoders import compile_telemetry_decoders
+
+# Generated packets per message structure
+EQUIVALENCE_PACKETS = 200
+EQUIVALENCE_APID = 100
+
+def per_field_bitstring(packet_data, structure) -> dict:
+  # Decoding loop used before the compiled decoders, on the bit string returned by the reference parser
+  values = {}
+  start = 0
+  for data_type, field in structure:
+    end = start + 32
+    if data_type == "float":
+      values[field] = bitstring_to_float(packet_data[start:end])
+    elif data_type == "int":
+      values[field] = bitstring_to_int(packet_data[start:end])
+    start = end
+  return values
+
+def per_field_bytes(packet_data, structure) -> dict:
+  # The same loop on the memoryview returned by parse_ccsds_packet
+  values = {}
+  start = 0
+  for data_type, field in structure:
+    end = start + 4
+    if data_type == "float":
+      values[field] = binary_to_float(packet_data[start:end])
+    elif data_type == "int":
+      values[field] = binary_to_int(packet_data[start:end])
+    start = end
+  return values
+
+def create_packets(structure) -> list:
+  """
+  Returns EQUIVALENCE_PACKETS packets with random values, built by convert_message_to_ccsds.
+  Floats are rounded to float32 by the packet, so any value is compared exactly after decoding.
+  """
+  generator = random.Random(0)
+  packets = []
+  for sequence_count in range(EQUIVALENCE_PACKETS):
+    values = [repr(generator.uniform(-1e6, 1e6)) if data_type == "float" else str(generator.randrange(2 ** 31)) for data_type, field in structure]
+    packets.append(bytes(convert_message_to_ccsds(EQUIVALENCE_APID, sequence_count, ",".join(values))))
+  return packets
+
+@pytest.mark.parametrize("name", TELEMETRY_MESSAGE_STRUCTURE)
+def test_parse_ccsds_packet(name):
+  structure = TELEMETRY_MESSAGE_STRUCTURE[name]
+  for packet in create_packets(structure):
+    reference = parse_ccsds_packet_bitstring(packet)
+    parsed = parse_ccsds_packet(packet)
+    assert parsed[:3] == reference[:3]
+    assert per_field_bytes(parsed[3], structure) == per_field_bitstring(reference[3], structure)
+
+@pytest.mark.parametrize("name", TELEMETRY_MESSAGE_STRUCTURE)
+def test_compiled_decoder(name):
+  structure = TELEMETRY_MESSAGE_STRUCTURE[name]
+  decoder = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)[name]
+  for packet in create_packets(structure):
+    reference = parse_ccsds_packet_bitstring(packet)
+    assert dict(decoder.decode(parse_ccsds_packet(packet)[3]).items()) == per_field_bitstring(reference[3], structure)
+
+@pytest.mark.parametrize("name", TELEMETRY_MESSAGE_STRUCTURE)
+def test_parse_ccsds_packets(name):
+  structure = TELEMETRY_MESSAGE_STRUCTURE[name]
+  packets = create_packets(structure)
+  rows = parse_ccsds_packets(packets, {EQUIVALENCE_APID: structure})[EQUIVALENCE_APID]
+  assert len(rows) == len(packets)
+  for row, packet in zip(rows, packets):
+    reference = parse_ccsds_packet_bitstring(packet)
+    assert (int(row["apid"]), int(row["epoch_seconds"]), int(row["epoch_subseconds"])) == reference[:3]
+    values = {field: float(row[field]) if data_type == "float" else int(row[field]) for data_type, field in structure}
+    assert values == per_field_bitstring(reference[3], structure)
+
+@pytest.mark.parametrize("name", TELEMETRY_MESSAGE_STRUCTURE)
+def test_packet_builder_telemetry_bytes(name):
+  # PacketBuilder sends the same bytes as convert_message_to_ccsds, apart from the time in the secondary header
+  structure = TELEMETRY_MESSAGE_STRUCTURE[name]
+  decoder = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)[name]
+  builder = PacketBuilder()
+  for sequence_count, packet in enumerate(create_packets(structure)):
+    built = builder.build_telemetry(EQUIVALENCE_APID, decoder.decode(parse_ccsds_packet(packet)[3]))
+    assert built[:PRIMARY_HEADER.size] == packet[:PRIMARY_HEADER.size]
+    assert built[PRIMARY_HEADER.size + SECONDARY_HEADER.size:] == packet[PRIMARY_HEADER.size + SECONDARY_HEADER.size:]
+
+def test_packet_builder_telecommand_bytes():
+  builder = PacketBuilder()
+  for sequence_count, (packet_id, values) in enumerate([(3100, (12.5, -3.25)), (3000, (1,)), (2003, (7, 2147483647))]):
+    message = ",".join([str(packet_id)] + [repr(value) if isinstance(value, float) else str(value) for value in values])
+    assert builder.build_telecommand(30, packet_id, values) == bytes(convert_message_to_ccsds(30, sequence_count, message, telecommand=True))
+  # convert_message_to_ccsds cannot build commands without arguments
+  assert builder.build_telecommand(10, 1000) == bytes.fromhex("000ac0000001") + PACKET_ID.pack(1000)
@@ -0,0 +1,44 @@
+"""
+Checks that the telecommands built by the telecommand registry decode back to themselves.
+Run from the Processing folder: python -m pytest tests
+"""
+import pytest
+
+from config import PACKETID_TO_TYPE, TELECOMMAND_MESSAGE_STRUCTURE, TELECOMMAND_APID, LITTLE_ENDIAN_TELECOMMANDS
+from modules.ccsds import PRIMARY_HEADER, PacketBuilder
+from modules.decoders import compile_telecommand_decoders, read_packet_id
+from modules.dispatch import get_packet_id
+
+TELECOMMAND_DECODERS = compile_telecommand_decoders(PACKETID_TO_TYPE, TELECOMMAND_MESSAGE_STRUCTURE, TELECOMMAND_APID, LITTLE_ENDIAN_TELECOMMANDS)
+# Argument values of every data type, all exact after packing
+ARGUMENT_VALUES = {
+  "float": -12.5,
+  "int": 4000000000,
+  "uint8": 255,
+  "uint16": 65535,
+}
+
+@pytest.mark.parametrize("packet_id", PACKETID_TO_TYPE)
+def test_build_decode_round_trip(packet_id):
+  decoder = TELECOMMAND_DECODERS[packet_id]
+  values = tuple(ARGUMENT_VALUES[data_type] for data_type, field in TELECOMMAND_MESSAGE_STRUCTURE[decoder.name])
+  packet = decoder.build(PacketBuilder(), *values)
+  
+  # Telecommands have no secondary header
+  packet_data = packet[PRIMARY_HEADER.size:]
+  decoded_packet_id, arguments = decoder.decode_command(packet_data)
+  assert decoded_packet_id == packet_id
+  assert tuple(arguments) == values
+  
+  # The processor reads the packet id of the telecommands from YAMCS in big endian byte order
+  if decoder.name not in LITTLE_ENDIAN_TELECOMMANDS:
+    assert read_packet_id(packet_data) == packet_id
+
+def test_little_endian_packet_id():
+  # The rotator has always received the packet id of the commands built by the ground station in little endian byte order
+  decoder = TELECOMMAND_DECODERS[get_packet_id("rotator_angles_request")]
+  assert decoder.build(PacketBuilder(), 1.0, 2.0)[PRIMARY_HEADER.size:PRIMARY_HEADER.size + 2] == bytes.fromhex("1c0c")
+
+def test_read_packet_id():
+  assert read_packet_id(bytes.fromhex("0bb8")) == 3000
+  assert read_packet_id(b"\x0b") is None
@@ -0,0 +1,33 @@
+"""
+Checks that the reorder buffer releases held packets in epoch time order.
+Run from the Processing folder: python -m pytest tests
+"""
+from modules.reorder import ReorderBuffer
+
+HOLD_TIME = 0.5
+
+def test_release_in_epoch_time_order():
+  buffer = ReorderBuffer(HOLD_TIME)
+  for now, epoch_time in [(0.0, (10, 0)), (0.1, (12, 0)), (0.2, (11, 5)), (0.3, (13, 0))]:
+    assert buffer.add(epoch_time, epoch_time, now)
+  assert buffer.reordered_packets == 1
+  assert buffer.get_wait_time(0.2) == HOLD_TIME - 0.2
+  assert buffer.take_due(0.4) == []
+
+  # (12, 0) is due at 0.6 and releases (11, 5) with it, so (13, 0) is released next
+  assert buffer.take_due(0.5) == [((10, 0), (10, 0))]
+  assert buffer.take_due(0.6) == [((11, 5), (11, 5)), ((12, 0), (12, 0))]
+  assert buffer.get_wait_time(0.6) == 0.8 - 0.6
+  assert buffer.take_due(0.8) == [((13, 0), (13, 0))]
+  assert buffer.get_wait_time(0.8) is None
+
+def test_late_packets():
+  buffer = ReorderBuffer(HOLD_TIME)
+  buffer.add((10, 0), "a", 0.0)
+  buffer.take_due(HOLD_TIME)
+  assert not buffer.add((10, 0), "b", 1.0)
+  assert not buffer.add((9, 9), "c", 1.0)
+  assert buffer.add((10, 1), "d", 1.0)
+  assert buffer.late_packets == 2
+  # Packets added after the buffer is empty are not counted as reordered
+  assert buffer.reordered_packets == 0
@@ -0,0 +1,49 @@
+"""
+Checks the decoders and encoders compiled from the XTCE mission database against config.py and the telecommand registry.
+Run from the Processing folder: python -m pytest tests
+"""
+import os
+
+import pytest
+
+from config import APID_TO_TYPE, XTCE_FILE
+from modules.ccsds import PRIMARY_HEADER, PacketBuilder, parse_ccsds_packet
+from modules.decoders import read_packet_id
+from modules.xtce import XtceSchema
+
+# Packet types decoded with the message structures in config.py, or built by the ground station
+CONFIG_PACKET_TYPES = ("rotator_position", "pfc_calculations", "bfc_calculations", "rotator_calculations", "pfc_essential", "bfc_essential")
+
+@pytest.fixture(scope="module")
+def xtce(tmp_path_factory):
+  # XTCE_FILE is relative to the Processing folder
+  xtce_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), XTCE_FILE)
+  return XtceSchema(xtce_file, str(tmp_path_factory.mktemp("cache") / "xtce.json"))
+
+def test_apids_match_containers(xtce):
+  # Every other packet type of APID_TO_TYPE is decoded with the container of its APID
+  for apid, packet_type in APID_TO_TYPE.items():
+    if packet_type not in CONFIG_PACKET_TYPES:
+      assert xtce.get_container(apid) is not None, f"No container for APID {apid} ({packet_type})"
+
+def test_container_round_trip(xtce):
+  builder = PacketBuilder()
+  for apid, packet_type in APID_TO_TYPE.items():
+    container = xtce.get_container(apid)
+    if container is None or packet_type in CONFIG_PACKET_TYPES:
+      continue
+    values = container.record._make(index % 2 + 1.5 if kind == "float" else b"" if kind == "string" else index % 2 for index, kind in enumerate(container.kinds))
+    packet = builder.build_telemetry(apid, values)
+    parsed = parse_ccsds_packet(packet)
+    assert parsed[0] == apid
+    assert container.decode(parsed[3]) == values
+
+def test_command_packet_id(xtce):
+  # The packet id of the XTCE commands is read back like the packet id of the telecommands from YAMCS
+  builder = PacketBuilder()
+  for name, command in xtce.commands.items():
+    if command.packet_id is None:
+      continue
+    arguments = {field: command.empty()[index] for index, field in enumerate(command.fields) if field in command.arguments}
+    packet = command.build(builder, **arguments)
+    assert read_packet_id(packet[PRIMARY_HEADER.size:]) == command.packet_id, name
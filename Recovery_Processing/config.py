@@ -7,18 +7,34 @@ LOCAL_IP_ADDRESS = gethostbyname(HOSTNAME)
 # Communication cycle time in seconds
 CYCLE_TIME = 15
 
+# Capacity in packets and policy of the pipeline queues when they are full (see modules/bounded_queue.py)
+# "block" - the producer waits, "drop_oldest" - the oldest packet is dropped, "never_drop" - the capacity is only reported
+QUEUE_SETTINGS = {
+  "received_messages": (1000, "block"),
+  "sendable_to_yamcs_messages": (1000, "drop_oldest"),
+  "telecommand_outboxes": (100, "never_drop"),
+}
+# Log files written for every run (see modules/logging.py), one or both of
+# "csv" - telemetry.csv and telecommand.csv with the time and the packet in hex
+# "binary" - flight.bin with the raw packets and flight.idx with their time and APID index, read by FlightLogReader and log replay
+LOG_FILE_FORMATS = ("csv",)
+
 # CONNECTIONS
 YAMCS_TM_ADDRESS = ('localhost', 10015)
 YAMCS_TC_ADDRESS = ('localhost', 10025)
 
 # SERIAL
 SERIAL_PORT = "COM4"
+# Size of the buffer used to split the serial data into packets and the largest packet accepted (in bytes)
+SERIAL_BUFFER_SIZE = 8192
+SERIAL_MAX_PACKET_LENGTH = 1024
 
 # Port on which the map server is running
 MAP_SERVER_PORT = 9500
 
 # APID can be from 0 to 2047
 # Telemetry package apids
+# The PFC and BFC packets other than the essential ones have the APIDs of their containers in the XTCE mission database
 APID_TO_TYPE = {
   # Rotator
   50: "rotator_position",
@@ -28,17 +44,18 @@ APID_TO_TYPE = {
   80: "rotator_calculations",
   # PFC
   100: "pfc_essential",
-  101: "pfc_full",
-  102: "pfc_info_error",
-  103: "pfc_format",
-  104: "pfc_ejection",
+  101: "pfc_telecommand_acknowledgment",
+  102: "pfc_system_status",
+  103: "pfc_configuration",
+  104: "pfc_location",
+  105: "pfc_heated_container_status",
   # BFC
   200: "bfc_essential",
-  201: "bfc_full",
-  202: "pfc_info_error",
-  203: "bfc_format",
-  204: "bfc_rwc_mode",
-  205: "bfc_ejection",  
+  1: "bfc_telecommand_acknowledgment",
+  2: "bfc_system_status",
+  3: "bfc_configuration",
+  4: "bfc_location",
+  5: "bfc_rwc",
 }
 
 # All telecommands have the same APID, but have different packet ids
@@ -16,7 +16,7 @@ def main():
   
   # Create objects
   try:
-    logger = Logger()
+    logger = Logger(formats=LOG_FILE_FORMATS)
     connection_manager = ConnectionManager(logger)
   except OSError as e:
     print(f"The following error occurred while creating the connection manager: {e}")
@@ -42,8 +42,8 @@ def main():
   # Receive threads
   thread_manager.start_receive_from_yamcs_thread()
   # Send threads
+  thread_manager.start_send_to_transceiver_thread()
   thread_manager.start_send_to_yamcs_thread()
-  thread_manager.start_send_processed_data_thread()
   thread_manager.start_send_data_to_map_thread()
   # Processing thread
   thread_manager.start_packet_processing_thread()
@@ -74,6 +74,8 @@ def main():
             # Give the thread a chance to stop.
             thread.join(timeout=0.01)
         print(f"Thread {thread.name} stopped.")
+      # Write the buffered logs
+      logger.close()
       print("All threads stopped. Exiting...")
       os.system('pause')
       os._exit(0)
@@ -1,5 +1,27 @@
 import time
-from struct import pack, unpack
+from struct import Struct, error, pack, unpack
+from threading import Lock
+import numpy as np
+
+# Primary header: packet identification (16 bits), packet sequence control (16 bits), packet data length (16 bits)
+PRIMARY_HEADER = Struct(">HHH")
+# Secondary header: epoch seconds (32 bits), epoch subseconds (16 bits)
+SECONDARY_HEADER = Struct(">IH")
+FLOAT = Struct(">f")
+# Telecommand packet id, sent in the byte order the transceivers have always received it in
+PACKET_ID = Struct("<H")
+
+# Packet sequence count is a 14-bit field
+SEQUENCE_COUNT_MASK = 0x3FFF
+
+# Big endian numpy types of the data types used in the message structures
+NUMPY_FIELD_TYPES = {
+  "float": ">f4",
+  "int": ">u4",
+}
+
+# Header fields of every bulk decoded packet
+BULK_HEADER_FIELDS = [("apid", "u2"), ("sequence_count", "u2"), ("epoch_seconds", "u4"), ("epoch_subseconds", "u2")]
 
 def convert_message_to_ccsds(apid: int, sequence_count: int, data_str: str, telecommand: bool = False):
   """
@@ -51,55 +73,336 @@ def convert_message_to_ccsds(apid: int, sequence_count: int, data_str: str, tele
   return packet
 
 
-def parse_ccsds_packet(packet: bytearray):
-  try:
-    # Convert packet from bytes to hexadecimal string
-    packet_hex = packet.hex()
-    
-    # Get the binary array
-    ccsds_binary = bin(int(packet_hex, 16))[2:].zfill(len(packet_hex) * 4)
-    packet_version_number = ccsds_binary[:3]      
-  
-    packet_identification_field = ccsds_binary[3:16]
-    packet_type = packet_identification_field[0]
-    secondary_header_flag = packet_identification_field[1:2]
-    apid = packet_identification_field[2:]
+def peek_ccsds_header(packet) -> tuple:
+  """
+  Reads only the packet identification field (the first 2 bytes) of a packet.
+  Returns (apid, packet_type), packet type is 0 for telemetry and 1 for telecommands.
+  """
+  packet_identification = (packet[0] << 8) | packet[1]
+  return (packet_identification & 0x7FF, (packet_identification >> 12) & 0x1)
 
-    packet_sequence_control = ccsds_binary[16:32]
-    sequence_flags = packet_sequence_control[:2]
-    packet_sequence_count = packet_sequence_control[2:]
+def parse_ccsds_packet(packet: bytes):
+  """
+  Parses a CCSDS packet straight from its bytes.
+  Returns (apid, epoch_seconds, epoch_subseconds, packet_data), where packet_data is
+  a memoryview of the user data field, so the payload is never copied.
+  """
+  try:
+    view = memoryview(packet)
     
-    packet_data_length = ccsds_binary[32:48]
+    # Primary header field
+    packet_identification, packet_sequence_control, packet_data_length = PRIMARY_HEADER.unpack_from(view)
+    packet_type = (packet_identification >> 12) & 0x1
+    apid = packet_identification & 0x7FF
     
     # Telemetry packets have a secondary header
-    if int(packet_type, 2) == 0:
-      # Secondary header field
-      secondary_header = ccsds_binary[48:96]
-      epoch_seconds = secondary_header[:32]
-      epoch_subseconds = secondary_header[32:]
-
+    if packet_type == 0:
+      epoch_seconds, epoch_subseconds = SECONDARY_HEADER.unpack_from(view, PRIMARY_HEADER.size)
+      
       # User data field
-      packet_data = ccsds_binary[96:]
+      packet_data = view[PRIMARY_HEADER.size + SECONDARY_HEADER.size:]
       
     # Telecommand packets do not have a secondary header
     else:
-      epoch_seconds = b"0"
-      epoch_subseconds = b"0"
+      epoch_seconds = 0
+      epoch_subseconds = 0
       
       # User data field
-      packet_data = ccsds_binary[48:]
+      packet_data = view[PRIMARY_HEADER.size:]
     
-    # Convert to usable data types
-    apid = int(apid, 2)
-    epoch_seconds = int(epoch_seconds, 2)
-    epoch_subseconds = int(epoch_subseconds, 2)
-
     return (apid, epoch_seconds, epoch_subseconds, packet_data)
-        
+  
   except Exception as e:
     print(f"Error converting packet to message: {e}. Full packet: {packet}")
     return None
+
+
+def find_ccsds_packet_offsets(buffer) -> np.ndarray:
+  """
+  Finds the start of every packet in a buffer of concatenated packets from the packet data length fields.
+  A packet cut off at the end of the buffer is ignored.
+  """
+  view = memoryview(buffer)
+  offsets = []
+  offset = 0
+  while offset + PRIMARY_HEADER.size <= len(view):
+    packet_length = PRIMARY_HEADER.size + (view[offset + 4] << 8 | view[offset + 5]) + 1
+    if offset + packet_length > len(view):
+      break
+    offsets.append(offset)
+    offset += packet_length
+  
+  return np.array(offsets, dtype=np.int64)
+
+def parse_ccsds_packets(packets, structures: dict) -> dict:
+  """
+  Decodes a large number of CCSDS packets at once, e.g. when post-processing a flight or replaying logs.
+  packets is either a buffer of concatenated packets or a list of packets.
+  structures maps APIDs to message structures from config.py, e.g. {100: TELEMETRY_MESSAGE_STRUCTURE["pfc"]}.
+  Returns a numpy structured array for each APID with the header fields and, if the APID has a structure,
+  the user data fields. Packets too short for their structure are left out.
+  """
+  # Get the packet positions in a single byte array
+  if isinstance(packets, (list, tuple)):
+    lengths = np.fromiter((len(packet) for packet in packets), dtype=np.int64, count=len(packets))
+    buffer = np.frombuffer(b"".join(packets), dtype=np.uint8)
+    offsets = np.zeros(len(packets), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+  else:
+    buffer = np.frombuffer(packets, dtype=np.uint8)
+    offsets = find_ccsds_packet_offsets(packets)
+    lengths = None
+
+  def gather(starts, dtype):
+    # Copy the bytes of every row into one array and reinterpret them with a big endian dtype
+    dtype = np.dtype(dtype)
+    if len(starts) == 0:
+      return np.empty(0, dtype=dtype)
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, dtype.itemsize)
+    return windows[starts].view(dtype)[:, 0]
+
+  if lengths is not None:
+    valid = lengths >= PRIMARY_HEADER.size
+    offsets = offsets[valid]
+    lengths = lengths[valid]
+
+  # Primary header
+  primary_header = gather(offsets, [("packet_identification", ">u2"), ("packet_sequence_control", ">u2"), ("packet_data_length", ">u2")])
+  if lengths is None:
+    lengths = primary_header["packet_data_length"].astype(np.int64) + PRIMARY_HEADER.size + 1
+  packet_types = (primary_header["packet_identification"] >> 12) & 0x1
+  apids = primary_header["packet_identification"] & 0x7FF
+  sequence_counts = primary_header["packet_sequence_control"] & 0x3FFF
   
+  # Secondary header, only telemetry packets have one
+  telemetry = (packet_types == 0) & (lengths >= PRIMARY_HEADER.size + SECONDARY_HEADER.size)
+  epoch_seconds = np.zeros(len(offsets), dtype=np.uint32)
+  epoch_subseconds = np.zeros(len(offsets), dtype=np.uint16)
+  secondary_header = gather(offsets[telemetry] + PRIMARY_HEADER.size, [("epoch_seconds", ">u4"), ("epoch_subseconds", ">u2")])
+  epoch_seconds[telemetry] = secondary_header["epoch_seconds"]
+  epoch_subseconds[telemetry] = secondary_header["epoch_subseconds"]
+
+  decoded = {}
+  for apid in np.unique(apids):
+    rows = apids == apid
+    fields = []
+    
+    # User data field
+    structure = structures.get(int(apid))
+    if structure is not None:
+      fields = [(name, NUMPY_FIELD_TYPES[data_type]) for data_type, name in structure]
+      data_start = PRIMARY_HEADER.size + SECONDARY_HEADER.size
+      rows &= telemetry & (lengths >= data_start + np.dtype(fields).itemsize)
+      packet_data = gather(offsets[rows] + data_start, fields)
+
+    packets_of_apid = np.empty(np.count_nonzero(rows), dtype=BULK_HEADER_FIELDS + fields)
+    packets_of_apid["apid"] = apid
+    packets_of_apid["sequence_count"] = sequence_counts[rows]
+    packets_of_apid["epoch_seconds"] = epoch_seconds[rows]
+    packets_of_apid["epoch_subseconds"] = epoch_subseconds[rows]
+    for name, data_type in fields:
+      packets_of_apid[name] = packet_data[name]
+    
+    decoded[int(apid)] = packets_of_apid
+  
+  return decoded
+
+class PacketBuilder:
+  """
+  Builds CCSDS packets from typed values, or from a record returned by the telemetry decoders.
+  Headers and user data are packed into one reusable buffer, and the builder keeps the sequence count of every APID.
+  Floats are encoded as 32-bit floats and integers as 32-bit unsigned integers, like the decoders read them, all in big endian byte order.
+  The packets have the same bytes as the ones built by convert_message_to_ccsds.
+  """
+  def __init__(self, max_data_length: int = 1024) -> None:
+    self.buffer = bytearray(PRIMARY_HEADER.size + SECONDARY_HEADER.size + PACKET_ID.size + max_data_length)
+    self.lock = Lock()
+    
+    # Next sequence count of every APID
+    self.sequence_counts = {}
+    
+    # User data structs for every combination of value types already built
+    self.data_structs = {}
+  
+  def next_sequence_count(self, apid: int) -> int:
+    """
+    Returns the sequence count for the next packet of an APID. The count wraps around after 16383.
+    """
+    sequence_count = self.sequence_counts.get(apid, 0)
+    self.sequence_counts[apid] = (sequence_count + 1) & SEQUENCE_COUNT_MASK
+    return sequence_count
+  
+  def build_telemetry(self, apid: int, values) -> bytes:
+    """
+    Builds a telemetry packet with a secondary header holding the current time.
+    """
+    return self.__build(apid, values, False)
+  
+  def build_telecommand(self, apid: int, packet_id: int, values=(), packet_id_struct: Struct = PACKET_ID) -> bytes:
+    """
+    Builds a telecommand packet. Telecommands have no secondary header and start with the packet id,
+    which is packed with packet_id_struct (little endian by default, like convert_message_to_ccsds).
+    """
+    return self.__build(apid, values, True, packet_id, packet_id_struct)
+  
+  def build_command(self, apid: int, values) -> bytes:
+    """
+    Builds a telecommand packet from a record that already holds the packet id, like the records of the XTCE commands.
+    """
+    return self.__build(apid, values, True)
+  
+  def __get_data_struct(self, values) -> Struct:
+    # Records from the telemetry decoders and the XTCE schema already have a compiled struct
+    data_struct = getattr(values, "_struct", None)
+    if data_struct is not None:
+      return data_struct
+    
+    value_types = tuple(map(type, values))
+    data_struct = self.data_structs.get(value_types)
+    if data_struct is None:
+      data_format = ">"
+      for value in values:
+        if isinstance(value, float):
+          data_format += "f"
+        elif isinstance(value, int) and not isinstance(value, bool):
+          data_format += "I"
+        else:
+          raise ValueError(f"Invalid data type: {value}")
+      data_struct = Struct(data_format)
+      self.data_structs[value_types] = data_struct
+    return data_struct
+  
+  def __build(self, apid: int, values, telecommand: bool, packet_id=None, packet_id_struct: Struct = PACKET_ID) -> bytes:
+    data_struct = self.__get_data_struct(values)
+    if not telecommand and data_struct.size == 0:
+      raise ValueError(f"No values given for telemetry packet with APID {apid}")
+    
+    with self.lock:
+      # Only telemetry packets have a secondary header, only telecommands have a packet id
+      if telecommand:
+        offset = PRIMARY_HEADER.size
+        if packet_id is not None:
+          packet_id_struct.pack_into(self.buffer, offset, packet_id & 0xFFFF)
+          offset += packet_id_struct.size
+      else:
+        now = time.time()
+        epoch_seconds = int(now)
+        SECONDARY_HEADER.pack_into(self.buffer, PRIMARY_HEADER.size, epoch_seconds, int((now - epoch_seconds) * 65536))
+        offset = PRIMARY_HEADER.size + SECONDARY_HEADER.size
+      
+      try:
+        data_struct.pack_into(self.buffer, offset, *values)
+      except error as e:
+        raise ValueError(f"Invalid values for packet with APID {apid}, integers must be from 0 to {0xFFFFFFFF}: {e}")
+      packet_length = offset + data_struct.size
+      # The packet data field is at least 1 octet, a command without a packet id and arguments gets a zero octet
+      if packet_length == PRIMARY_HEADER.size:
+        self.buffer[packet_length] = 0
+        packet_length += 1
+      
+      # Packet version number (3 bits) is 0
+      # Packet identification: packet type (1 bit), secondary header flag (1 bit), APID (11 bits)
+      # The packet type is always 0, also for telecommands, like in every packet the ground station has sent
+      packet_identification = ((not telecommand) << 11) | (apid & 0x7FF)
+      # Packet sequence control: sequence flags (2 bits, always 11 as every packet is standalone), sequence count (14 bits)
+      packet_sequence_control = 0xC000 | self.next_sequence_count(apid)
+      # Packet data length is one fewer than the number of octets after the primary header, without the secondary header
+      # like the packets the ground station has always sent
+      data_length = packet_length - PRIMARY_HEADER.size - 1 if telecommand else packet_length - PRIMARY_HEADER.size - SECONDARY_HEADER.size - 1
+      PRIMARY_HEADER.pack_into(self.buffer, 0, packet_identification, packet_sequence_control, data_length)
+      
+      return bytes(memoryview(self.buffer)[:packet_length])
+
+class CCSDSFramer:
+  """
+  Splits a byte stream (e.g. a serial link) into CCSDS packets using the packet data length field of the primary headers.
+  Data is read straight into a fixed buffer, and bytes that do not start a valid primary header are discarded until the stream is in sync again.
+  """
+  def __init__(self, buffer_size: int = 8192, max_packet_length: int = 1024) -> None:
+    if buffer_size < 2 * max_packet_length:
+      raise ValueError("Framer buffer must fit at least two packets of the maximum length")
+    
+    self.buffer = bytearray(buffer_size)
+    self.max_packet_length = max_packet_length
+    
+    # Unprocessed bytes are buffer[start:end]
+    self.start = 0
+    self.end = 0
+    self.in_sync = True
+    
+    # Statistics
+    self.framed_packets = 0
+    self.resyncs = 0
+    self.discarded_bytes = 0
+  
+  def get_write_buffer(self, size: int) -> memoryview:
+    """
+    Returns free space in the buffer (at most size bytes) to read new data into, e.g. with readinto.
+    Call commit with the number of bytes actually written.
+    """
+    # Move the unprocessed bytes to the front, if there is not enough space after them
+    if len(self.buffer) - self.end < size and self.start > 0:
+      unprocessed = self.end - self.start
+      self.buffer[:unprocessed] = self.buffer[self.start:self.end]
+      self.start = 0
+      self.end = unprocessed
+    
+    return memoryview(self.buffer)[self.end:min(len(self.buffer), self.end + size)]
+  
+  def commit(self, size: int) -> None:
+    self.end += size
+  
+  def feed(self, data) -> list:
+    """
+    Copies already read data into the buffer and returns all packets completed by it.
+    """
+    packets = []
+    data = memoryview(data)
+    while len(data) > 0:
+      write_buffer = self.get_write_buffer(len(data))
+      write_buffer[:] = data[:len(write_buffer)]
+      self.commit(len(write_buffer))
+      data = data[len(write_buffer):]
+      packets += self.get_packets()
+    return packets
+  
+  def get_packets(self) -> list:
+    """
+    Returns all complete packets in the buffer. Each packet is copied out of the buffer once.
+    """
+    packets = []
+    view = memoryview(self.buffer)
+    
+    while self.end - self.start >= PRIMARY_HEADER.size:
+      packet_identification, packet_sequence_control, packet_data_length = PRIMARY_HEADER.unpack_from(self.buffer, self.start)
+      packet_length = PRIMARY_HEADER.size + packet_data_length + 1
+      
+      # A valid header has packet version number 0, standalone sequence flags (11) and a length that fits the buffer
+      if (packet_identification >> 13) != 0 or (packet_sequence_control >> 14) != 0b11 or packet_length > self.max_packet_length:
+        if self.in_sync:
+          self.resyncs += 1
+          self.in_sync = False
+        self.start += 1
+        self.discarded_bytes += 1
+        continue
+      
+      # Wait for the rest of the packet
+      if self.end - self.start < packet_length:
+        break
+      
+      packets.append(bytes(view[self.start:self.start + packet_length]))
+      self.start += packet_length
+      self.in_sync = True
+      self.framed_packets += 1
+    
+    view.release()
+    
+    # Start from the beginning of the buffer, when everything has been processed
+    if self.start == self.end:
+      self.start = 0
+      self.end = 0
+    
+    return packets
 
 def create_primary_header(apid: int, sequence_count: int, data_length: int, secondary_header: bool = True) -> bytearray:
   """
@@ -124,7 +427,7 @@ def create_primary_header(apid: int, sequence_count: int, data_length: int, seco
   # Sequence flags (Always 11, as we are sending a single undivided packet) - 2 bits
   # Packet Sequence Count (Packet index)- 14 bits
   PACKET_SEQUENCE_FLAG = b"11"
-  packet_sequence_count = bin(sequence_count)[2:].zfill(14).encode()
+  packet_sequence_count = bin(sequence_count & SEQUENCE_COUNT_MASK)[2:].zfill(14).encode()
   packet_sequence_control = PACKET_SEQUENCE_FLAG + packet_sequence_count
   
   ## Packet data length - 16 bits total
@@ -162,9 +465,80 @@ def isfloat(value: str) -> bool:
   except ValueError:
     return False
 
-def binary_to_float(binary):
+def binary_to_float(data) -> float:
+  """
+  Converts 4 bytes in big endian byte order to a float.
+  """
+  return FLOAT.unpack(data)[0]
+
+def binary_to_int(data) -> int:
+  """
+  Converts bytes in big endian byte order to an unsigned integer.
+  """
+  return int.from_bytes(data, "big")
+
+def parse_ccsds_packet_bitstring(packet: bytearray):
+  """
+  Reference implementation of parse_ccsds_packet, that decodes the packet through a string of bits.
+  Only kept to check the equivalence of parse_ccsds_packet, do not use it for processing.
+  """
+  try:
+    # Convert packet from bytes to hexadecimal string
+    packet_hex = packet.hex()
+    
+    # Get the binary array
+    ccsds_binary = bin(int(packet_hex, 16))[2:].zfill(len(packet_hex) * 4)
+    packet_version_number = ccsds_binary[:3]      
+  
+    packet_identification_field = ccsds_binary[3:16]
+    packet_type = packet_identification_field[0]
+    secondary_header_flag = packet_identification_field[1:2]
+    apid = packet_identification_field[2:]
+
+    packet_sequence_control = ccsds_binary[16:32]
+    sequence_flags = packet_sequence_control[:2]
+    packet_sequence_count = packet_sequence_control[2:]
+    
+    packet_data_length = ccsds_binary[32:48]
+    
+    # Telemetry packets have a secondary header
+    if int(packet_type, 2) == 0:
+      # Secondary header field
+      secondary_header = ccsds_binary[48:96]
+      epoch_seconds = secondary_header[:32]
+      epoch_subseconds = secondary_header[32:]
+
+      # User data field
+      packet_data = ccsds_binary[96:]
+      
+    # Telecommand packets do not have a secondary header
+    else:
+      epoch_seconds = b"0"
+      epoch_subseconds = b"0"
+      
+      # User data field
+      packet_data = ccsds_binary[48:]
+    
+    # Convert to usable data types
+    apid = int(apid, 2)
+    epoch_seconds = int(epoch_seconds, 2)
+    epoch_subseconds = int(epoch_subseconds, 2)
+
+    return (apid, epoch_seconds, epoch_subseconds, packet_data)
+        
+  except Exception as e:
+    print(f"Error converting packet to message: {e}. Full packet: {packet}")
+    return None
+
+def bitstring_to_float(binary):
+  """
+  Reference implementation of binary_to_float for strings of bits.
+  """
   return unpack('!f',pack('!I', int(binary, 2)))[0]
 
-def binary_to_int(binary):
+def bitstring_to_int(binary):
+  """
+  Reference implementation of binary_to_int for strings of bits.
+  """
   return int(binary, 2)
   
\ No newline at end of file
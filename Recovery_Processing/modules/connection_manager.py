@@ -1,12 +1,14 @@
 import socket
-import queue
 import time
 import serial
 import serial.tools.list_ports
 import os
 
 from config import *
+from modules.bounded_queue import create_queue
+from modules.ccsds import CCSDSFramer
 from modules.logging import Logger
+from modules.scheduler import TelecommandScheduler
 
 class ConnectionManager:
   def __init__(self, logger: Logger) -> None:    
@@ -14,11 +16,8 @@ class ConnectionManager:
     self.logger = logger
     
     # Queues
-    self.sendable_to_transceiver_messages = queue.Queue()
-    self.sendable_to_yamcs_messages = queue.Queue()
-    self.received_messages = queue.Queue()
-    
-    self.sending_to_transceiver = False
+    self.sendable_to_yamcs_messages = create_queue("sendable_to_yamcs_messages", QUEUE_SETTINGS)
+    self.received_messages = create_queue("received_messages", QUEUE_SETTINGS)
     
     # UDP sockets (TM - Telemetry, TC - Telecommand)
     # YAMCS sockets
@@ -41,28 +40,43 @@ class ConnectionManager:
       os.system('pause')
       os._exit(1)
     
+    # Splits the serial byte stream into packets
+    self.serial_framer = CCSDSFramer(SERIAL_BUFFER_SIZE, SERIAL_MAX_PACKET_LENGTH)
+    
     self.connected_to_transceiver = False
     self.open_ports = [p for p in list(serial.tools.list_ports.comports())]
     try:
       self.basestation_port = [port.device for port in self.open_ports if SERIAL_PORT in port][0]
     except IndexError:
       self.basestation_port = None
+    
+    # Telecommands for both vehicles wait in the serial outbox until the start of the communication cycle
+    self.scheduler = TelecommandScheduler(CYCLE_TIME, send_offset=0, capacity=QUEUE_SETTINGS["telecommand_outboxes"][0])
+    self.scheduler.add_outbox("serial", self.__send_telecommand, self.connected_to_transceiver)
+  
+  def schedule_telecommand(self, packet) -> None:
+    """
+    Puts a (wait_for_cycle, transceiver, data) packet in the serial outbox, the base station transceiver sends it to the vehicle.
+    """
+    self.scheduler.schedule("serial", packet[2], packet[0])
+  
+  def send_to_transceiver(self) -> None:
+    # Waits until the serial commands are due, or at most 1 second so the thread can be stopped
+    self.scheduler.run_outbox("serial")
+  
+  def __send_telecommand(self, data: bytes) -> None:
+    self.logger.log_telecommand_data(data, "serial")
+    self.ser.write(data)
       
   def handle_serial_communication(self):    
-    if not self.sendable_to_transceiver_messages.empty():
-      if (int(time.mktime(time.localtime())) % CYCLE_TIME == 0):
-        packet = self.sendable_to_transceiver_messages.get(timeout=1)
-        if packet is not None:
-          self.ser.write(packet[2].encode())
-        self.sendable_to_transceiver_messages.task_done()
-    
     # Read data from the serial port
     # print(f"Bytes in waiting: {self.ser.in_waiting}")
+    # A read can hold any part of a packet or several packets, so the data is put through the framer
     if self.ser.in_waiting > 0:
-      read_data = self.ser.read(self.ser.in_waiting)
-      # If the message is not a heartbeat, put it in the queue
-      # print(f"Received from transceiver: {read_data}")
-      self.received_messages.put((False, "yamcs", read_data))
+      read_length = self.ser.readinto(self.serial_framer.get_write_buffer(self.ser.in_waiting))
+      self.serial_framer.commit(read_length)
+      for packet in self.serial_framer.get_packets():
+        self.received_messages.put((False, "yamcs", packet))
     
   def check_serial_connection(self) -> None:
     open_ports = [p.device for p in list(serial.tools.list_ports.comports())]
@@ -79,6 +93,7 @@ class ConnectionManager:
       self.connected_to_transceiver = True
     else:
       self.connected_to_transceiver = False
+    self.scheduler.set_connected("serial", self.connected_to_transceiver)
     time.sleep(0.1)
     
   def send_to_yamcs(self) -> None:
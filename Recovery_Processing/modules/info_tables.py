@@ -35,16 +35,38 @@ class InfoTables:
     print("\033[K")  # Clear the line
   
     # Connection Manager
-    headers = ["Connected to transceiver", "Next Communication Cycle Start (s)", "Command To Send"]
+    headers = ["Connected to transceiver", "Next Communication Cycle Start (s)", "Commands To Send", "Next Command ETA (s)", "Received Packets", "Resyncs", "Discarded Bytes"]
     
     connected = self.connection_manager.connected_to_transceiver
     cycle_start = round(CYCLE_TIME - (time.time() % CYCLE_TIME), 1)
-    command_to_send = self.connection_manager.sending_to_transceiver
+    command_etas = self.connection_manager.scheduler.get_command_etas()
+    if not command_etas:
+      next_command_eta = "N/A"
+    elif command_etas[0][3] is None:
+      next_command_eta = "Parked"
+    else:
+      next_command_eta = round(command_etas[0][3], 1)
+    framer = self.connection_manager.serial_framer
     
-    table = [[connected, cycle_start, command_to_send]]
+    table = [[connected, cycle_start, len(command_etas), next_command_eta, framer.framed_packets, framer.resyncs, framer.discarded_bytes]]
     print("Connections")
     print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
     print("\033[K")  # Clear the line
+    
+    # Queues
+    headers = ["Queue", "Depth", "Capacity", "Policy", "High Water Mark", "Dropped"]
+    
+    table = []
+    for pipeline_queue in [self.connection_manager.received_messages, self.connection_manager.sendable_to_yamcs_messages]:
+      table.append([pipeline_queue.name, pipeline_queue.qsize(), pipeline_queue.capacity, pipeline_queue.policy, pipeline_queue.high_water_mark, pipeline_queue.dropped])
+    scheduler = self.connection_manager.scheduler
+    for outbox in scheduler.outboxes.values():
+      table.append([f"{outbox.name}_outbox", len(outbox.commands), scheduler.capacity, "never_drop", outbox.high_water_mark, 0])
+    logger = self.connection_manager.logger
+    table.append(["log_entries", len(logger.entries), 0, "never_drop", logger.high_water_mark, 0])
+    print("Queues")
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center", disable_numparse=True))
+    print("\033[K")  # Clear the line
         
     # Packet Processor
     headers = ["Vehicle", "Time", "Latitude", "Longitude", "GPS Alt (m)", "Baro Alt (m)", "Satellites", "Info/Error", "RSSI (dBm)", "SNR", "Since last packet (s)"]
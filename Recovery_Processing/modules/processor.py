@@ -4,6 +4,7 @@ from config import *
 from modules.calculations import *
 from modules.ccsds import *
 from modules.connection_manager import ConnectionManager 
+from modules.decoders import compile_telemetry_decoders
 
 class PacketProcessor:
   def __init__(self, 
@@ -11,9 +12,12 @@ class PacketProcessor:
     # Objects
     self.connection_manager = connection_manager
     
+    # Telemetry decoders, compiled once from the message structures
+    self.telemetry_decoders = compile_telemetry_decoders(TELEMETRY_MESSAGE_STRUCTURE)
+    
     # Telemetry
-    self.pfc_telemetry = {value: 0.0 for type, value in TELEMETRY_MESSAGE_STRUCTURE["pfc"]}
-    self.bfc_telemetry = {value: 0.0 for type, value in TELEMETRY_MESSAGE_STRUCTURE["bfc"]}
+    self.pfc_telemetry = self.telemetry_decoders["pfc"].empty()
+    self.bfc_telemetry = self.telemetry_decoders["bfc"].empty()
     
     # Timing
     self.last_pfc_telemetry_epoch_seconds = 0
@@ -27,11 +31,29 @@ class PacketProcessor:
     # Calculations
     self.pfc_calculations = dict.fromkeys(CALCULATION_MESSAGE_STRUCTURE["pfc"], 0.0)
     self.bfc_calculations = dict.fromkeys(CALCULATION_MESSAGE_STRUCTURE["bfc"], 0.0)
-    self.pfc_calculations_index = 0
-    self.bfc_calculations_index = 0
     
-    # Queues
-    self.processed_packets = queue.Queue()
+    # Packet builder, keeps the sequence counts of all packets created by the ground station
+    self.packet_builder = PacketBuilder()
+    
+    # Route table, processed packets are delivered straight to the queue or outbox of their destination
+    self.create_routes()
+  
+  def create_routes(self) -> None:
+    """
+    Creates the route table from the destination of a packet to the function that delivers it.
+    Called again by the async runtime after it replaces the queues.
+    """
+    self.routes = {
+      "yamcs": self.connection_manager.sendable_to_yamcs_messages.put,
+      "primary": self.connection_manager.schedule_telecommand,
+      "secondary": self.connection_manager.schedule_telecommand,
+    }
+  
+  def route_packet(self, packet) -> None:
+    """
+    Delivers a (wait_for_cycle, destination, data) packet to its destination.
+    """
+    self.routes[packet[1]](packet)
   
   def process_packet(self) -> None:
     try:
@@ -47,14 +69,14 @@ class PacketProcessor:
       apid, epoch_seconds, epoch_subseconds, packet_data = parsed
       # If the packet is a telecommand
       if apid in TELECOMMAND_APID.values():
-        # Get packet id, which is the first 16 bits of the packet data
-        packet_id = int(packet_data[:16], 2)
-        packet_data = packet_data[16:]
+        # Get packet id, which is the first 2 bytes of the packet data
+        packet_id = binary_to_int(packet_data[:2])
+        packet_data = packet_data[2:]
         
         if apid == TELECOMMAND_APID["pfc"]:
-          self.processed_packets.put((True, "primary", packet[2]))
+          self.route_packet((True, "primary", packet[2]))
         elif apid == TELECOMMAND_APID["bfc"]:
-          self.processed_packets.put((True, "secondary", packet[2]))
+          self.route_packet((True, "secondary", packet[2]))
 
           self.connection_manager.received_messages.task_done()
           return
@@ -67,7 +89,7 @@ class PacketProcessor:
         self.bfc_packet_received_time = time.time()
         self.__update_bfc_telemetry(packet_data, epoch_seconds, epoch_subseconds)
         
-      self.processed_packets.put((False, "yamcs", packet[2]))
+      self.route_packet((False, "yamcs", packet[2]))
             
       # Complete the task
       self.connection_manager.received_messages.task_done()
@@ -76,31 +98,12 @@ class PacketProcessor:
       self.connection_manager.received_messages.task_done()
       print(f"An error occurred while processing packet: {e}")
   
-  def __convert_binary_to_telemetry(self, packet_data, telemetry_type: str):
-    """
-    Converts binary packet data to telemetry data.
-    """
-    new_telemetry = {}
-    start = 0
-    for data_type, data_value in TELEMETRY_MESSAGE_STRUCTURE[telemetry_type]:
-        if data_type == "float":
-            end = start + 32
-            new_telemetry[data_value] = binary_to_float(packet_data[start:end])
-            start = end
-        elif data_type == "int":
-            end = start + 32
-            new_telemetry[data_value] = binary_to_int(packet_data[start:end])
-            start = end
-        else:
-            raise Exception(f"Invalid data type: {data_type} and {data_value}")
-    return new_telemetry
-  
   def __update_pfc_telemetry(self, packet_data, epoch_seconds, epoch_subseconds) -> None:
     """
     Updates the PFC telemetry data.
     """
     try:
-        new_telemetry = self.__convert_binary_to_telemetry(packet_data, "pfc")
+        new_telemetry = self.telemetry_decoders["pfc"].decode(packet_data)
         
         # PFC essential telemetry
         old_pfc_telemetry_epoch_seconds = self.last_pfc_telemetry_epoch_seconds
@@ -117,14 +120,8 @@ class PacketProcessor:
         
         # Create a ccsds packet from the calculations
         apid = [key for key, value in APID_TO_TYPE.items() if value == "pfc_calculations"][0]
-        message = ",".join([str(x) for x in self.pfc_calculations.values()]) 
-        ccsds = convert_message_to_ccsds(apid, self.pfc_calculations_index, message)
-        
-        if ccsds is None:
-            raise Exception("Invalid ccsds packet created")
-        
-        self.processed_packets.put((False, "yamcs", ccsds))
-        self.pfc_calculations_index += 1
+        ccsds = self.packet_builder.build_telemetry(apid, tuple(self.pfc_calculations.values()))
+        self.route_packet((False, "yamcs", ccsds))
         self.pfc_telemetry = new_telemetry
 
     except Exception as e:
@@ -132,7 +129,7 @@ class PacketProcessor:
       
   def __update_bfc_telemetry(self, packet_data, epoch_seconds, epoch_subseconds) -> None:
     try:
-      new_telemetry = self.__convert_binary_to_telemetry(packet_data, "bfc")
+      new_telemetry = self.telemetry_decoders["bfc"].decode(packet_data)
         
       # BFC essential telemetry
       old_bfc_telemetry_epoch_seconds = self.last_bfc_telemetry_epoch_seconds
@@ -149,14 +146,8 @@ class PacketProcessor:
         
       # Create a ccsds packet from the calculations
       apid = [key for key, value in APID_TO_TYPE.items() if value == "bfc_calculations"][0]
-      message = ",".join([str(x) for x in self.bfc_calculations.values()]) 
-      ccsds = convert_message_to_ccsds(apid, self.bfc_calculations_index, message)
-      
-      if ccsds is None:
-        raise Exception("Invalid ccsds packet created")
-      
-      self.processed_packets.put((False, "yamcs", ccsds))
-      self.bfc_calculations_index += 1
+      ccsds = self.packet_builder.build_telemetry(apid, tuple(self.bfc_calculations.values()))
+      self.route_packet((False, "yamcs", ccsds))
       self.bfc_telemetry = new_telemetry
         
     except Exception as e:
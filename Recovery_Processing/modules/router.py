@@ -1,5 +1,4 @@
 from time import sleep
-import queue
 
 from modules.connection_manager import ConnectionManager
 from modules.map import Map
@@ -22,16 +21,4 @@ class Router:
     add_coordinates(self.map.payload_coordinates, self.processor.pfc_telemetry["gps_latitude"], self.processor.pfc_telemetry["gps_longitude"])
 
     sleep(0.1)
-  
-  def send_processed_data(self):
-    try:
-      packet = self.processor.processed_packets.get(timeout=1)
-      if packet[1] == "primary" or packet[1] == "secondary":
-        self.connection.sendable_to_transceiver_messages.put(packet)
-      elif packet[1] == "yamcs":
-        self.connection.sendable_to_yamcs_messages.put(packet)
-      self.processor.processed_packets.task_done()
-    except queue.Empty:
-      pass
-    except Exception as e:
-      print(f"An error occurred while sending processed data: {e}")    
\ No newline at end of file
+    
\ No newline at end of file
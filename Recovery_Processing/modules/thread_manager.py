@@ -38,6 +38,16 @@ class ThreadManager:
     thread.start()
     self.active_threads.append(thread)
     
+  def start_send_to_transceiver_thread(self):
+    def send_to_transceiver_thread():
+      while not self.stop_event.is_set():
+        self.connection_manager.send_to_transceiver()
+      
+    thread = Thread(target=send_to_transceiver_thread, name="Serial Sender")
+    thread.daemon = True
+    thread.start()
+    self.active_threads.append(thread)
+    
   def start_receive_from_yamcs_thread(self):
     def receive_from_yamcs_thread():
       while not self.stop_event.is_set():
@@ -68,16 +78,6 @@ class ThreadManager:
     thread.start()
     self.active_threads.append(thread)
     
-  def start_send_processed_data_thread(self):
-    def send_processed_data_thread():
-      while not self.stop_event.is_set():
-        self.router.send_processed_data()
-    
-    thread = Thread(target=send_processed_data_thread, name="Processed Data Sender")
-    thread.daemon = True
-    thread.start()
-    self.active_threads.append(thread)
-    
   def start_map_server_thread(self):
     def map_server_thread():
       while not self.stop_event.is_set():